@@ -1,9 +1,15 @@
-﻿import requests
+﻿from dataclasses import replace
+
 import streamlit as st
 
-from config import default_for_backend
+from config import default_for_backend, load_from_env
 from llm import create_client
-from explain.pipeline import ExplainerPipeline
+from llm.health import get_health_monitor
+from llm.router import parse_endpoints
+from explain.budget import LOADED_WINDOWS, window_key
+from explain.followup import build_followup_digest, build_followup_messages, prompt_tokens_est
+from explain.pipeline import build_pipeline
+from utils.metrics import start_metrics_server
 
 FOLLOWUP_SYSTEM_PROMPT = """
 You are a serious technical assistant.
@@ -175,21 +181,25 @@ def confidence_badge(conf: str) -> str:
     return f"<span class='{css}'>{conf.upper() or 'LOW'}</span>"
 
 
-def check_backend_ready(backend: str, base_url: str, model: str, timeout_seconds: int):
+def check_backend_ready(backend: str, base_url: str, model: str, timeout_seconds: int, cfg=None):
     if not base_url.strip() or not model.strip():
         return False, "Base URL and Model are required."
 
+    # Reads the process-wide background poller instead of requesting /api/tags on every rerun.
+    # Only a URL seen for the first time waits (briefly) for its first poll.
+    cfg = cfg or default_for_backend(backend)
     timeout = min(max(timeout_seconds, 5), 30)
-    try:
-        resp = requests.get(f"{base_url.rstrip('/')}/api/tags", timeout=timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        models = [m.get("name", "") for m in data.get("models", []) if isinstance(m, dict)]
-        if model not in models:
-            return False, f"Ollama is running, but model '{model}' is not found. Run: ollama pull {model}"
-        return True, f"Connected to Ollama. Model ready: {model}"
-    except Exception as exc:
-        return False, f"Cannot connect to Ollama at {base_url}. {exc}"
+    checks = []
+    for entry_backend, entry_url, entry_model in parse_endpoints(base_url, backend, model):
+        monitor = get_health_monitor(
+            entry_backend, entry_url, cfg.health_interval_seconds, cfg.health_ttl_seconds, timeout
+        )
+        checks.append(monitor.check(entry_model, wait_seconds=2.0))
+    if len(checks) == 1:
+        return checks[0]
+    ready = sum(1 for ok, _ in checks if ok)
+    problems = " ".join(status for ok, status in checks if not ok)
+    return ready > 0, f"{ready}/{len(checks)} endpoints ready. {problems}".strip()
 
 
 def render_bullet_list(items, empty_msg="- None listed."):
@@ -222,8 +232,8 @@ def render_result(result: dict):
         unsafe_allow_html=True,
     )
 
-    tab_answer, tab_blackbox, tab_evidence, tab_context, tab_risks = st.tabs(
-        ["Answer", "Black Box", "Evidence", "Context", "Risks & Follow-ups"]
+    tab_answer, tab_blackbox, tab_evidence, tab_context, tab_risks, tab_perf = st.tabs(
+        ["Answer", "Black Box", "Evidence", "Context", "Risks & Follow-ups", "Performance"]
     )
 
     with tab_answer:
@@ -277,8 +287,67 @@ def render_result(result: dict):
             st.markdown("#### Helpful What-If Questions")
             render_bullet_list(result.get("followups", []), "- None.")
 
-
-def render_chat(backend: str, base_url: str, model: str, timeout_seconds: int, temperature: float, max_tokens: int):
+    with tab_perf:
+        render_performance(result.get("trace_log", {}))
+
+
+def render_performance(trace: dict):
+    # Where the time went: pipeline stages (wall clock) and each model call (server-reported).
+    timings = trace.get("timings") or {}
+    calls = trace.get("llm_calls") or []
+    if not timings and not calls:
+        st.info("No timing data was recorded for this run.")
+        return
+
+    completion = sum(c.get("completion_tokens", 0) for c in calls)
+    eval_seconds = sum(c.get("eval_seconds", 0.0) for c in calls)
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Total time", f"{timings.get('total_seconds', 0.0):.2f} s")
+    c2.metric("Model calls", len(calls))
+    c3.metric("Generated tokens", completion)
+    c4.metric("Generation speed", f"{completion / eval_seconds:.1f} tok/s" if eval_seconds else "n/a")
+
+    st.markdown("#### Pipeline stages")
+    st.dataframe(timings.get("stages", []), use_container_width=True, hide_index=True)
+    st.markdown("#### Model calls")
+    if calls:
+        st.dataframe(calls, use_container_width=True, hide_index=True)
+    else:
+        st.caption("No model call was recorded for this run.")
+
+
+def render_partial(placeholder, partial: dict):
+    # Show the answer and verified evidence while the model is still generating.
+    with placeholder.container(border=True):
+        st.markdown("#### Partial result (still generating)")
+        if partial["answer"]:
+            st.write(partial["answer"])
+        for claim in partial["claims"]:
+            mark = "Found in your context" if claim.get("verified") else "No matching quote found"
+            st.markdown(f"- **{claim.get('claim', '') or 'Claim'}** — _{mark}_")
+            st.markdown(f"  > {claim.get('quote', '')}")
+
+
+def prompt_savings_caption(sent_tokens: int, full_tokens: int, evaluated_tokens=None) -> str:
+    saved = max(0, full_tokens - sent_tokens)
+    caption = f"Prompt ~{sent_tokens} tokens vs ~{full_tokens} with the full context"
+    caption += f" ({saved * 100 // max(full_tokens, 1)}% saved)." if saved else "."
+    if evaluated_tokens is not None:
+        # Ollama counts only the prompt tokens it had to evaluate, so cached prefix reuse shows up here.
+        caption += f" Backend evaluated {evaluated_tokens} prompt tokens."
+    return caption
+
+
+def render_chat(
+    backend: str,
+    base_url: str,
+    model: str,
+    timeout_seconds: int,
+    temperature: float,
+    max_tokens: int,
+    compact_default: bool = True,
+    window_chars: int = 300,
+):
     st.markdown("### Talk to the Model")
     st.markdown("<p class='subtle'>Follow-up conversation using the same local backend and model.</p>", unsafe_allow_html=True)
 
@@ -287,11 +356,20 @@ def render_chat(backend: str, base_url: str, model: str, timeout_seconds: int, t
         if st.button("Clear chat", use_container_width=True):
             st.session_state.followup_chat_history = []
             st.rerun()
+    with c2:
+        compact = st.toggle(
+            "Compact follow-up prompts",
+            value=compact_default,
+            help="Send the answer, verified evidence and related passages instead of the full context, "
+            "plus earlier chat turns. Much faster on long contexts.",
+        )
 
     for msg in st.session_state.followup_chat_history:
         role = "user" if msg.get("role") == "user" else "assistant"
         with st.chat_message(role):
             st.write(msg.get("content", ""))
+            if msg.get("prompt_stats"):
+                st.caption(msg["prompt_stats"])
 
     chat_input = st.chat_input("Ask a follow-up...")
 
@@ -301,6 +379,8 @@ def render_chat(backend: str, base_url: str, model: str, timeout_seconds: int, t
             return
 
         st.session_state.followup_chat_history.append({"role": "user", "content": user_text})
+        with st.chat_message("user"):
+            st.write(user_text)
 
         client = create_client(
             backend=backend,
@@ -309,7 +389,7 @@ def render_chat(backend: str, base_url: str, model: str, timeout_seconds: int, t
             timeout_seconds=int(timeout_seconds),
         )
 
-        chat_messages = [
+        full_messages = [
             {"role": "system", "content": FOLLOWUP_SYSTEM_PROMPT},
             {
                 "role": "user",
@@ -325,14 +405,76 @@ def render_chat(backend: str, base_url: str, model: str, timeout_seconds: int, t
                 ),
             },
         ]
+        chat_messages = full_messages
+        if compact:
+            digest = build_followup_digest(
+                st.session_state.last_result,
+                st.session_state.last_question,
+                st.session_state.last_context,
+                window_chars=window_chars,
+            )
+            chat_messages = build_followup_messages(
+                FOLLOWUP_SYSTEM_PROMPT,
+                digest,
+                st.session_state.followup_chat_history[:-1],
+                user_text,
+                st.session_state.last_context,
+            )
+        sent_tokens, full_tokens = prompt_tokens_est(chat_messages), prompt_tokens_est(full_messages)
+
+        # Tokens are written into the bubble as they arrive. Clicking Stop reruns the script, which
+        # interrupts write_stream; the finally block keeps the partial reply and closing the stream
+        # stops generation on the backend.
+        with st.chat_message("assistant"):
+            stop_slot = st.empty()
+            stop_slot.button("Stop generating", key="stop_followup")
+            parts = []
+            finished = False
+            meta = {}
+            stream = client.stream_text(
+                messages=chat_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                # Reuse the window the explain run loaded instead of falling back to the server default.
+                num_ctx=LOADED_WINDOWS.current(window_key(client)),
+                kind="followup",
+            )
 
-        with st.spinner("Getting follow-up response..."):
-            reply = client.chat(messages=chat_messages, temperature=temperature, max_tokens=max_tokens)
-        st.session_state.followup_chat_history.append({"role": "assistant", "content": reply})
-        st.rerun()
+            def pieces():
+                while True:
+                    try:
+                        piece = next(stream)
+                    except StopIteration as stop:
+                        meta["result"] = stop.value
+                        return
+                    parts.append(piece)
+                    yield piece
+
+            try:
+                st.write_stream(pieces())
+                finished = True
+            except Exception as exc:
+                st.error(f"Follow-up failed: {exc}")
+            finally:
+                stream.close()
+                reply = "".join(parts)
+                if reply and not finished:
+                    reply += " _(stopped)_"
+                result = meta.get("result")
+                stats = prompt_savings_caption(
+                    sent_tokens, full_tokens, result.prompt_eval_count if result is not None else None
+                )
+                if reply:
+                    st.session_state.followup_chat_history.append(
+                        {"role": "assistant", "content": reply, "prompt_stats": stats}
+                    )
+            stop_slot.empty()
+            st.caption(stats)
 
 
 init_state()
+# Prometheus scrape endpoint (BBE_METRICS_PORT); started once per process and reused across reruns.
+start_metrics_server(load_from_env().metrics_port)
 
 with st.sidebar:
     st.markdown("## Backend Settings")
@@ -352,8 +494,21 @@ with st.sidebar:
     )
     timeout_seconds = st.number_input("Timeout (seconds)", min_value=5, max_value=600, value=120, step=5)
     critique_pass = st.toggle("Critique pass (second model call)", value=False)
+    use_cache = st.toggle(
+        "Reuse identical responses",
+        value=defaults.cache_enabled,
+        help="Serve repeated model calls from a local cache. Only applies at creativity 0 (and to JSON repair calls).",
+    )
+    retrieval_top_k = st.number_input(
+        "Passages sent to model (0 = full context)",
+        min_value=0,
+        max_value=50,
+        value=int(defaults.retrieval_top_k),
+        step=1,
+        help="Send only the passages most related to the question. Speeds up long contexts on CPU.",
+    )
 
-    ready, status = check_backend_ready(backend, base_url, model, int(timeout_seconds))
+    ready, status = check_backend_ready(backend, base_url, model, int(timeout_seconds), defaults)
     if ready:
         st.success(status)
     else:
@@ -378,22 +533,39 @@ if run:
         st.error("Backend is not ready. Fix backend settings in the sidebar first.")
     else:
         try:
-            client = create_client(
+            settings = replace(
+                defaults,
                 backend=backend,
                 base_url=base_url,
                 model=model,
                 timeout_seconds=int(timeout_seconds),
+                cache_enabled=bool(use_cache),
+                retrieval_top_k=int(retrieval_top_k),
             )
-            pipeline = ExplainerPipeline(client)
+            pipeline = build_pipeline(settings)
 
+            result = None
+            partial = {"answer": "", "claims": []}
+            live = st.empty()
             with st.spinner("Running local explainer..."):
-                result = pipeline.run(
+                for event in pipeline.run_stream(
                     question=question.strip(),
                     context=context,
                     temperature=float(temperature),
                     max_tokens=int(defaults.max_tokens),
                     critique_pass=bool(critique_pass),
-                )
+                ):
+                    if event["event"] == "result":
+                        result = event["result"]
+                        continue
+                    if event["event"] == "field" and event["name"] == "answer":
+                        partial["answer"] = event["value"]
+                    elif event["event"] == "claim":
+                        partial["claims"].append(event["claim"])
+                    else:
+                        continue
+                    render_partial(live, partial)
+            live.empty()
 
             st.session_state.last_result = result
             st.session_state.last_question = question.strip()
@@ -417,6 +589,8 @@ if st.session_state.last_result is not None:
             timeout_seconds=int(timeout_seconds),
             temperature=float(temperature),
             max_tokens=int(defaults.max_tokens),
+            compact_default=defaults.followup_compact,
+            window_chars=defaults.followup_window_chars,
         )
     else:
-        st.info("Fix backend connection in the sidebar to use follow-up chat.")
+        st.info("Fix backend connection in the sidebar to use follow-up chat.")
@@ -0,0 +1,102 @@
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, TextIO
+
+from config import load_from_env
+from explain.pipeline import build_pipeline
+from utils.logging import build_batch_summary
+from utils.metrics import start_metrics_server
+
+
+def read_jsonl(stream: TextIO, question_field: str, context_field: str) -> Iterator[Dict[str, Any]]:
+    # Yield one pipeline item per non-empty JSONL line, keeping the raw record for pass-through ids.
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON on line {line_no}: {exc}") from exc
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_no} is not a JSON object.")
+        yield {
+            "question": record.get(question_field, ""),
+            "context": record.get(context_field, ""),
+            "record": record,
+        }
+
+
+def parse_args(cfg, argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the explainer pipeline over a JSONL file.")
+    parser.add_argument("input", help="JSONL file with one question/context object per line ('-' for stdin).")
+    parser.add_argument("-o", "--output", default="-", help="Where to write JSONL results ('-' for stdout).")
+    parser.add_argument("--workers", type=int, default=cfg.parallel_slots, help="Concurrent requests (match backend parallel slots).")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--context-field", default="context")
+    parser.add_argument("--id-field", default="id", help="Record field copied into each output line.")
+    parser.add_argument("--critique", action="store_true", default=cfg.critique_pass, help="Run the critique pass.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    cfg = load_from_env()
+    args = parse_args(cfg, argv)
+    # Scrape endpoint for long batch runs; BBE_METRICS_PORT=0 (default) keeps it off.
+    start_metrics_server(cfg.metrics_port)
+    # Keep at least one pooled connection per worker.
+    pipeline = build_pipeline(cfg, pool_size=args.workers)
+
+    src = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8-sig")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    # Items are consumed lazily by run_batch, so keep the raw records by index for the id field.
+    records: Dict[int, Dict[str, Any]] = {}
+
+    def items() -> Iterator[Dict[str, Any]]:
+        for index, item in enumerate(read_jsonl(src, args.question_field, args.context_field)):
+            records[index] = item.pop("record")
+            yield item
+
+    done = 0
+    low_confidence = 0
+    started = time.monotonic()
+    try:
+        for index, result in pipeline.run_batch(
+            items(),
+            temperature=cfg.temperature,
+            max_tokens=cfg.max_tokens,
+            critique_pass=args.critique,
+            workers=args.workers,
+        ):
+            record = records.pop(index, {})
+            # Highlighted HTML only matters for the Streamlit view.
+            result.pop("highlighted_context", None)
+            row = {"index": index, "id": record.get(args.id_field), "result": result}
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+
+            done += 1
+            if result.get("confidence") == "low":
+                low_confidence += 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+    summary = build_batch_summary(
+        backend_meta=pipeline.client.metadata(),
+        items=done,
+        elapsed_seconds=time.monotonic() - started,
+        workers=max(1, args.workers),
+        low_confidence=low_confidence,
+    )
+    print(json.dumps(summary), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Save benchmark rows as JSON baselines and compare a new run against one.
+
+    python -m benchmarks.bench_highlight --save base.json      # on the reference commit
+    python -m benchmarks.bench_highlight --save new.json       # on the change, same machine
+    python -m benchmarks.baseline compare base.json new.json [--threshold 0.15] [--min-delta 0.5]
+
+No baselines are checked in: timings only compare on the same machine, so produce one on demand
+with --save PATH. Rows are matched on the benchmark's key fields.
+Timings (*_ms, *_us, *_seconds) regress when they grow by more than the threshold, and rates
+(*_per_second) regress when they shrink by more than it. Absolute differences below --min-delta
+(in the metric's own unit) are treated as noise. The exit status is 1 on any regression, so the
+command can gate CI.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import argparse
+import json
+import platform
+import sys
+
+_LOWER_IS_BETTER = ("_ms", "_us", "_seconds")
+_HIGHER_IS_BETTER = ("_per_second",)
+
+
+def save_baseline(
+    path: str, benchmark: str, key: Sequence[str], params: Dict[str, Any], rows: List[Dict[str, Any]]
+) -> None:
+    report = {
+        "benchmark": benchmark,
+        "created_utc": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "params": params,
+        "key": list(key),
+        "rows": rows,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _direction(field: str) -> Optional[int]:
+    # +1 when a larger value is worse, -1 when a smaller value is worse, None for non-metrics.
+    if field.endswith(_HIGHER_IS_BETTER):
+        return -1
+    if field.endswith(_LOWER_IS_BETTER):
+        return 1
+    return None
+
+
+def compare_reports(
+    old: Dict[str, Any], new: Dict[str, Any], threshold: float, min_delta: float = 0.0
+) -> List[Dict[str, Any]]:
+    if old.get("benchmark") != new.get("benchmark"):
+        raise ValueError(f"Different benchmarks: {old.get('benchmark')} vs {new.get('benchmark')}")
+    key = new.get("key") or old.get("key") or []
+
+    def row_key(row: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(row.get(name) for name in key)
+
+    baseline = {row_key(row): row for row in old.get("rows", [])}
+    changes: List[Dict[str, Any]] = []
+    for row in new.get("rows", []):
+        before = baseline.get(row_key(row))
+        if before is None:
+            continue
+        for field, value in row.items():
+            direction = _direction(field)
+            base = before.get(field)
+            if direction is None or not isinstance(value, (int, float)) or not isinstance(base, (int, float)):
+                continue
+            if base <= 0:
+                continue
+            change = (value - base) / base
+            changes.append(
+                {
+                    "row": dict(zip(key, row_key(row))),
+                    "metric": field,
+                    "baseline": base,
+                    "current": value,
+                    "change": round(change, 3),
+                    "regression": change * direction > threshold and abs(value - base) >= min_delta,
+                }
+            )
+    return changes
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    compare = sub.add_parser("compare", help="Compare a new report against a baseline.")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.15, help="Allowed relative change (0.15 = 15%%).")
+    compare.add_argument("--min-delta", type=float, default=0.5, help="Ignore smaller absolute changes.")
+    args = parser.parse_args(argv)
+
+    changes = compare_reports(load_baseline(args.baseline), load_baseline(args.current), args.threshold, args.min_delta)
+    regressions = [c for c in changes if c["regression"]]
+    for change in changes:
+        print(json.dumps(change))
+    print(json.dumps({"compared": len(changes), "regressions": len(regressions), "threshold": args.threshold}))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Highlight and verification microbenchmarks on synthetic contexts from 1 KB to 10 MB.
+
+    python -m benchmarks.bench_highlight [--sizes 1000 10000 ...] [--claims 8] [--repeat 3] [--save PATH]
+
+Times the per-result post-processing the pipeline runs after every model call:
+get_quote_position (cold, index built inside the call), verify_evidence_claims,
+add_question_relevance and build_highlighted_context. Claims mix exact, case-shifted,
+whitespace-shifted and missing quotes (see bench_quote_match); missing quotes pay for the
+fuzzy fallback up to its time budget. Best of --repeat runs, in milliseconds.
+"""
+from typing import Any, Dict, List
+import argparse
+import copy
+import json
+
+from benchmarks.baseline import save_baseline
+from benchmarks.bench_quote_match import make_context, make_quotes, time_ms
+from explain.highlight import (
+    add_question_relevance,
+    build_highlighted_context,
+    get_quote_position,
+    verify_evidence_claims,
+)
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+KEY = ("context_chars", "claims")
+
+
+def make_result(context: str, claims: int) -> Dict[str, Any]:
+    return {
+        "answer": "",
+        "evidence_claims": [
+            {"claim": f"claim {i}", "support_reason": "", "quote": quote, "start": 0, "end": 0}
+            for i, quote in enumerate(make_quotes(context, claims))
+        ],
+    }
+
+
+def run(sizes: List[int], claims: int, repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    for size in sizes:
+        context = make_context(size)
+        result = make_result(context, claims)
+        exact_quote = result["evidence_claims"][0]["quote"]
+        question = " ".join(context[: min(len(context), 400)].split()[5:15])
+        verified = verify_evidence_claims(copy.deepcopy(result), context)
+        rows.append(
+            {
+                "context_chars": len(context),
+                "claims": claims,
+                "verified": sum(1 for c in verified["evidence_claims"] if c["verified"]),
+                "get_quote_position_ms": round(time_ms(lambda: get_quote_position(context, exact_quote), repeat), 3),
+                "verify_evidence_claims_ms": round(
+                    time_ms(lambda: verify_evidence_claims(copy.deepcopy(result), context), repeat), 3
+                ),
+                "add_question_relevance_ms": round(
+                    time_ms(lambda: add_question_relevance(copy.deepcopy(verified), question), repeat), 3
+                ),
+                "build_highlighted_context_ms": round(
+                    time_ms(lambda: build_highlighted_context(context, verified["evidence_claims"]), repeat), 3
+                ),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--claims", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", default="", help="Write the rows as a JSON baseline to this path.")
+    args = parser.parse_args()
+    rows = run(args.sizes, args.claims, args.repeat)
+    for row in rows:
+        print(json.dumps(row))
+    if args.save:
+        save_baseline(args.save, "highlight", KEY, vars(args), rows)
+
+
+if __name__ == "__main__":
+    main()
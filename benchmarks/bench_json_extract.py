@@ -0,0 +1,126 @@
+"""
+JSON extraction benchmark on noisy multi-KB model outputs.
+
+    python -m benchmarks.bench_json_extract [--repeat 200]
+
+Compares the previous first-brace character loop with JsonObjectScanner, both on whole
+strings and on the same text fed as small streamed chunks.
+"""
+from typing import Any, Callable, Dict, List
+import argparse
+import json
+import random
+import time
+
+from explain.json_scan import JsonObjectScanner, extract_json_object
+
+
+def legacy_extract(text: str) -> Dict[str, Any]:
+    # Reference copy of the old _extract_balanced_json_object + json.loads path.
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object start found.")
+    depth = 0
+    in_string = False
+    escape = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return json.loads(text[start : i + 1])
+    raise ValueError("No balanced JSON object found.")
+
+
+def make_result(rng: random.Random, claims: int) -> Dict[str, Any]:
+    words = "the service returned a timeout after retries while the cache warmed slowly".split()
+
+    def sentence(n: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    return {
+        "answer": sentence(60) + ' with "quoted" text and {braces}',
+        "black_box_explanation": sentence(90),
+        "assumptions": [sentence(12) for _ in range(3)],
+        "evidence_claims": [
+            {"claim": sentence(10), "support_reason": sentence(20), "quote": sentence(15), "start": 0, "end": 0}
+            for _ in range(claims)
+        ],
+        "uncertainty": [sentence(12) for _ in range(3)],
+        "confidence": "medium",
+        "confidence_reason": sentence(15),
+        "followups": [sentence(10) for _ in range(3)],
+    }
+
+
+def make_cases(seed: int = 7) -> Dict[str, str]:
+    rng = random.Random(seed)
+    body = json.dumps(make_result(rng, 12), indent=2)
+    return {
+        "clean": body,
+        "fenced": "Here is the JSON you asked for:\n```json\n" + body + "\n```\nLet me know if you need more.",
+        "brace_preamble": "Using the {question} and {context} placeholders {as given}:\n" + body + "\nDone.",
+        "unclosed_preamble": "Note { the schema was followed.\n" + body,
+    }
+
+
+def time_it(fn: Callable[[], Any], repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def streamed(text: str, chunk: int = 16) -> Dict[str, Any]:
+    scanner = JsonObjectScanner()
+    for i in range(0, len(text), chunk):
+        found = scanner.feed(text[i : i + chunk])
+        if found is not None:
+            return found
+    return scanner.finish()
+
+
+def run(repeat: int) -> List[Dict[str, Any]]:
+    rows = []
+    for name, text in make_cases().items():
+        expected = streamed(text)
+        try:
+            legacy_ok = legacy_extract(text) == expected
+            legacy_us = time_it(lambda: legacy_extract(text), repeat)
+        except (ValueError, json.JSONDecodeError):
+            legacy_ok, legacy_us = False, None
+        rows.append(
+            {
+                "case": name,
+                "bytes": len(text.encode("utf-8")),
+                "legacy_us": None if legacy_us is None else round(legacy_us, 1),
+                "legacy_ok": legacy_ok,
+                "scanner_us": round(time_it(lambda: extract_json_object(text), repeat), 1),
+                "scanner_stream16_us": round(time_it(lambda: streamed(text), repeat), 1),
+            }
+        )
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    for row in run(args.repeat):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Local JSON repair benchmark over a corpus of malformed model outputs.
+
+    python -m benchmarks.bench_json_repair [--seeds 20] [--repeat 50]
+
+Each corpus entry is a realistic result object broken the way local models break it.
+"before" is the previous path: get_json_from_text, with an LLM repair call whenever it fails. It also
+counts "fragments", where the strict path returned one nested evidence claim instead of the result.
+"after" is parse_model_json with local repair. Repair time is measured per recovered output.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import random
+import re
+
+from benchmarks.bench_json_extract import make_result, time_it
+from explain.pipeline import get_json_from_text, parse_model_json
+
+_DELIMITER_QUOTE = re.compile(r'(?<!\\)"')
+
+# Hand-collected shapes that the generated mutations do not cover.
+HAND_CASES: List[Tuple[str, str]] = [
+    ("python_dict", "{'answer': 'Restart the worker', 'confidence': 'low', 'followups': None, 'ok': True}"),
+    ("key_truncated", '{"answer": "The cache was cold", "confidence": "medium", "confidence_rea'),
+    ("colon_truncated", '{"answer": "The cache was cold", "confidence":'),
+    ("windows_path", '{"answer": "Check C:\\logs\\app.log for the stack", "confidence": "low"}'),
+    ("prose_only", "I could not find enough information in the context to answer this question."),
+]
+
+
+def _smart_quotes(text: str) -> str:
+    quotes = iter(["“", "”"] * len(text))
+    return _DELIMITER_QUOTE.sub(lambda m: next(quotes), text)
+
+
+def _truncate(fraction: float) -> Callable[[str], str]:
+    return lambda text: text[: int(len(text) * fraction)]
+
+
+MUTATIONS: Dict[str, Callable[[str], str]] = {
+    "trailing_commas": lambda text: re.sub(r"(\n\s*)([\]}])", r",\1\2", text),
+    "smart_quotes": _smart_quotes,
+    "raw_newlines": lambda text: text.replace('with \\"quoted\\"', "with\n\\\"quoted\\\"\n"),
+    "inner_quotes": lambda text: text.replace('\\"quoted\\"', '"quoted"'),
+    "fenced_trailing_commas": lambda text: "```json\n" + re.sub(r"(\n\s*)([\]}])", r",\1\2", text) + "\n```",
+    "truncated_60": _truncate(0.60),
+    "truncated_85": _truncate(0.85),
+    "truncated_98": _truncate(0.98),
+}
+
+
+def make_corpus(seeds: int) -> List[Tuple[str, str]]:
+    corpus: List[Tuple[str, str]] = []
+    for seed in range(seeds):
+        rng = random.Random(seed)
+        result = make_result(rng, rng.randint(2, 8))
+        body = json.dumps(result, indent=2, ensure_ascii=False)
+        corpus.append(("clean", body))
+        corpus.append(("python_repr", repr(result)))
+        for name, mutate in MUTATIONS.items():
+            corpus.append((name, mutate(body)))
+    return corpus + HAND_CASES
+
+
+def _is_result(parsed: Dict[str, Any]) -> bool:
+    # Every corpus entry is a whole result object; anything without its keys is a fragment.
+    return "answer" in parsed or "confidence" in parsed
+
+
+def _strict(text: str) -> str:
+    try:
+        return "ok" if _is_result(get_json_from_text(text)) else "fragment"
+    except ValueError:
+        return "failed"
+
+
+def _local(text: str) -> str:
+    try:
+        parsed, _ = parse_model_json(text, [], "bench")
+    except ValueError:
+        return "failed"
+    return "ok" if _is_result(parsed) else "fragment"
+
+
+def run(seeds: int, repeat: int) -> Dict[str, Any]:
+    corpus = make_corpus(seeds)
+    by_kind: Dict[str, Dict[str, Any]] = {}
+    totals = {"strict_failed": 0, "strict_fragment": 0, "local_failed": 0, "local_fragment": 0}
+    for kind, text in corpus:
+        row = by_kind.setdefault(
+            kind,
+            {"kind": kind, "cases": 0, "strict_ok": 0, "strict_fragment": 0, "local_ok": 0, "repair_us": []},
+        )
+        row["cases"] += 1
+        strict = _strict(text)
+        local = _local(text)
+        if strict == "ok":
+            row["strict_ok"] += 1
+        else:
+            totals[f"strict_{strict}"] += 1
+            if strict == "fragment":
+                row["strict_fragment"] += 1
+        if local == "ok":
+            row["local_ok"] += 1
+            if strict != "ok":
+                row["repair_us"].append(time_it(lambda: parse_model_json(text, [], "bench"), repeat))
+        else:
+            totals[f"local_{local}"] += 1
+
+    rows = []
+    for row in by_kind.values():
+        timings = row.pop("repair_us")
+        row["repair_us_mean"] = round(sum(timings) / len(timings), 1) if timings else None
+        rows.append(row)
+    total = len(corpus)
+    return {
+        "rows": rows,
+        "summary": {
+            "outputs": total,
+            "llm_repair_rate_before": round(totals["strict_failed"] / total, 3),
+            "fragment_rate_before": round(totals["strict_fragment"] / total, 3),
+            "llm_repair_rate_after": round(totals["local_failed"] / total, 3),
+            "fragment_rate_after": round(totals["local_fragment"] / total, 3),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seeds", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    report = run(args.seeds, args.repeat)
+    for row in report["rows"]:
+        print(json.dumps(row))
+    print(json.dumps(report["summary"]))
+
+
+if __name__ == "__main__":
+    main()
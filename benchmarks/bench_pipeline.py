@@ -0,0 +1,114 @@
+"""
+End-to-end ExplainerPipeline.run benchmark against the local fake Ollama server.
+
+    python -m benchmarks.bench_pipeline [--sizes 2000 20000 200000] [--items 20] [--workers 1]
+                                        [--latency-ms 20] [--tokens-per-second 1000]
+                                        [--malformed-rate 0.1] [--critique] [--save PATH]
+
+Every item is a different question over a synthetic context, so replies (and their malformed
+share) vary from item to item while staying reproducible. Reports run latency percentiles,
+throughput and the pipeline's own overhead (run time minus time spent in model calls), plus
+how often JSON needed local or LLM repair and how many evidence claims were verified.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import time
+
+from benchmarks.baseline import save_baseline
+from benchmarks.bench_quote_match import make_context
+from benchmarks.fake_ollama import FakeOllama
+from explain.pipeline import ExplainerPipeline
+from llm.client_ollama import OllamaClient
+
+KEY = ("context_chars", "items", "workers", "critique")
+_CALL_STAGES = {"primary_call", "repair_call", "critique_call", "map_calls", "reduce_call"}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def run_size(
+    url: str, size: int, items: int, workers: int, critique: bool, max_tokens: int, long_context_chars: int
+) -> Dict[str, Any]:
+    client = OllamaClient(base_url=url, model="fake:latest", timeout_seconds=60, pool_size=max(workers, 1))
+    pipeline = ExplainerPipeline(client, long_context_chars=long_context_chars)
+    context = make_context(size)
+    batch = [{"question": f"Why did request {i} stall after the retry?", "context": context} for i in range(items)]
+
+    started = time.perf_counter()
+    results = [result for _, result in pipeline.run_batch(batch, 0.0, max_tokens, critique, workers)]
+    elapsed = time.perf_counter() - started
+
+    run_seconds: List[float] = []
+    overhead_seconds: List[float] = []
+    llm_repairs = local_repairs = llm_calls = claims = verified = 0
+    for result in results:
+        trace = result["trace_log"]
+        timings = trace.get("timings", {})
+        run_seconds.append(timings.get("total_seconds", 0.0))
+        in_calls = sum(s["seconds"] for s in timings.get("stages", []) if s["stage"] in _CALL_STAGES)
+        overhead_seconds.append(max(0.0, timings.get("total_seconds", 0.0) - in_calls))
+        steps = trace["steps_run"]
+        llm_repairs += "llm_json_repair_call" in steps
+        local_repairs += any(step.startswith("local_json_repair:") for step in steps)
+        llm_calls += len(trace.get("llm_calls", []))
+        claims += len(result.get("evidence_claims", []))
+        verified += sum(1 for c in result.get("evidence_claims", []) if c.get("verified"))
+
+    return {
+        "context_chars": len(context),
+        "items": items,
+        "workers": workers,
+        "critique": critique,
+        "run_p50_ms": round(_percentile(run_seconds, 0.5) * 1000, 1),
+        "run_p95_ms": round(_percentile(run_seconds, 0.95) * 1000, 1),
+        "overhead_p50_ms": round(_percentile(overhead_seconds, 0.5) * 1000, 2),
+        "items_per_second": round(items / max(elapsed, 1e-9), 2),
+        "llm_calls_per_item": round(llm_calls / items, 2),
+        "local_repair_rate": round(local_repairs / items, 3),
+        "llm_repair_rate": round(llm_repairs / items, 3),
+        "verified_rate": round(verified / claims, 3) if claims else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2_000, 20_000, 200_000])
+    parser.add_argument("--items", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--critique", action="store_true")
+    parser.add_argument("--max-tokens", type=int, default=700)
+    parser.add_argument("--long-context-chars", type=int, default=0, help="Map-reduce threshold (0 = off).")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default="", help="Write the rows as a JSON baseline to this path.")
+    args = parser.parse_args()
+
+    fake = FakeOllama(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    url = fake.start()
+    rows = []
+    try:
+        for size in args.sizes:
+            row = run_size(
+                url, size, args.items, args.workers, args.critique, args.max_tokens, args.long_context_chars
+            )
+            rows.append(row)
+            print(json.dumps(row))
+    finally:
+        fake.stop()
+    if args.save:
+        save_baseline(args.save, "pipeline", KEY, vars(args), rows)
+
+
+if __name__ == "__main__":
+    main()
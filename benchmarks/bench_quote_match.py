@@ -0,0 +1,138 @@
+"""
+Quote location benchmark: per-quote loop vs batched ContextIndex.find_all.
+
+    python -m benchmarks.bench_quote_match [--size 1000000] [--repeat 5]
+
+Quotes are a mix of exact, case-shifted, whitespace-shifted and missing spans. The context
+index is built once up front (its cost is reported separately) and the fuzzy fallback is left
+out, so only the exact/case/normalized lookup stages are compared.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import random
+import re
+import time
+
+from explain import highlight
+from explain.highlight import ContextIndex, normalize_quote
+
+
+def make_context(size: int, seed: int = 11) -> str:
+    rng = random.Random(seed)
+    vocab = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))) for _ in range(4000)]
+    words: List[str] = []
+    total = 0
+    while total < size:
+        word = rng.choice(vocab)
+        if rng.random() < 0.05:
+            word = word.capitalize()
+        words.append(word)
+        total += len(word) + 1
+        if rng.random() < 0.02:
+            words.append("\n")
+    return " ".join(words)[:size]
+
+
+def make_quotes(context: str, count: int, seed: int = 5) -> List[str]:
+    rng = random.Random(seed)
+    quotes: List[str] = []
+    for i in range(count):
+        start = rng.randint(0, max(0, len(context) - 200))
+        span = context[start : start + rng.randint(40, 120)].strip()
+        kind = i % 4
+        if kind == 1:
+            span = span.upper()
+        elif kind == 2:
+            span = re.sub(r"\s+", "  ", span)
+        elif kind == 3:
+            span = f"zz missing quote {i} " + span[:20]
+        quotes.append(span)
+    return quotes
+
+
+def per_quote_loop(index: ContextIndex, quotes: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+    # The pre-batching behaviour: every quote walks exact -> lower -> normalized on its own.
+    out = []
+    for quote in quotes:
+        start = index.raw.find(quote)
+        if start != -1:
+            out.append((start, start + len(quote)))
+            continue
+        start = index.lower.find(quote.lower())
+        if start != -1:
+            out.append((start, start + len(quote)))
+            continue
+        norm_quote = normalize_quote(quote)
+        start = index.norm.find(norm_quote)
+        if start != -1:
+            out.append((index.norm_to_raw(start), index.norm_to_raw(start + len(norm_quote) - 1) + 1))
+            continue
+        out.append((None, None))
+    return out
+
+
+def batched(index: ContextIndex, quotes: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+    index._found.clear()
+    return index.find_all(quotes)
+
+
+def batched_automaton(index: ContextIndex, quotes: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+    saved = highlight.MULTI_PATTERN_MIN
+    highlight.MULTI_PATTERN_MIN = 1
+    try:
+        return batched(index, quotes)
+    finally:
+        highlight.MULTI_PATTERN_MIN = saved
+
+
+def build_index(context: str) -> ContextIndex:
+    index = ContextIndex(context)
+    index.norm
+    return index
+
+
+def time_ms(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def run(size: int, repeat: int, counts: List[int]) -> List[Dict[str, Any]]:
+    context = make_context(size)
+    index_ms = time_ms(lambda: build_index(context), repeat)
+    index = build_index(context)
+    rows = []
+    for count in counts:
+        quotes = make_quotes(context, count)
+        reference = per_quote_loop(index, quotes)
+        row = {
+            "context_chars": len(context),
+            "index_build_ms": round(index_ms, 2),
+            "quotes": count,
+            "per_quote_ms": round(time_ms(lambda: per_quote_loop(index, quotes), repeat), 2),
+            "find_all_ms": round(time_ms(lambda: batched(index, quotes), repeat), 2),
+            "same_spans": batched(index, quotes) == reference,
+        }
+        if highlight.ahocorasick is not None:
+            row["automaton_ms"] = round(time_ms(lambda: batched_automaton(index, quotes), repeat), 2)
+            row["automaton_same_spans"] = batched_automaton(index, quotes) == reference
+        rows.append(row)
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quotes", type=int, nargs="+", default=[10, 40, 200, 1000])
+    args = parser.parse_args()
+    for row in run(args.size, args.repeat, args.quotes):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
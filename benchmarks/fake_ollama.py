@@ -0,0 +1,236 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks that should not depend on a real model.
+
+    python -m benchmarks.fake_ollama [--port 11435] [--latency-ms 150] [--tokens-per-second 40]
+                                     [--malformed-rate 0.1]
+
+Implements /api/tags and /api/chat (blocking and streamed). Replies are result objects whose
+quotes are cut from the CONTEXT section of the prompt, so evidence verification does real work.
+Each reply waits latency_ms (prompt eval) plus its token count at tokens_per_second, honours
+num_predict with done_reason "length", and resumes a length-stopped reply when the request
+ends with the partial assistant turn. malformed_rate is the share of prompts whose reply is
+broken the way local models break JSON (trailing commas, prose wrapping, Python literals, cut off).
+The same prompt always gets the same reply, so cached and uncached runs are comparable.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+# Rough size of one token in characters, matching utils.text.CHARS_PER_TOKEN.
+_CHARS_PER_TOKEN = 4
+_CONTEXT_SECTION = re.compile(r"CONTEXT:\n(.*?)\n\n(?:ANSWER STYLE REQUIREMENTS|PRIOR_JSON):", re.S)
+_WORDS = "the request stalled because the cache was cold and retries hid the timeout".split()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients drop keep-alive connections once a stream is done; that is not worth a traceback.
+        pass
+
+
+def _mutate(text: str, rng: random.Random) -> str:
+    kind = rng.randrange(4)
+    if kind == 0:
+        return re.sub(r"(\n\s*)([\]}])", r",\1\2", text)
+    if kind == 1:
+        return "Sure! Here is the JSON:\n```json\n" + text + "\n```\nHope this helps."
+    if kind == 2:
+        return repr(json.loads(text))
+    return text[: int(len(text) * rng.uniform(0.6, 0.95))]
+
+
+class FakeOllama:
+    def __init__(
+        self,
+        model: str = "fake:latest",
+        latency_ms: float = 50.0,
+        tokens_per_second: float = 200.0,
+        malformed_rate: float = 0.0,
+        seed: int = 0,
+        max_quotes: int = 4,
+    ):
+        self.model = model
+        self.latency_ms = latency_ms
+        self.tokens_per_second = tokens_per_second
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.max_quotes = max_quotes
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[_Server] = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        # Serve from a daemon thread; port 0 picks a free port. Returns the base URL.
+        fake = self
+
+        class Handler(_Handler):
+            server_state = fake
+
+        self._server = _Server((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reply_for(self, messages: List[Dict[str, str]]) -> str:
+        # Deterministic per prompt: the rng is seeded from the messages up to the last user turn.
+        prompt = [m for m in messages if m.get("role") != "assistant"]
+        digest = hashlib.sha256(json.dumps(prompt, sort_keys=True).encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big") ^ self.seed)
+        system = next((m.get("content", "") for m in prompt if m.get("role") == "system"), "")
+        user = next((m.get("content", "") for m in reversed(prompt) if m.get("role") == "user"), "")
+        match = _CONTEXT_SECTION.search(user)
+        context = match.group(1) if match else user
+        text = json.dumps(self._result(context, rng), indent=2)
+        # Repair calls always get clean JSON, like a model that was asked twice.
+        if not system.startswith("Convert text") and rng.random() < self.malformed_rate:
+            text = _mutate(text, rng)
+        return text
+
+    def _result(self, context: str, rng: random.Random) -> Dict[str, Any]:
+        def sentence(n: int) -> str:
+            return " ".join(rng.choice(_WORDS) for _ in range(n))
+
+        claims = []
+        for _ in range(rng.randint(1, self.max_quotes)):
+            if len(context) < 40:
+                break
+            start = rng.randrange(0, len(context) - 30)
+            quote = " ".join(context[start : start + rng.randint(30, 120)].split()[1:-1][:20])
+            if rng.random() < 0.15:
+                # An unsupported quote, so the miss and fuzzy paths are part of the workload too.
+                quote = sentence(8)
+            claims.append(
+                {"claim": sentence(8), "support_reason": sentence(14), "quote": quote, "start": 0, "end": 0}
+            )
+        return {
+            "answer": sentence(40),
+            "black_box_explanation": sentence(60),
+            "assumptions": [sentence(10) for _ in range(2)],
+            "evidence_claims": claims,
+            "uncertainty": [sentence(10) for _ in range(2)],
+            "confidence": rng.choice(["low", "medium", "high"]),
+            "confidence_reason": sentence(12),
+            "followups": [sentence(8) for _ in range(2)],
+        }
+
+    def generate(self, payload: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        # Returns the reply text for this request and the final (done) fields Ollama would report.
+        with self._lock:
+            self.requests += 1
+        messages = payload.get("messages", [])
+        options = payload.get("options", {})
+        full = self.reply_for(messages)
+        done = 0
+        if messages and messages[-1].get("role") == "assistant":
+            done = len(messages[-1].get("content", ""))
+        remaining = full[done:]
+        limit = int(options.get("num_predict") or 0) * _CHARS_PER_TOKEN
+        text = remaining[:limit] if limit > 0 else remaining
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // _CHARS_PER_TOKEN
+        eval_tokens = max(1, len(text) // _CHARS_PER_TOKEN)
+        prompt_ns = int(self.latency_ms * 1e6)
+        eval_ns = int(eval_tokens / max(self.tokens_per_second, 1e-6) * 1e9)
+        return text, {
+            "model": self.model,
+            "done": True,
+            "done_reason": "length" if len(text) < len(remaining) else "stop",
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": eval_tokens,
+            "prompt_eval_duration": prompt_ns,
+            "eval_duration": eval_ns,
+            "load_duration": 0,
+            "total_duration": prompt_ns + eval_ns,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_state: FakeOllama
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data: Any, status: int = 200) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/api/tags":
+            self._send_json({"error": "not found"}, 404)
+            return
+        fake = self.server_state
+        digest = hashlib.sha256(fake.model.encode("utf-8")).hexdigest()
+        self._send_json({"models": [{"name": fake.model, "model": fake.model, "digest": digest}]})
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self._send_json({"error": "not found"}, 404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        fake = self.server_state
+        text, final = fake.generate(payload)
+        time.sleep(final["prompt_eval_duration"] / 1e9)
+
+        if not payload.get("stream", True):
+            time.sleep(final["eval_duration"] / 1e9)
+            self._send_json({**final, "message": {"role": "assistant", "content": text}})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = _CHARS_PER_TOKEN * 4
+        pause = final["eval_duration"] / 1e9 / max(1, -(-len(text) // step))
+        for i in range(0, len(text), step):
+            time.sleep(pause)
+            piece = {"role": "assistant", "content": text[i : i + step]}
+            self._chunk({"model": fake.model, "done": False, "message": piece})
+        self._chunk({**final, "message": {"role": "assistant", "content": ""}})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data: Dict[str, Any]) -> None:
+        line = (json.dumps(data) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--model", default="fake:latest")
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakeOllama(args.model, args.latency_ms, args.tokens_per_second, args.malformed_rate, args.seed)
+    url = fake.start(args.host, args.port)
+    print(json.dumps({"url": url, "model": args.model}))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        fake.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,17 +11,81 @@ class AppConfig:
     max_tokens: int = 700
     timeout_seconds: int = 120
     critique_pass: bool = False
+    parallel_slots: int = 1
+    pool_size: int = 10
+    cache_enabled: bool = False
+    cache_force: bool = False
+    cache_dir: str = ""
+    cache_max_entries: int = 256
+    cache_max_mb: int = 256
+    fuzzy_budget_ms: int = 250
+    long_context_chars: int = 16000
+    chunk_chars: int = 6000
+    chunk_overlap: int = 400
+    retrieval_top_k: int = 0
+    retrieval_span_chars: int = 1200
+    num_ctx_min: int = 2048
+    num_ctx_max: int = 8192
+    structured_output: bool = True
+    max_continuations: int = 2
+    metrics_port: int = 0
+    coalesce_requests: bool = True
+    server_host: str = "127.0.0.1"
+    server_port: int = 8088
+    server_queue_size: int = 16
+    server_drain_seconds: int = 60
+    hedge_quantile: float = 0.95
+    hedge_min_ms: int = 250
+    breaker_error_rate: float = 0.5
+    breaker_cooldown_seconds: int = 15
+    health_interval_seconds: int = 10
+    health_ttl_seconds: int = 60
+    followup_compact: bool = True
+    followup_window_chars: int = 300
 
 
 def default_for_backend(backend: str) -> AppConfig:
+    lmstudio = backend == "lmstudio"
     return AppConfig(
-        backend="ollama",
-        model="llama3.1:8b",
-        base_url="http://localhost:11434",
+        backend="lmstudio" if lmstudio else "ollama",
+        model="llama-3.1-8b-instruct" if lmstudio else "llama3.1:8b",
+        # A comma-separated list spreads calls over several hosts (see llm.router).
+        base_url="http://localhost:1234/v1" if lmstudio else "http://localhost:11434",
         temperature=0.2,
         max_tokens=700,
         timeout_seconds=120,
         critique_pass=False,
+        parallel_slots=1,
+        pool_size=10,
+        cache_enabled=False,
+        cache_force=False,
+        cache_dir="",
+        cache_max_entries=256,
+        cache_max_mb=256,
+        fuzzy_budget_ms=250,
+        long_context_chars=16000,
+        chunk_chars=6000,
+        chunk_overlap=400,
+        retrieval_top_k=0,
+        retrieval_span_chars=1200,
+        num_ctx_min=2048,
+        num_ctx_max=8192,
+        structured_output=True,
+        max_continuations=2,
+        metrics_port=0,
+        coalesce_requests=True,
+        server_host="127.0.0.1",
+        server_port=8088,
+        server_queue_size=16,
+        server_drain_seconds=60,
+        hedge_quantile=0.95,
+        hedge_min_ms=250,
+        breaker_error_rate=0.5,
+        breaker_cooldown_seconds=15,
+        health_interval_seconds=10,
+        health_ttl_seconds=60,
+        followup_compact=True,
+        followup_window_chars=300,
     )
 
 
@@ -35,4 +99,35 @@ def load_from_env() -> AppConfig:
     cfg.max_tokens = int(os.getenv("BBE_MAX_TOKENS", cfg.max_tokens))
     cfg.timeout_seconds = int(os.getenv("BBE_TIMEOUT_SECONDS", cfg.timeout_seconds))
     cfg.critique_pass = os.getenv("BBE_CRITIQUE_PASS", "false").strip().lower() == "true"
-    return cfg
+    cfg.parallel_slots = max(1, int(os.getenv("BBE_PARALLEL_SLOTS", cfg.parallel_slots)))
+    cfg.pool_size = max(1, int(os.getenv("BBE_POOL_SIZE", cfg.pool_size)))
+    cfg.cache_enabled = os.getenv("BBE_CACHE", "false").strip().lower() == "true"
+    cfg.cache_force = os.getenv("BBE_CACHE_FORCE", "false").strip().lower() == "true"
+    cfg.cache_dir = os.getenv("BBE_CACHE_DIR", cfg.cache_dir)
+    cfg.cache_max_entries = int(os.getenv("BBE_CACHE_MAX_ENTRIES", cfg.cache_max_entries))
+    cfg.cache_max_mb = int(os.getenv("BBE_CACHE_MAX_MB", cfg.cache_max_mb))
+    cfg.fuzzy_budget_ms = int(os.getenv("BBE_FUZZY_BUDGET_MS", cfg.fuzzy_budget_ms))
+    cfg.long_context_chars = int(os.getenv("BBE_LONG_CONTEXT_CHARS", cfg.long_context_chars))
+    cfg.chunk_chars = int(os.getenv("BBE_CHUNK_CHARS", cfg.chunk_chars))
+    cfg.chunk_overlap = int(os.getenv("BBE_CHUNK_OVERLAP", cfg.chunk_overlap))
+    cfg.retrieval_top_k = int(os.getenv("BBE_RETRIEVAL_TOP_K", cfg.retrieval_top_k))
+    cfg.retrieval_span_chars = int(os.getenv("BBE_RETRIEVAL_SPAN_CHARS", cfg.retrieval_span_chars))
+    cfg.num_ctx_min = int(os.getenv("BBE_NUM_CTX_MIN", cfg.num_ctx_min))
+    cfg.num_ctx_max = int(os.getenv("BBE_NUM_CTX_MAX", cfg.num_ctx_max))
+    cfg.structured_output = os.getenv("BBE_STRUCTURED_OUTPUT", "true").strip().lower() == "true"
+    cfg.max_continuations = int(os.getenv("BBE_MAX_CONTINUATIONS", cfg.max_continuations))
+    cfg.metrics_port = int(os.getenv("BBE_METRICS_PORT", cfg.metrics_port))
+    cfg.coalesce_requests = os.getenv("BBE_COALESCE", "true").strip().lower() == "true"
+    cfg.server_host = os.getenv("BBE_SERVER_HOST", cfg.server_host)
+    cfg.server_port = int(os.getenv("BBE_SERVER_PORT", cfg.server_port))
+    cfg.server_queue_size = max(0, int(os.getenv("BBE_SERVER_QUEUE_SIZE", cfg.server_queue_size)))
+    cfg.server_drain_seconds = int(os.getenv("BBE_SERVER_DRAIN_SECONDS", cfg.server_drain_seconds))
+    cfg.hedge_quantile = float(os.getenv("BBE_HEDGE_QUANTILE", cfg.hedge_quantile))
+    cfg.hedge_min_ms = int(os.getenv("BBE_HEDGE_MIN_MS", cfg.hedge_min_ms))
+    cfg.breaker_error_rate = float(os.getenv("BBE_BREAKER_ERROR_RATE", cfg.breaker_error_rate))
+    cfg.breaker_cooldown_seconds = int(os.getenv("BBE_BREAKER_COOLDOWN_SECONDS", cfg.breaker_cooldown_seconds))
+    cfg.health_interval_seconds = max(1, int(os.getenv("BBE_HEALTH_INTERVAL_SECONDS", cfg.health_interval_seconds)))
+    cfg.health_ttl_seconds = int(os.getenv("BBE_HEALTH_TTL_SECONDS", cfg.health_ttl_seconds))
+    cfg.followup_compact = os.getenv("BBE_FOLLOWUP_COMPACT", "true").strip().lower() == "true"
+    cfg.followup_window_chars = int(os.getenv("BBE_FOLLOWUP_WINDOW_CHARS", cfg.followup_window_chars))
+    return cfg
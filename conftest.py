@@ -0,0 +1 @@
+# Lets pytest import the top-level packages (explain, llm, benchmarks, ...) from tests/.
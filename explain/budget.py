@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+
+from utils.text import CHARS_PER_TOKEN, estimate_tokens
+
+# Chat templates add role markers and separators around every message.
+_MESSAGE_OVERHEAD_TOKENS = 8
+
+
+@dataclass
+class TokenBudget:
+    """
+    Sizes the model context window for a run and says how much context text fits in it.
+
+    Token counts are estimates, so a safety margin is kept on top. num_ctx is rounded up to a
+    power-of-two step because Ollama reloads the model whenever the window size changes; see
+    LoadedWindows for how the size is kept from moving between calls.
+    """
+
+    ctx_min: int = 2048
+    ctx_max: int = 8192
+    safety_margin: float = 0.15
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(estimate_tokens(str(m.get("content", ""))) + _MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def needed(self, prompt_tokens: int, max_tokens: int) -> int:
+        return int((prompt_tokens + max_tokens) * (1.0 + self.safety_margin))
+
+    def num_ctx(self, prompt_tokens: int, max_tokens: int) -> int:
+        # Smallest power-of-two step above ctx_min that holds prompt + generation, capped at ctx_max.
+        needed = self.needed(prompt_tokens, max_tokens)
+        size = max(1, self.ctx_min)
+        while size < needed and size < self.ctx_max:
+            size *= 2
+        return min(size, self.ctx_max)
+
+    def fits(self, prompt_tokens: int, max_tokens: int) -> bool:
+        return self.needed(prompt_tokens, max_tokens) <= self.ctx_max
+
+    def context_chars(self, fixed_tokens: int, max_tokens: int) -> int:
+        # Characters of context that still fit at ctx_max next to the fixed prompt parts.
+        room = int(self.ctx_max / (1.0 + self.safety_margin)) - fixed_tokens - max_tokens
+        return max(0, room * CHARS_PER_TOKEN)
+
+
+class LoadedWindows:
+    """
+    Remembers the largest num_ctx sent to each backend, so later calls never ask for a smaller one.
+
+    Ollama reloads the model (seconds on CPU) whenever num_ctx differs from the loaded window, and
+    a reload also waits for every in-flight request on that model. The window therefore only grows.
+    """
+
+    def __init__(self):
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: Tuple[str, str], size: int) -> int:
+        # Window to send for a call needing `size`: the larger of that and what was sent before.
+        with self._lock:
+            current = max(self._sizes.get(key, 0), int(size))
+            self._sizes[key] = current
+            return current
+
+    def current(self, key: Tuple[str, str]) -> Optional[int]:
+        with self._lock:
+            return self._sizes.get(key)
+
+
+def window_key(client: Any) -> Tuple[str, str]:
+    # Same backend and model means same loaded window, whichever wrapper the client comes in.
+    meta = client.metadata()
+    return str(meta.get("base_url", "")).rstrip("/"), str(meta.get("model", ""))
+
+
+LOADED_WINDOWS = LoadedWindows()
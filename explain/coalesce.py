@@ -0,0 +1,158 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import copy
+import hashlib
+import json
+import threading
+import time
+
+
+class Abandoned(Exception):
+    # The leader stopped without a result (e.g. a streaming consumer went away); followers retry.
+    pass
+
+
+class Flight:
+    def __init__(self, key: str):
+        self.key = key
+        self.done = threading.Event()
+        self.followers = 0
+        self.shared: Any = None
+        self.error: Optional[BaseException] = None
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def on_done(self, fn: Callable[[], None]) -> None:
+        # Run fn once the leader finishes (at once if it already has), on the leader's thread.
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(fn)
+                return
+        fn()
+
+    def set_done(self) -> None:
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn()
+
+
+class SingleFlight:
+    """
+    Runs one computation per key at a time. Callers that arrive with the same key while it is in
+    flight wait for it and receive their own deep copy of its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Flight] = {}
+
+    def begin(self, key: str) -> Tuple[Flight, bool]:
+        # Join the flight for key, or start one; the bool says whether the caller leads it.
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = Flight(key)
+            self._flights[key] = flight
+            return flight, True
+
+    def finish(self, flight: Flight, value: Any = None, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        # Called once by the leader. Returns the leader's coalescing info for its trace.
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        # No one can join after the key is gone, so the follower count is final here.
+        # Followers copy a snapshot taken now; the leader's caller may mutate its result.
+        if error is None and flight.followers:
+            flight.shared = copy.deepcopy(value)
+        flight.error = error
+        flight.set_done()
+        return {"role": "leader", "followers": flight.followers}
+
+    def wait(self, flight: Flight) -> Tuple[Any, Dict[str, Any]]:
+        started = time.monotonic()
+        flight.done.wait()
+        return self._followed(flight, started)
+
+    async def wait_async(self, flight: Flight) -> Tuple[Any, Dict[str, Any]]:
+        # Same as wait(), but parks the coroutine instead of a thread, so any number of async
+        # followers cannot use up the worker threads the leader's own run needs.
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def wake() -> None:
+            if not finished.done():
+                finished.set_result(None)
+
+        flight.on_done(lambda: loop.call_soon_threadsafe(wake))
+        await finished
+        return self._followed(flight, started)
+
+    def _followed(self, flight: Flight, started: float) -> Tuple[Any, Dict[str, Any]]:
+        if flight.error is not None:
+            raise flight.error
+        return copy.deepcopy(flight.shared), {
+            "role": "follower",
+            "followers": flight.followers,
+            "waited_seconds": round(time.monotonic() - started, 4),
+        }
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, Dict[str, Any]]:
+        # Returns the value and how it was obtained: {"role": "leader"|"follower", "followers": n, ...}.
+        while True:
+            flight, leader = self.begin(key)
+            if not leader:
+                try:
+                    return self.wait(flight)
+                except Abandoned:
+                    continue
+            try:
+                value = fn()
+            except BaseException as exc:
+                self.finish(flight, error=exc)
+                raise
+            return value, self.finish(flight, value)
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, Dict[str, Any]]:
+        # do() for coroutines; sync and async callers of the same key share one flight.
+        while True:
+            flight, leader = self.begin(key)
+            if not leader:
+                try:
+                    return await self.wait_async(flight)
+                except Abandoned:
+                    continue
+            try:
+                value = await fn()
+            except asyncio.CancelledError:
+                # The leader's caller went away; that is no answer for the followers, so they retry.
+                self.finish(flight, error=Abandoned())
+                raise
+            except BaseException as exc:
+                self.finish(flight, error=exc)
+                raise
+            return value, self.finish(flight, value)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+def flight_key(question: str, context: str, settings: Dict[str, Any]) -> str:
+    # Whitespace in the question is not significant; the context is kept exact because evidence
+    # offsets point into it.
+    digest = hashlib.sha256()
+    digest.update(" ".join(question.split()).encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(context.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Shared by every pipeline in the process, so duplicate requests from different sessions meet.
+SHARED_FLIGHTS = SingleFlight()
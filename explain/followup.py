@@ -0,0 +1,119 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+from explain.budget import TokenBudget
+from explain.retrieval import passages_for_spans, retrieve_context
+
+# Only used for its prompt-token estimate.
+_ESTIMATE = TokenBudget()
+
+
+@dataclass
+class FollowupDigest:
+    """
+    Compact stand-in for the full context in follow-up chat: the original question, the answer,
+    verified evidence with the text around it, and the passages most related to the question.
+
+    It depends only on the explained result, so it is identical on every turn and the system prompt
+    built from it stays a stable prefix the backend's prompt cache can reuse.
+    """
+
+    text: str
+    # Context offsets already shown, so per-turn snippets do not repeat them.
+    spans: List[Tuple[int, int]]
+
+
+def build_followup_digest(
+    result: Dict[str, Any],
+    question: str,
+    context: str,
+    window_chars: int = 300,
+    snippet_k: int = 3,
+    span_chars: int = 800,
+    max_chars: int = 6000,
+) -> FollowupDigest:
+    lines = ["Original question:", question, "", "Answer given:", str(result.get("answer", ""))]
+    confidence = str(result.get("confidence", ""))
+    if confidence:
+        lines += ["", f"Confidence: {confidence}. {result.get('confidence_reason', '')}".strip()]
+
+    claims = [c for c in result.get("evidence_claims", []) if c.get("verified")]
+    if claims:
+        lines += ["", "Verified evidence:"]
+        lines += [f'- {c.get("claim", "")} -- "{c.get("quote", "")}" (chars {c["start"]}-{c["end"]})' for c in claims]
+
+    if len(context) <= max_chars:
+        # Small contexts are cheaper to send whole than to describe.
+        spans = [(0, len(context))]
+        excerpts = context
+    else:
+        # Evidence windows first, then the passages BM25 ranks highest for the question, while they fit.
+        candidates = [
+            (max(0, int(c["start"]) - window_chars), min(len(context), int(c["end"]) + window_chars)) for c in claims
+        ]
+        retrieved = retrieve_context(context, question, snippet_k, span_chars)
+        if retrieved is not None:
+            candidates += retrieved.spans
+        spans = []
+        used = 0
+        for start, end in candidates:
+            if used + (end - start) <= max_chars:
+                spans.append((start, end))
+                used += end - start
+        excerpts = passages_for_spans(context, spans, 0).prompt_context
+    lines += ["", f"Context excerpts ({len(context)} characters in total):", excerpts]
+    return FollowupDigest(text="\n".join(lines), spans=spans)
+
+
+def followup_snippets(
+    digest: FollowupDigest, context: str, user_text: str, snippet_k: int = 2, span_chars: int = 800
+) -> str:
+    # Passages relevant to this follow-up that the digest does not already contain; empty when none.
+    if digest.spans == [(0, len(context))]:
+        return ""
+    retrieved = retrieve_context(context, user_text, snippet_k, span_chars)
+    if retrieved is None:
+        return ""
+    fresh = [
+        (start, end)
+        for start, end in retrieved.spans
+        if not any(s <= start and end <= e for s, e in digest.spans)
+    ]
+    return passages_for_spans(context, fresh, 0).prompt_context if fresh else ""
+
+
+def build_followup_messages(
+    system_prompt: str,
+    digest: FollowupDigest,
+    history: List[Dict[str, str]],
+    user_text: str,
+    context: str,
+    max_history_chars: int = 12000,
+) -> List[Dict[str, str]]:
+    # Order matters for prompt caching: system prompt and digest, then earlier turns (append-only),
+    # then the new question with any per-turn snippets. Only the tail changes from turn to turn.
+    system = (
+        f"{system_prompt.strip()}\n\n"
+        "Reference material from the earlier analysis (excerpts of the user's context, with character offsets):\n\n"
+        f"{digest.text}\n\n"
+        "If a follow-up is unrelated to this material, answer directly without forcing context analysis."
+    )
+    turns: List[Dict[str, str]] = []
+    used = 0
+    for msg in reversed(history):
+        used += len(msg.get("content", ""))
+        if used > max_history_chars:
+            break
+        turns.insert(0, {"role": msg["role"], "content": msg.get("content", "")})
+    while turns and turns[0]["role"] != "user":
+        # Chat templates expect the turns after the system prompt to open with the user.
+        turns.pop(0)
+    question = user_text
+    snippets = followup_snippets(digest, context, user_text)
+    if snippets:
+        question += f"\n\nPassages related to this question:\n{snippets}"
+    return [{"role": "system", "content": system}, *turns, {"role": "user", "content": question}]
+
+
+def prompt_tokens_est(messages: List[Dict[str, str]]) -> int:
+    return _ESTIMATE.prompt_tokens(messages)
@@ -1,61 +1,311 @@
 ﻿from typing import Any, Dict, List, Optional, Tuple
+import bisect
 import html
 import re
+import time
 
 try:
     from rapidfuzz import fuzz
 except ImportError:
     fuzz = None
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
-def get_quote_position(context: str, quote: str) -> Tuple[Optional[int], Optional[int]]:
-    # Try exact match first, then case-insensitive match.
-    if not quote:
+# Below this many distinct quotes, one C-level str.find per quote is faster than building and
+# running an automaton (see benchmarks/bench_quote_match.py).
+MULTI_PATTERN_MIN = 256
+
+# Contexts up to this size are fuzzy-aligned in one piece; larger ones only in seeded windows.
+FUZZY_FULL_SCAN_CHARS = 20000
+# Default wall-clock budget for fuzzy-locating a single quote.
+FUZZY_BUDGET_SECONDS = 0.25
+# Words occurring more often than this are too common to seed candidate windows.
+_MAX_SEED_HITS = 2000
+_MAX_WINDOWS = 8
+
+
+_QUOTE_CHARS = str.maketrans({"“": '"', "”": '"', "’": "'"})
+_WORD_RUN = re.compile(r"\S+")
+
+
+def _lower_with_map(text: str) -> Tuple[str, Optional[List[int]]]:
+    # str.lower() keeps length for almost all text; only build an offset map when it does not.
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered, None
+    chars: List[str] = []
+    offsets: List[int] = []
+    for i, ch in enumerate(text):
+        low = ch.lower()
+        chars.append(low)
+        offsets.extend([i] * len(low))
+    return "".join(chars), offsets
+
+
+class ContextIndex:
+    """
+    Lookup tables for one context, built once and shared by every quote lookup:
+    - lower: lowercased copy (plus an offset map in the rare case lowering changes length)
+    - norm: lowercased copy with smart quotes straightened and whitespace runs collapsed;
+      norm_to_raw() maps a normalized offset back to its raw position
+    - token_positions: token -> raw start offsets, for seeding approximate matches
+    The normalized copy is built on first use and token lookups are memoized as they are asked for.
+    """
+
+    def __init__(self, context: str):
+        self.raw = context
+        self.lower, self._lower_offsets = _lower_with_map(context)
+        self._norm: Optional[str] = None
+        self._norm_starts: List[int] = []
+        self._raw_starts: List[int] = []
+        self._norm_offsets: Optional[List[int]] = None
+        self._tokens: Dict[str, Optional[List[int]]] = {}
+        self._found: Dict[str, Tuple[Optional[int], Optional[int]]] = {}
+        self._fuzzy_found: Dict[str, Tuple[Optional[int], Optional[int], bool]] = {}
+
+    @property
+    def norm(self) -> str:
+        if self._norm is None:
+            self._build_norm()
+        return self._norm
+
+    def norm_to_raw(self, pos: int) -> int:
+        self.norm
+        if self._norm_offsets is not None:
+            return self._norm_offsets[pos]
+        # Words keep their length in the normalized copy, so an offset inside word k (or the single
+        # space after it) sits at the same distance from the word's raw start.
+        k = max(0, bisect.bisect_right(self._norm_starts, pos) - 1)
+        return self._raw_starts[k] + (pos - self._norm_starts[k])
+
+    def _build_norm(self) -> None:
+        text = self.raw.translate(_QUOTE_CHARS)
+        collapsed = " ".join(text.split())
+        norm = collapsed.lower()
+        raw_starts = [m.start() for m in _WORD_RUN.finditer(text)]
+        norm_starts = [m.start() for m in _WORD_RUN.finditer(norm)]
+        if len(norm) == len(collapsed) and len(raw_starts) == len(norm_starts):
+            self._norm, self._raw_starts, self._norm_starts = norm, raw_starts, norm_starts
+            return
+
+        # Lowercasing changed some word lengths: fall back to a per-character offset map.
+        pieces: List[str] = []
+        offsets: List[int] = []
+        for m in _WORD_RUN.finditer(text):
+            if pieces:
+                # One space stands in for the whole whitespace run before this word.
+                pieces.append(" ")
+                offsets.append(m.start() - 1)
+            for k, ch in enumerate(m.group()):
+                low = ch.lower()
+                pieces.append(low)
+                offsets.extend([m.start() + k] * len(low))
+        self._norm = "".join(pieces)
+        self._norm_offsets = offsets
+
+    def token_positions(self, token: str, limit: int) -> Optional[List[int]]:
+        # Raw offsets of a lowercase token, found on demand and memoized; None when it occurs more
+        # than `limit` times (too common to be a useful anchor).
+        if token not in self._tokens:
+            positions: Optional[List[int]] = []
+            i = self.lower.find(token)
+            while i != -1:
+                if len(positions) >= limit:
+                    positions = None
+                    break
+                positions.append(self._raw_pos(i))
+                i = self.lower.find(token, i + 1)
+            self._tokens[token] = positions
+        return self._tokens[token]
+
+    def _raw_pos(self, lower_pos: int) -> int:
+        return lower_pos if self._lower_offsets is None else self._lower_offsets[lower_pos]
+
+    def find(self, quote: str) -> Tuple[Optional[int], Optional[int]]:
+        return self.find_all([quote])[0]
+
+    def find_all(self, quotes: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+        # Resolve every quote as exact, then case-insensitive, then quote/whitespace-normalized match.
+        # Each form is searched for all still-unresolved quotes together, and results are memoized
+        # so repeated quotes (e.g. primary and critique passes) are only located once.
+        pending = [q for q in dict.fromkeys(quotes) if q and q not in self._found]
+
+        if pending:
+            hits = first_occurrences(self.raw, pending)
+            for q, start in hits.items():
+                self._found[q] = (start, start + len(q))
+            pending = [q for q in pending if q not in hits]
+
+        if pending:
+            lowered = {q: q.lower() for q in pending}
+            hits = first_occurrences(self.lower, list(dict.fromkeys(lowered.values())))
+            for q, low in lowered.items():
+                start = hits.get(low)
+                if start is not None:
+                    self._found[q] = self._lower_span(start, start + len(low))
+            pending = [q for q in pending if q not in self._found]
+
+        if pending:
+            normed = {q: normalize_quote(q) for q in pending}
+            hits = first_occurrences(self.norm, [n for n in dict.fromkeys(normed.values()) if n])
+            for q, norm_quote in normed.items():
+                start = hits.get(norm_quote)
+                if start is not None:
+                    self._found[q] = (self.norm_to_raw(start), self.norm_to_raw(start + len(norm_quote) - 1) + 1)
+            pending = [q for q in pending if q not in self._found]
+
+        for q in pending:
+            self._found[q] = (None, None)
+        return [self._found[q] if q else (None, None) for q in quotes]
+
+    def _lower_span(self, start: int, end: int) -> Tuple[int, int]:
+        if self._lower_offsets is None:
+            return start, end
+        return self._lower_offsets[start], self._lower_offsets[end - 1] + 1
+
+
+def first_occurrences(text: str, patterns: List[str]) -> Dict[str, int]:
+    # First start offset of each pattern in text; patterns that do not occur are left out.
+    found: Dict[str, int] = {}
+    if ahocorasick is not None and len(patterns) >= MULTI_PATTERN_MIN:
+        automaton = ahocorasick.Automaton()
+        for pattern in patterns:
+            automaton.add_word(pattern, pattern)
+        automaton.make_automaton()
+        for end, pattern in automaton.iter(text):
+            if pattern not in found:
+                found[pattern] = end - len(pattern) + 1
+                if len(found) == len(patterns):
+                    break
+        return found
+
+    for pattern in patterns:
+        start = text.find(pattern)
+        if start != -1:
+            found[pattern] = start
+    return found
+
+
+def normalize_quote(text: str) -> str:
+    # Same normalization ContextIndex applies to the context.
+    return re.sub(r"\s+", " ", text.translate(_QUOTE_CHARS)).strip().lower()
+
+
+def _candidate_windows(index: ContextIndex, quote: str) -> List[Tuple[int, int]]:
+    # Seed windows from words the quote shares with the context: each hit votes for the raw offset
+    # where the quote would start, and the offsets backed by the most distinct words win.
+    seeds = []
+    for m in re.finditer(r"\w{3,}", quote.lower()):
+        positions = index.token_positions(m.group(), _MAX_SEED_HITS)
+        if positions:
+            seeds.append((m.group(), m.start(), positions))
+    if not seeds:
+        return []
+
+    bucket = max(32, len(quote) // 2)
+    votes: Dict[int, set] = {}
+    for tok, off, positions in seeds:
+        for pos in positions:
+            votes.setdefault((pos - off) // bucket, set()).add(tok)
+
+    ranked = sorted(votes.items(), key=lambda item: (-len(item[1]), item[0]))[:_MAX_WINDOWS]
+    windows = []
+    for key, _ in ranked:
+        anchor = key * bucket
+        windows.append((max(0, anchor - len(quote)), min(len(index.raw), anchor + bucket + 2 * len(quote))))
+    return windows
+
+
+def _fuzzy_position(
+    index: ContextIndex,
+    quote: str,
+    budget_seconds: float = FUZZY_BUDGET_SECONDS,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Tuple[Optional[int], Optional[int]]:
+    # Fuzzy fallback for small formatting drift. Results are memoized on the index, so a quote
+    # checked during streaming is not aligned again for the final result.
+    if fuzz is None:
         return None, None
 
-    start = context.find(quote)
-    if start != -1:
-        return start, start + len(quote)
-
-    start = context.lower().find(quote.lower())
-    if start != -1:
-        return start, start + len(quote)
-
-    # Normalize punctuation/whitespace differences.
-    def norm(text: str) -> str:
-        text = text.replace("“", '"').replace("”", '"').replace("’", "'")
-        text = re.sub(r"\s+", " ", text).strip()
-        return text
-
-    norm_context = norm(context)
-    norm_quote = norm(quote)
-    start = norm_context.lower().find(norm_quote.lower())
-    if start != -1:
-        first_word = next((w for w in norm_quote.split(" ") if w), "")
-        if first_word:
-            raw_start = context.lower().find(first_word.lower())
-            if raw_start != -1:
-                return raw_start, min(len(context), raw_start + len(quote))
-
-    # Fuzzy fallback for small formatting drift.
-    if fuzz is not None:
+    memo = index._fuzzy_found.get(quote)
+    if memo is not None:
+        return memo[0], memo[1]
+    start, end, over_budget = _fuzzy_search(index, quote, budget_seconds)
+    index._fuzzy_found[quote] = (start, end, over_budget)
+    if stats is not None:
+        stats["fuzzy_attempts"] = stats.get("fuzzy_attempts", 0) + 1
+        # Counted once per search that ran out of time, not again when the memo answers.
+        if over_budget:
+            stats.setdefault("fuzzy_budget_hits", []).append(quote[:80])
+    return start, end
+
+
+def _fuzzy_search(index: ContextIndex, quote: str, budget_seconds: float) -> Tuple[Optional[int], Optional[int], bool]:
+    if len(index.raw) <= FUZZY_FULL_SCAN_CHARS:
+        windows = [(0, len(index.raw))]
+    else:
+        windows = _candidate_windows(index, quote)
+
+    deadline = time.monotonic() + budget_seconds
+    best = None
+    over_budget = False
+    for w_start, w_end in windows:
+        if time.monotonic() > deadline:
+            over_budget = True
+            break
         try:
-            align = fuzz.partial_ratio_alignment(quote, context, score_cutoff=88)
-            if align is not None:
-                return align.dest_start, align.dest_end
+            align = fuzz.partial_ratio_alignment(quote, index.raw[w_start:w_end], score_cutoff=88)
         except Exception:
-            pass
+            continue
+        if align is not None and (best is None or align.score > best[0]):
+            best = (align.score, w_start + align.dest_start, w_start + align.dest_end)
+            if align.score >= 100:
+                break
+
+    if best is None:
+        return None, None, over_budget
+    return best[1], best[2], over_budget
+
 
-    return None, None
+def get_quote_position(
+    context: str, quote: str, index: Optional[ContextIndex] = None
+) -> Tuple[Optional[int], Optional[int]]:
+    # Try exact match first, then case-insensitive and normalized matches via the context index.
+    if not quote:
+        return None, None
 
+    if index is None:
+        index = ContextIndex(context)
+    start, end = index.find(quote)
+    if start is not None:
+        return start, end
+    return _fuzzy_position(index, quote)
 
-def verify_evidence_claims(result: Dict[str, Any], context: str) -> Dict[str, Any]:
+
+def verify_evidence_claims(
+    result: Dict[str, Any],
+    context: str,
+    index: Optional[ContextIndex] = None,
+    fuzzy_budget_seconds: float = FUZZY_BUDGET_SECONDS,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     # Check every quote and mark whether it was really found in the context.
+    # When stats is given it collects fuzzy attempts and the quotes that ran out of fuzzy budget.
     checked: List[Dict[str, Any]] = []
+    if index is None:
+        index = ContextIndex(context)
 
-    for claim in result.get("evidence_claims", []):
-        quote = str(claim.get("quote", "")).strip()
-        start, end = get_quote_position(context, quote)
+    claims = result.get("evidence_claims", [])
+    quotes = [str(claim.get("quote", "")).strip() for claim in claims]
+    # Locate all quotes together first; only the leftovers pay for the fuzzy fallback.
+    positions = index.find_all(quotes)
+
+    for claim, quote, (start, end) in zip(claims, quotes, positions):
+        if start is None and quote:
+            start, end = _fuzzy_position(index, quote, fuzzy_budget_seconds, stats)
 
         if start is None or end is None:
             checked.append(
@@ -84,20 +334,37 @@ def verify_evidence_claims(result: Dict[str, Any], context: str) -> Dict[str, An
     return result
 
 
-def _keyword_tokens(text: str) -> set:
-    # Small stopword list so overlap focuses on meaningful words.
-    stop = {
+# Small stopword list so overlap focuses on meaningful words.
+_STOPWORDS = frozenset(
+    {
         "the", "a", "an", "is", "are", "was", "were", "be", "to", "of", "in", "on", "for",
         "and", "or", "it", "this", "that", "with", "as", "at", "by", "from", "why", "what",
         "how", "when", "where", "who", "which", "does", "do", "did", "can", "could", "would",
         "should", "will", "you", "your", "i", "we", "they", "he", "she", "them", "his", "her",
     }
+)
+
+
+def keyword_token_list(text: str, memo: Optional[Dict[str, str]] = None) -> List[str]:
+    # Keyword tokens in order, repeats kept (term frequencies need them).
+    # memo caches the cleanup per raw word, which pays off when tokenizing a whole document.
     words = []
     for raw in text.lower().split():
-        clean = "".join(ch for ch in raw if ch.isalnum())
-        if len(clean) >= 3 and clean not in stop:
+        if memo is not None and raw in memo:
+            clean = memo[raw]
+        else:
+            clean = "".join(ch for ch in raw if ch.isalnum())
+            if len(clean) < 3 or clean in _STOPWORDS:
+                clean = ""
+            if memo is not None:
+                memo[raw] = clean
+        if clean:
             words.append(clean)
-    return set(words)
+    return words
+
+
+def _keyword_tokens(text: str) -> set:
+    return set(keyword_token_list(text))
 
 
 def add_question_relevance(result: Dict[str, Any], question: str) -> Dict[str, Any]:
@@ -178,4 +445,4 @@ def build_highlighted_context(context: str, evidence_claims: List[Dict[str, Any]
         cursor = end
 
     parts.append(html.escape(context[cursor:]))
-    return "".join(parts)
+    return "".join(parts)
@@ -0,0 +1,206 @@
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import re
+
+# Characters that may legally follow a closed string (or end the text).
+_AFTER_STRING = set(",:}]")
+_DOUBLE_QUOTES = {'"', "“", "”", "„", "‟"}
+_SINGLE_QUOTES = {"'", "‘", "’"}
+_VALID_ESCAPES = set('"\\/bfnrtu')
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_MAX_STARTS = 8
+_DOUBLE_SPECIAL = re.compile(r'["\\\x00-\x1f“”„‟]')
+_SINGLE_SPECIAL = re.compile(r"['\"\\\x00-\x1f‘’]")
+
+
+def repair_json(text: str) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Fix the mechanical mistakes local models make in JSON output and decode the first object.
+
+    Handles trailing commas, smart and single quotes, raw newlines/control characters and stray
+    quotes inside strings, invalid escapes, Python literals, and output cut off at max_tokens
+    (open strings, arrays and objects are closed). Returns the object and the names of the fixes
+    that were applied; raises ValueError when the text cannot be turned into a JSON object.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object start found.")
+
+    # A brace in preamble prose ("use the {context}") is not the object; try the next few.
+    for _ in range(_MAX_STARTS):
+        out, fixes, stack, safe = _rewrite(text, start)
+        candidates = []
+        if stack:
+            fixes.add("closed_truncated")
+            candidates.append(_close("".join(out), stack))
+            if safe is not None:
+                # Cut back to the last complete member (e.g. output stopped inside a key).
+                cut, safe_stack = safe
+                candidates.append(_close("".join(out[:cut]), list(safe_stack)))
+        else:
+            candidates.append("".join(out))
+
+        for candidate in candidates:
+            parsed = _decode(candidate)
+            if parsed is not None:
+                return parsed, sorted(fixes)
+        start = text.find("{", start + 1)
+        if start == -1:
+            break
+    raise ValueError("Local JSON repair failed.")
+
+
+def _rewrite(
+    text: str, start: int
+) -> Tuple[List[str], set, List[str], Optional[Tuple[int, Tuple[str, ...]]]]:
+    out: List[str] = []
+    fixes: set = set()
+    stack: List[str] = []
+    # (parts written, open containers) after the last complete member; used to cut truncated output.
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+    i = start
+    n = len(text)
+
+    while i < n:
+        ch = text[i]
+
+        if ch in _DOUBLE_QUOTES or (ch in _SINGLE_QUOTES and _opens_value(out)):
+            if ch != '"':
+                fixes.add("single_quotes" if ch in _SINGLE_QUOTES else "smart_quotes")
+            i = _read_string(text, i, out, fixes)
+            continue
+
+        if ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+            safe = (len(out), tuple(stack))
+        elif ch in "}]":
+            if not stack:
+                break
+            if _strip_trailing_comma(out):
+                fixes.add("trailing_commas")
+            out.append(stack.pop())
+            if ch != out[-1]:
+                fixes.add("mismatched_brackets")
+            if not stack:
+                # The top-level object is complete; ignore whatever prose follows it.
+                return out, fixes, stack, safe
+        elif ch == ",":
+            safe = (len(out), tuple(stack))
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if word in _PYTHON_LITERALS:
+                fixes.add("python_literals")
+                out.append(_PYTHON_LITERALS[word])
+            else:
+                out.append(word)
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    return out, fixes, stack, safe
+
+
+def _opens_value(out: List[str]) -> bool:
+    # A single quote only starts a string where a key or value may begin, not inside prose.
+    for part in reversed(out):
+        stripped = part.rstrip()
+        if stripped:
+            return stripped[-1] in "{[,:"
+    return False
+
+
+def _read_string(text: str, i: int, out: List[str], fixes: set) -> int:
+    # Copy one string literal starting at text[i] as a valid double-quoted JSON string.
+    opener = text[i]
+    closers = _DOUBLE_QUOTES if opener in _DOUBLE_QUOTES else _SINGLE_QUOTES
+    n = len(text)
+    parts = ['"']
+    special = _DOUBLE_SPECIAL if closers is _DOUBLE_QUOTES else _SINGLE_SPECIAL
+    i += 1
+    while i < n:
+        # Copy ordinary characters in bulk up to the next quote, backslash or control character.
+        m = special.search(text, i)
+        if m is None:
+            parts.append(text[i:])
+            break
+        if m.start() > i:
+            parts.append(text[i : m.start()])
+            i = m.start()
+        ch = text[i]
+        if ch == "\\":
+            nxt = text[i + 1] if i + 1 < n else ""
+            if nxt in _VALID_ESCAPES and nxt:
+                parts.append(ch + nxt)
+                i += 2
+                continue
+            if nxt == "'":
+                parts.append("'")
+                i += 2
+                continue
+            fixes.add("invalid_escapes")
+            parts.append("\\\\")
+            i += 1
+            continue
+        if ch in closers:
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j >= n or text[j] in _AFTER_STRING:
+                parts.append('"')
+                out.append("".join(parts))
+                return i + 1
+            # A quote in the middle of the text was meant literally.
+            fixes.add("escaped_inner_quotes")
+            parts.append('\\"' if ch == '"' else ch)
+            i += 1
+            continue
+        if ch == '"':
+            # Literal double quote inside a single- or smart-quoted string.
+            parts.append('\\"')
+        elif ch < " ":
+            fixes.add("escaped_control_chars")
+            parts.append(_CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+        else:
+            parts.append(ch)
+        i += 1
+
+    # Output ended inside the string.
+    parts.append('"')
+    out.append("".join(parts))
+    return n
+
+
+def _strip_trailing_comma(out: List[str]) -> bool:
+    j = len(out) - 1
+    while j >= 0 and not out[j].strip():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+        return True
+    return False
+
+
+def _close(body: str, stack: List[str]) -> str:
+    body = body.rstrip()
+    while body.endswith(","):
+        body = body[:-1].rstrip()
+    if body.endswith(":"):
+        # Key written but value never started.
+        body += " null"
+    return body + "".join(reversed(stack))
+
+
+def _decode(candidate: str) -> Optional[Dict[str, Any]]:
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
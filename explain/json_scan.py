@@ -0,0 +1,127 @@
+from typing import Any, Dict, List, Optional, Tuple, Union
+import codecs
+import json
+import re
+
+# Outside any object only "{" matters; inside one, braces and string delimiters do.
+_OBJECT_CHARS = re.compile(r'[{}"]')
+_STRING_CHARS = re.compile(r'["\\]')
+
+
+class JsonObjectScanner:
+    """
+    Single-pass scanner for JSON objects embedded in model output.
+
+    Text can be fed in chunks (str or UTF-8 bytes); each chunk is scanned once and never revisited.
+    Every balanced {...} span is remembered as a candidate, and the first top-level span that decodes
+    to a dict is returned as soon as it closes. Preamble braces that are not valid JSON are skipped.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._joined = ""
+        self._length = 0
+        self._stack: List[int] = []
+        self._in_string = False
+        self._escape = False
+        self._closed: List[Tuple[int, int]] = []
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.result: Optional[Dict[str, Any]] = None
+
+    def feed(self, chunk: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+        if self.result is not None:
+            return self.result
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        if not chunk:
+            return None
+
+        base = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+
+        pos = 0
+        n = len(chunk)
+        if self._escape:
+            self._escape = False
+            pos = 1
+
+        while pos < n:
+            if self._in_string:
+                m = _STRING_CHARS.search(chunk, pos)
+                if m is None:
+                    break
+                if m.group() == "\\":
+                    if m.end() >= n:
+                        # Escaped character arrives with the next chunk.
+                        self._escape = True
+                        break
+                    pos = m.end() + 1
+                else:
+                    self._in_string = False
+                    pos = m.end()
+                continue
+
+            if not self._stack:
+                i = chunk.find("{", pos)
+                if i == -1:
+                    break
+                self._stack.append(base + i)
+                pos = i + 1
+                continue
+
+            m = _OBJECT_CHARS.search(chunk, pos)
+            if m is None:
+                break
+            ch = m.group()
+            pos = m.end()
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._stack.append(base + m.start())
+            else:
+                start = self._stack.pop()
+                end = base + pos
+                self._closed.append((start, end))
+                if not self._stack:
+                    parsed = self._decode(start, end)
+                    if parsed is not None:
+                        self.result = parsed
+                        return parsed
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        # End of input: fall back to nested candidates (e.g. a real object after an unclosed preamble brace).
+        if self.result is not None:
+            return self.result
+        tail = self._decoder.decode(b"", final=True)
+        if tail:
+            found = self.feed(tail)
+            if found is not None:
+                return found
+
+        for start, end in sorted(self._closed, key=lambda span: (span[0], -span[1])):
+            parsed = self._decode(start, end)
+            if parsed is not None:
+                self.result = parsed
+                return parsed
+        raise ValueError("No JSON object found.")
+
+    def _text(self) -> str:
+        if len(self._joined) != self._length:
+            self._joined = "".join(self._parts)
+            self._parts = [self._joined]
+        return self._joined
+
+    def _decode(self, start: int, end: int) -> Optional[Dict[str, Any]]:
+        try:
+            parsed = json.loads(self._text()[start:end])
+        except json.JSONDecodeError:
+            return None
+        return parsed if isinstance(parsed, dict) else None
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    scanner = JsonObjectScanner()
+    found = scanner.feed(text)
+    return found if found is not None else scanner.finish()
@@ -1,42 +1,39 @@
-﻿from typing import Any, Dict, List
+﻿from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
+import asyncio
 import json
+import time
 
-from explain.prompts import SYSTEM_PROMPT, SCHEMA_INSTRUCTIONS, build_user_prompt, build_critique_prompt
-from explain.schemas import default_result, normalize_result
-from explain.highlight import verify_evidence_claims, add_question_relevance, adjust_confidence, build_highlighted_context
+from explain.prompts import (
+    SYSTEM_PROMPT,
+    SCHEMA_INSTRUCTIONS,
+    build_user_prompt,
+    build_critique_prompt,
+    build_reduce_prompt,
+)
+from explain.schemas import RESULT_JSON_SCHEMA, default_result, normalize_result
+from explain.highlight import (
+    FUZZY_BUDGET_SECONDS,
+    ContextIndex,
+    verify_evidence_claims,
+    add_question_relevance,
+    adjust_confidence,
+    build_highlighted_context,
+)
+from explain.budget import LOADED_WINDOWS, LoadedWindows, TokenBudget, window_key
+from explain.coalesce import SHARED_FLIGHTS, Abandoned, SingleFlight, flight_key
+from explain.json_repair import repair_json
+from explain.json_scan import JsonObjectScanner, extract_json_object
+from explain.retrieval import RetrievedContext, pack_context, retrieve_context
+from explain.streaming import StreamingResultParser
+from llm import create_client
+from llm.cache import get_response_cache
+from llm.client_base import ChatResult, ResponseFormat, merge_results
 from utils.logging import build_trace_log
-
-
-def _extract_balanced_json_object(text: str) -> str:
-    start = text.find("{")
-    if start == -1:
-        raise ValueError("No JSON object start found.")
-
-    depth = 0
-    in_string = False
-    escape = False
-
-    for i in range(start, len(text)):
-        ch = text[i]
-        if in_string:
-            if escape:
-                escape = False
-            elif ch == "\\":
-                escape = True
-            elif ch == '"':
-                in_string = False
-            continue
-
-        if ch == '"':
-            in_string = True
-        elif ch == "{":
-            depth += 1
-        elif ch == "}":
-            depth -= 1
-            if depth == 0:
-                return text[start : i + 1]
-
-    raise ValueError("No balanced JSON object found.")
+from utils.metrics import COALESCED_RUNS, observe_llm_call, observe_pipeline_run
+from utils.text import chunk_spans
+from utils.timing import StageTimer
 
 
 def get_json_from_text(text: str) -> Dict[str, Any]:
@@ -48,18 +45,48 @@ def get_json_from_text(text: str) -> Dict[str, Any]:
     except json.JSONDecodeError:
         pass
 
-    # If model wrapped JSON in extra text, pull the first balanced JSON object.
+    # If model wrapped JSON in extra text, pull the first embedded object that decodes to a dict.
     try:
-        candidate = _extract_balanced_json_object(text)
-        parsed = json.loads(candidate)
-        if isinstance(parsed, dict):
-            return parsed
-    except (ValueError, json.JSONDecodeError):
+        return extract_json_object(text)
+    except ValueError:
         pass
 
     raise ValueError("Could not parse JSON object from LLM output.")
 
 
+def parse_model_json(text: str, steps: List[str], label: str) -> Tuple[Dict[str, Any], List[str]]:
+    # Complete top-level object first, then local mechanical repair before anyone asks the model again.
+    # Repair runs before the scanner's nested-object fallback, which on truncated output would return
+    # a single evidence claim as if it were the whole result.
+    # Returns the object and the local fixes applied (also recorded in steps for the trace).
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed, []
+    except json.JSONDecodeError:
+        pass
+    scanner = JsonObjectScanner()
+    found = scanner.feed(text)
+    if found is not None:
+        return found, []
+
+    try:
+        parsed, fixes = repair_json(text)
+    except ValueError:
+        return scanner.finish(), []
+    steps.append(f"local_json_repair:{label}:{','.join(fixes) or 'none'}")
+    return parsed, fixes
+
+
+def reply_text(reply: ChatResult, steps: List[str], label: str, calls: List[Dict[str, Any]]) -> str:
+    # Note continuations so the trace shows where a length stop was resumed instead of regenerated,
+    # and keep the call's server timing and token counts for the trace.
+    if reply.continuations:
+        steps.append(f"continued:{label}:{reply.continuations}")
+    calls.append({"call": label, **reply.stats()})
+    return reply.text
+
+
 def combine_unique_items(base: List[str], extra: List[str]) -> List[str]:
     # Keep order, remove duplicates (case-insensitive).
     seen = set()
@@ -73,9 +100,100 @@ def combine_unique_items(base: List[str], extra: List[str]) -> List[str]:
     return out
 
 
+@dataclass
+class LLMCall:
+    # One model request yielded by the pipeline flow; the driver decides how to send it.
+    kind: str
+    messages: List[Dict[str, str]]
+    temperature: float
+    max_tokens: int
+    num_ctx: Optional[int] = None
+    response_format: ResponseFormat = None
+
+
+# A flow yields either one LLMCall (and receives its ChatResult) or a list of calls that may run
+# concurrently (and receives a list with a ChatResult or the raised exception for each).
+PipelineFlow = Generator[Union[LLMCall, List[LLMCall]], Any, Dict[str, Any]]
+
+
+def _failure_result(exc: Exception) -> Dict[str, Any]:
+    # If anything fails, return a safe low-confidence response.
+    result = default_result()
+    result["answer"] = "Unable to produce a reliable answer from the local model."
+    result["uncertainty"] = [f"Pipeline error: {exc}"]
+    result["confidence"] = "low"
+    result["confidence_reason"] = "Local model call or JSON parsing failed."
+    result["evidence_claims"] = []
+    return result
+
+
+def dedupe_claims(claims: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Drop claims whose span mostly overlaps one already kept (same quote seen by two overlapping chunks).
+    kept: List[Dict[str, Any]] = []
+    for claim in sorted(claims, key=lambda c: (c["start"], -(c["end"] - c["start"]))):
+        duplicate = False
+        for other in kept:
+            shared = min(claim["end"], other["end"]) - max(claim["start"], other["start"])
+            shorter = min(claim["end"] - claim["start"], other["end"] - other["start"])
+            if shared > 0 and shared * 2 >= shorter:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(claim)
+    return kept
+
+
+def _step(advance: Callable[[Any], Any], value: Any) -> Tuple[bool, Any]:
+    # Advance a flow by one call: (False, next call) or (True, result). StopIteration cannot be
+    # raised out of asyncio.to_thread, so the finished state comes back as a value.
+    try:
+        return False, advance(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
 class ExplainerPipeline:
-    def __init__(self, client):
+    def __init__(
+        self,
+        client,
+        fuzzy_budget_seconds: float = FUZZY_BUDGET_SECONDS,
+        workers: int = 1,
+        long_context_chars: int = 0,
+        chunk_chars: int = 6000,
+        chunk_overlap: int = 400,
+        retrieval_top_k: int = 0,
+        retrieval_span_chars: int = 1200,
+        budget: Optional[TokenBudget] = None,
+        structured_output: bool = True,
+        max_continuations: int = 2,
+        coalesce: bool = False,
+        flights: Optional[SingleFlight] = None,
+        windows: Optional[LoadedWindows] = None,
+    ):
         self.client = client
+        self.fuzzy_budget_seconds = fuzzy_budget_seconds
+        # Concurrent model calls allowed within one run (match the backend's parallel slots).
+        self.workers = max(1, int(workers))
+        # Contexts longer than this go through map-reduce over chunks, if they also overflow the token
+        # budget (when one is set); 0 disables the long-context mode.
+        self.long_context_chars = long_context_chars
+        self.chunk_chars = chunk_chars
+        self.chunk_overlap = chunk_overlap
+        # Send only the top-k BM25 passages for the question instead of the whole context; 0 disables.
+        self.retrieval_top_k = retrieval_top_k
+        self.retrieval_span_chars = retrieval_span_chars
+        # Sizes num_ctx and packs the context ahead of time; None leaves the server default window.
+        self.budget = budget
+        # num_ctx only ever grows per backend (process-wide unless windows is given), so calls and
+        # runs of different sizes do not make Ollama reload the model between them.
+        self.windows = windows if windows is not None else LOADED_WINDOWS
+        # Constrain decoding with the result JSON Schema; False falls back to plain JSON mode.
+        self.structured_output = structured_output
+        # Follow-up requests allowed when a reply stops at max_tokens; 0 leaves truncation to local repair.
+        self.max_continuations = max(0, int(max_continuations))
+        # Identical concurrent run()/arun() calls share one computation (process-wide unless flights is given).
+        self.coalesce = coalesce
+        self.flights = flights if flights is not None else SHARED_FLIGHTS
 
     def run(
         self,
@@ -85,6 +203,432 @@ class ExplainerPipeline:
         max_tokens: int,
         critique_pass: bool = False,
     ) -> Dict[str, Any]:
+        def compute() -> Dict[str, Any]:
+            return self._drive(self._select_flow(question, context, temperature, max_tokens, critique_pass))
+
+        if not self.coalesce:
+            return compute()
+        key = flight_key(question, context, self._settings(temperature, max_tokens, critique_pass))
+        result, info = self.flights.do(key, compute)
+        COALESCED_RUNS.inc(role=info["role"])
+        # Followers get the leader's trace too; this entry says which of the two this copy is.
+        result["trace_log"]["coalescing"] = info
+        return result
+
+    def _settings(self, temperature: float, max_tokens: int, critique_pass: bool) -> Dict[str, Any]:
+        # Everything besides question and context that can change the result.
+        meta = self.client.metadata()
+        return {
+            "backend": (meta.get("client"), meta.get("base_url"), meta.get("model")),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "critique_pass": critique_pass,
+            "fuzzy_budget_seconds": self.fuzzy_budget_seconds,
+            "long_context": (self.long_context_chars, self.chunk_chars, self.chunk_overlap),
+            "retrieval": (self.retrieval_top_k, self.retrieval_span_chars),
+            "budget": None if self.budget is None else vars(self.budget),
+            "structured_output": self.structured_output,
+            "max_continuations": self.max_continuations,
+        }
+
+    async def arun(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool = False,
+    ) -> Dict[str, Any]:
+        # Same flow as run(), but every model call is awaited on the running event loop. Retrieval,
+        # parsing and evidence matching are CPU-bound, so they run in a worker thread instead.
+        async def compute() -> Dict[str, Any]:
+            flow = await asyncio.to_thread(
+                self._select_flow, question, context, temperature, max_tokens, critique_pass
+            )
+            return await self._adrive(flow)
+
+        if not self.coalesce:
+            return await compute()
+        # Same flights as run(), so async and blocking duplicates of one request also meet.
+        key = flight_key(question, context, self._settings(temperature, max_tokens, critique_pass))
+        result, info = await self.flights.ado(key, compute)
+        COALESCED_RUNS.inc(role=info["role"])
+        result["trace_log"]["coalescing"] = info
+        return result
+
+    def run_stream(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool = False,
+    ) -> Iterator[Dict[str, Any]]:
+        # Stream the primary call and emit partial results while the model is still generating:
+        #   {"event": "field", "name": ..., "value": ...}  top-level string fields (e.g. "answer")
+        #   {"event": "claim", "index": i, "claim": {...}}   each evidence claim, already verified
+        #   {"event": "result", "result": {...}}           the final result, same as run()
+        # A coalesced duplicate of a run already in flight only receives the final result event.
+        if not self.coalesce:
+            yield from self._run_stream(question, context, temperature, max_tokens, critique_pass)
+            return
+
+        key = flight_key(question, context, self._settings(temperature, max_tokens, critique_pass))
+        while True:
+            flight, leader = self.flights.begin(key)
+            if leader:
+                break
+            try:
+                result, info = self.flights.wait(flight)
+            except Abandoned:
+                continue
+            COALESCED_RUNS.inc(role="follower")
+            result["trace_log"]["coalescing"] = info
+            yield {"event": "result", "result": result}
+            return
+
+        finished = False
+        try:
+            for event in self._run_stream(question, context, temperature, max_tokens, critique_pass):
+                if event["event"] == "result":
+                    info = self.flights.finish(flight, event["result"])
+                    finished = True
+                    COALESCED_RUNS.inc(role="leader")
+                    event["result"]["trace_log"]["coalescing"] = info
+                yield event
+        finally:
+            if not finished:
+                # Consumer stopped early or the stream failed: let the followers run it themselves.
+                self.flights.finish(flight, error=Abandoned())
+
+    def _run_stream(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool,
+    ) -> Iterator[Dict[str, Any]]:
+        index = ContextIndex(context)
+        flow = self._select_flow(question, context, temperature, max_tokens, critique_pass, index)
+        try:
+            call = next(flow)
+            while True:
+                if isinstance(call, list):
+                    call = flow.send(self._send_many(call))
+                    continue
+                try:
+                    if call.kind == "primary":
+                        reply = yield from self._stream_primary(call, context, index)
+                    else:
+                        reply = self._send(call)
+                except Exception as exc:
+                    call = flow.throw(exc)
+                else:
+                    call = flow.send(reply)
+        except StopIteration as stop:
+            yield {"event": "result", "result": stop.value}
+
+    def _stream_primary(
+        self, call: LLMCall, context: str, index: ContextIndex
+    ) -> Generator[Dict[str, Any], None, ChatResult]:
+        # Stream one call (and any continuations) through the incremental parser; returns the merged reply.
+        parser = StreamingResultParser()
+        claim_index = 0
+        result: Optional[ChatResult] = None
+        current = call
+        while True:
+            parts: List[str] = []
+            started = time.monotonic()
+            stream = self.client.stream_chat(
+                current.messages,
+                temperature=current.temperature,
+                max_tokens=current.max_tokens,
+                num_ctx=current.num_ctx,
+                response_format=current.response_format,
+            )
+            while True:
+                try:
+                    chunk = next(stream)
+                except StopIteration as stop:
+                    piece = stop.value if stop.value is not None else ChatResult("".join(parts))
+                    break
+                except Exception:
+                    observe_llm_call(current.kind, time.monotonic() - started, error=True)
+                    raise
+                parts.append(chunk)
+                for kind, payload in parser.feed(chunk):
+                    if kind == "field":
+                        yield {"event": "field", "name": payload[0], "value": payload[1]}
+                        continue
+                    partial = normalize_result({"evidence_claims": [payload]})
+                    for claim in verify_evidence_claims(partial, context, index, self.fuzzy_budget_seconds)[
+                        "evidence_claims"
+                    ]:
+                        yield {"event": "claim", "index": claim_index, "claim": claim}
+                        claim_index += 1
+            observe_llm_call(current.kind, time.monotonic() - started, piece)
+            result = piece if result is None else merge_results(result, piece)
+            if not self._should_continue(result):
+                return result
+            # The continuation's text extends the same JSON, so the parser simply keeps going.
+            current = self._continuation(call, result)
+
+    def _json_call(
+        self,
+        kind: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+    ) -> LLMCall:
+        # Every pipeline call expects the result object, so all of them share one output constraint.
+        response_format = RESULT_JSON_SCHEMA if self.structured_output else "json"
+        return LLMCall(kind, messages, temperature, max_tokens, num_ctx, response_format)
+
+    def _should_continue(self, result: ChatResult) -> bool:
+        # Only backends that continue a trailing assistant turn; elsewhere a fresh reply would be glued
+        # onto the cut-off JSON, so the truncated text is left to local repair instead.
+        return (
+            result.truncated
+            and result.continuations < self.max_continuations
+            and self.client.supports_prefill
+        )
+
+    def _continuation(self, call: LLMCall, partial: ChatResult) -> LLMCall:
+        # Resume a reply cut off at max_tokens: send the partial text back as the assistant turn so the
+        # model writes only the missing tail. No response_format, since a grammar would restart the object.
+        messages = call.messages + [{"role": "assistant", "content": partial.text}]
+        num_ctx = self._num_ctx(messages, max_tokens=call.max_tokens) if call.num_ctx else None
+        return LLMCall(f"{call.kind}_continue", messages, call.temperature, call.max_tokens, num_ctx)
+
+    def _send(self, call: LLMCall) -> ChatResult:
+        result = self._send_once(call)
+        while self._should_continue(result):
+            result = merge_results(result, self._send_once(self._continuation(call, result)))
+        return result
+
+    def _send_once(self, call: LLMCall) -> ChatResult:
+        started = time.monotonic()
+        try:
+            result = self.client.chat_with_meta(
+                call.messages,
+                temperature=call.temperature,
+                max_tokens=call.max_tokens,
+                num_ctx=call.num_ctx,
+                response_format=call.response_format,
+            )
+        except Exception:
+            observe_llm_call(call.kind, time.monotonic() - started, error=True)
+            raise
+        observe_llm_call(call.kind, time.monotonic() - started, result)
+        return result
+
+    def _send_many(self, calls: List[LLMCall]) -> List[Any]:
+        # Run independent calls on up to self.workers threads; failures are returned, not raised.
+        def attempt(call: LLMCall) -> Any:
+            try:
+                return self._send(call)
+            except Exception as exc:
+                return exc
+
+        if len(calls) <= 1 or self.workers <= 1:
+            return [attempt(call) for call in calls]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(calls)), thread_name_prefix="bbe-map") as pool:
+            return list(pool.map(attempt, calls))
+
+    async def _asend(self, call: LLMCall) -> ChatResult:
+        result = await self._asend_once(call)
+        while self._should_continue(result):
+            result = merge_results(result, await self._asend_once(self._continuation(call, result)))
+        return result
+
+    async def _asend_once(self, call: LLMCall) -> ChatResult:
+        started = time.monotonic()
+        try:
+            result = await self.client.achat_with_meta(
+                call.messages,
+                temperature=call.temperature,
+                max_tokens=call.max_tokens,
+                num_ctx=call.num_ctx,
+                response_format=call.response_format,
+            )
+        except Exception:
+            observe_llm_call(call.kind, time.monotonic() - started, error=True)
+            raise
+        observe_llm_call(call.kind, time.monotonic() - started, result)
+        return result
+
+    async def _asend_many(self, calls: List[LLMCall]) -> List[Any]:
+        slots = asyncio.Semaphore(self.workers)
+
+        async def attempt(call: LLMCall) -> Any:
+            async with slots:
+                try:
+                    return await self._asend(call)
+                except Exception as exc:
+                    return exc
+
+        return list(await asyncio.gather(*(attempt(call) for call in calls)))
+
+    def _drive(self, flow: PipelineFlow) -> Dict[str, Any]:
+        # Feed each requested call through the blocking client until the flow returns a result.
+        try:
+            call = next(flow)
+            while True:
+                if isinstance(call, list):
+                    call = flow.send(self._send_many(call))
+                    continue
+                try:
+                    reply = self._send(call)
+                except Exception as exc:
+                    call = flow.throw(exc)
+                else:
+                    call = flow.send(reply)
+        except StopIteration as stop:
+            return stop.value
+
+    async def _adrive(self, flow: PipelineFlow) -> Dict[str, Any]:
+        # Only the model calls are awaited here; the flow itself advances in a worker thread so one
+        # large context (index build, fuzzy matching, highlighting) does not stall the event loop.
+        done, value = await asyncio.to_thread(_step, flow.send, None)
+        while not done:
+            if isinstance(value, list):
+                done, value = await asyncio.to_thread(_step, flow.send, await self._asend_many(value))
+                continue
+            try:
+                reply = await self._asend(value)
+            except Exception as exc:
+                done, value = await asyncio.to_thread(_step, flow.throw, exc)
+            else:
+                done, value = await asyncio.to_thread(_step, flow.send, reply)
+        return value
+
+    def _needs_map_reduce(self, question: str, context: str, max_tokens: int) -> bool:
+        # Map-reduce costs a call per chunk and drops the critique pass, so with a token budget it is
+        # only used when the whole context would not fit in one call at ctx_max.
+        if self.long_context_chars <= 0 or len(context) <= self.long_context_chars:
+            return False
+        if self.budget is None:
+            return True
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_user_prompt(question, context)},
+        ]
+        return not self.budget.fits(self.budget.prompt_tokens(messages), max_tokens)
+
+    def _select_flow(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool,
+        index: Optional[ContextIndex] = None,
+    ) -> PipelineFlow:
+        timer = StageTimer()
+        retrieved = None
+        if self.retrieval_top_k > 0:
+            with timer.stage("retrieval"):
+                retrieved = retrieve_context(context, question, self.retrieval_top_k, self.retrieval_span_chars)
+        if retrieved is None and self._needs_map_reduce(question, context, max_tokens):
+            return self._long_context_flow(question, context, temperature, max_tokens, critique_pass, timer)
+        return self._flow(question, context, temperature, max_tokens, critique_pass, index, retrieved, timer)
+
+    def _finish(
+        self,
+        result: Dict[str, Any],
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        steps: List[str],
+        raw_text: str,
+        verification: Dict[str, Any],
+        retrieval: Optional[Dict[str, Any]] = None,
+        budget: Optional[Dict[str, Any]] = None,
+        timer: Optional[StageTimer] = None,
+        llm_calls: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        # Prepare UI extras.
+        timer = timer or StageTimer()
+        with timer.stage("highlight"):
+            result["highlighted_context"] = build_highlighted_context(context, result.get("evidence_claims", []))
+        timings = timer.report()
+        result["trace_log"] = build_trace_log(
+            backend_meta=self.client.metadata(),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            steps=steps,
+            raw_preview=raw_text[:500] if raw_text else "",
+            verification=verification,
+            retrieval=retrieval,
+            budget=budget,
+            timings=timings,
+            llm_calls=llm_calls,
+        )
+        mode = "map_reduce" if steps and steps[0].startswith("chunk_context") else "single"
+        observe_pipeline_run(mode, timings["total_seconds"], result, steps)
+        return result
+
+    def _num_ctx(self, *message_lists: List[Dict[str, str]], max_tokens: int) -> Optional[int]:
+        # One window for all the given calls, never smaller than the one already loaded.
+        if self.budget is None:
+            return None
+        size = max(self.budget.num_ctx(self.budget.prompt_tokens(m), max_tokens) for m in message_lists)
+        return self.windows.claim(window_key(self.client), size)
+
+    def _budget_report(
+        self, message_lists: List[List[Dict[str, str]]], max_tokens: int, num_ctx: Optional[int]
+    ) -> Dict[str, Any]:
+        # Same fields as _fit_context's report, for calls whose prompt is not packed (largest one counts).
+        tokens = max(self.budget.prompt_tokens(m) for m in message_lists)
+        report: Dict[str, Any] = {"ctx_max": self.budget.ctx_max, "prompt_tokens_est": tokens, "num_ctx": num_ctx}
+        if not self.budget.fits(tokens, max_tokens):
+            report["over_budget"] = True
+        return report
+
+    def _fit_context(
+        self,
+        build_messages: Callable[[str], List[Dict[str, str]]],
+        question: str,
+        context: str,
+        prompt_context: str,
+        max_tokens: int,
+    ) -> Tuple[str, Optional[int], Optional[Dict[str, Any]]]:
+        # Make the prompt fit the largest allowed window before sending it, instead of letting the
+        # server cut it from the front (which loses the system prompt and schema).
+        if self.budget is None:
+            return prompt_context, None, None
+        tokens = self.budget.prompt_tokens(build_messages(prompt_context))
+        report: Dict[str, Any] = {"ctx_max": self.budget.ctx_max}
+        if not self.budget.fits(tokens, max_tokens):
+            fixed = self.budget.prompt_tokens(build_messages(""))
+            packed = pack_context(
+                context, question, self.budget.context_chars(fixed, max_tokens), self.retrieval_span_chars
+            )
+            if packed is not None:
+                prompt_context = packed.prompt_context
+                tokens = self.budget.prompt_tokens(build_messages(prompt_context))
+                report["dropped"] = packed.stats(context)
+        report["prompt_tokens_est"] = tokens
+        report["num_ctx"] = self.windows.claim(window_key(self.client), self.budget.num_ctx(tokens, max_tokens))
+        if not self.budget.fits(tokens, max_tokens):
+            report["over_budget"] = True
+        return prompt_context, report["num_ctx"], report
+
+    def _flow(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool,
+        index: Optional[ContextIndex] = None,
+        retrieved: Optional[RetrievedContext] = None,
+        timer: Optional[StageTimer] = None,
+    ) -> PipelineFlow:
+        # Pipeline logic as a generator: it yields LLMCall requests and receives the reply text back.
+        # Keeping it I/O-free lets run() and arun() share one implementation.
         steps = [
             "llm_primary_call",
             "parse_json",
@@ -93,17 +637,43 @@ class ExplainerPipeline:
             "adjust_confidence",
         ]
         raw_text = ""
+        verification: Dict[str, Any] = {}
+        # The model may only see the retrieved passages; evidence is still verified against the full
+        # context, so offsets and highlights stay in original coordinates.
+        prompt_context = context
+        retrieval = None
+        if retrieved is not None:
+            steps.insert(0, "bm25_retrieval")
+            prompt_context = retrieved.prompt_context
+            retrieval = retrieved.stats(context)
+        budget: Dict[str, Any] = {}
+        timer = timer or StageTimer()
+        calls: List[Dict[str, Any]] = []
 
         try:
             # 1) Ask model for structured JSON answer.
-            primary_messages = [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": build_user_prompt(question, context)},
-            ]
-            raw_text = self.client.chat(primary_messages, temperature=temperature, max_tokens=max_tokens)
+            def primary_messages_for(ctx: str) -> List[Dict[str, str]]:
+                return [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": build_user_prompt(question, ctx)},
+                ]
+
+            with timer.stage("fit_context"):
+                prompt_context, num_ctx, report = self._fit_context(
+                    primary_messages_for, question, context, prompt_context, max_tokens
+                )
+            if report is not None:
+                budget["primary"] = report
+                if "dropped" in report:
+                    steps.insert(0, "pack_context")
+            primary_messages = primary_messages_for(prompt_context)
+            with timer.stage("primary_call"):
+                reply = yield self._json_call("primary", primary_messages, temperature, max_tokens, num_ctx)
+            raw_text = reply_text(reply, steps, "primary", calls)
 
             try:
-                result = normalize_result(get_json_from_text(raw_text))
+                with timer.stage("parse_json"):
+                    parsed, fixes = parse_model_json(raw_text, steps, "primary")
             except ValueError:
                 # Retry once by asking model to convert prior output into strict JSON only.
                 steps.append("llm_json_repair_call")
@@ -122,25 +692,40 @@ class ExplainerPipeline:
                         ),
                     },
                 ]
-                repaired = self.client.chat(repair_messages, temperature=0.0, max_tokens=max_tokens)
-                result = normalize_result(get_json_from_text(repaired))
+                with timer.stage("repair_call"):
+                    num_ctx = self._num_ctx(repair_messages, max_tokens=max_tokens)
+                    repaired = yield self._json_call("repair", repair_messages, 0.0, max_tokens, num_ctx)
+                parsed, fixes = parse_model_json(reply_text(repaired, steps, "repair", calls), steps, "repair")
+            result = normalize_result(parsed)
+            if "closed_truncated" in fixes:
+                result["uncertainty"].append(
+                    "The model output was cut off at the token limit; some fields may be incomplete."
+                )
 
             if critique_pass:
                 steps.append("llm_critique_call")
                 # 2) Optional second pass to improve assumptions/uncertainty.
-                critique_messages = [
-                    {"role": "system", "content": SYSTEM_PROMPT},
-                    {
-                        "role": "user",
-                        "content": build_critique_prompt(
-                            question,
-                            context,
-                            json.dumps(result, ensure_ascii=False),
-                        ),
-                    },
-                ]
-                critique_raw = self.client.chat(critique_messages, temperature=temperature, max_tokens=max_tokens)
-                critique = normalize_result(get_json_from_text(critique_raw))
+                first_json = json.dumps(result, ensure_ascii=False)
+
+                def critique_messages_for(ctx: str) -> List[Dict[str, str]]:
+                    return [
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": build_critique_prompt(question, ctx, first_json)},
+                    ]
+
+                # The prior JSON takes room too, so the critique prompt may need a tighter pack.
+                critique_context, num_ctx, report = self._fit_context(
+                    critique_messages_for, question, context, prompt_context, max_tokens
+                )
+                if report is not None:
+                    budget["critique"] = report
+                critique_messages = critique_messages_for(critique_context)
+                with timer.stage("critique_call"):
+                    critique_reply = yield self._json_call(
+                        "critique", critique_messages, temperature, max_tokens, num_ctx
+                    )
+                critique_raw = reply_text(critique_reply, steps, "critique", calls)
+                critique = normalize_result(parse_model_json(critique_raw, steps, "critique")[0])
 
                 result["assumptions"] = combine_unique_items(
                     result.get("assumptions", []), critique.get("assumptions", [])
@@ -163,26 +748,217 @@ class ExplainerPipeline:
                     result["confidence_reason"] = critique["confidence_reason"]
 
             # 3) Deterministic checks: verify evidence + question relevance + adjust confidence.
-            result = verify_evidence_claims(result, context)
-            result = add_question_relevance(result, question)
-            result = adjust_confidence(result)
+            with timer.stage("verify_evidence"):
+                result = verify_evidence_claims(result, context, index, self.fuzzy_budget_seconds, verification)
+            with timer.stage("relevance_confidence"):
+                result = add_question_relevance(result, question)
+                result = adjust_confidence(result)
 
         except Exception as exc:
-            # If anything fails, return a safe low-confidence response.
-            result = default_result()
-            result["answer"] = "Unable to produce a reliable answer from the local model."
-            result["uncertainty"] = [f"Pipeline error: {exc}"]
-            result["confidence"] = "low"
-            result["confidence_reason"] = "Local model call or JSON parsing failed."
-            result["evidence_claims"] = []
+            result = _failure_result(exc)
 
         # 4) Prepare UI extras.
-        result["highlighted_context"] = build_highlighted_context(context, result.get("evidence_claims", []))
-        result["trace_log"] = build_trace_log(
-            backend_meta=self.client.metadata(),
-            temperature=temperature,
-            max_tokens=max_tokens,
-            steps=steps,
-            raw_preview=raw_text[:500] if raw_text else "",
+        return self._finish(
+            result, context, temperature, max_tokens, steps, raw_text, verification, retrieval, budget, timer, calls
         )
-        return result
+
+    def _long_context_flow(
+        self,
+        question: str,
+        context: str,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool,
+        timer: Optional[StageTimer] = None,
+    ) -> PipelineFlow:
+        # Map-reduce for contexts larger than the model window: extract evidence from overlapping chunks
+        # concurrently, remap it to global offsets, then merge the chunk answers with one reduce call.
+        spans = chunk_spans(context, self.chunk_chars, self.chunk_overlap)
+        steps = [f"chunk_context:{len(spans)}", "llm_map_calls", "verify_evidence", "dedupe_overlap"]
+        if critique_pass:
+            # The critique prompt needs the whole context, which is what this mode avoids.
+            steps.append("critique_skipped_long_context")
+        raw_text = ""
+        verification: Dict[str, Any] = {}
+        budget: Dict[str, Any] = {}
+        timer = timer or StageTimer()
+        calls: List[Dict[str, Any]] = []
+
+        try:
+            map_messages = [
+                [
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": build_user_prompt(question, context[start:end])},
+                ]
+                for start, end in spans
+            ]
+            # All chunks share the window of the largest one, so they can run side by side without a reload.
+            num_ctx = self._num_ctx(*map_messages, max_tokens=max_tokens)
+            if self.budget is not None:
+                budget["map"] = self._budget_report(map_messages, max_tokens, num_ctx)
+            map_calls = [
+                self._json_call("map", messages, temperature, max_tokens, num_ctx) for messages in map_messages
+            ]
+            with timer.stage("map_calls"):
+                replies = yield map_calls
+
+            findings: List[Dict[str, Any]] = []
+            claims: List[Dict[str, Any]] = []
+            with timer.stage("parse_verify_chunks"):
+                for i, ((start, end), reply) in enumerate(zip(spans, replies)):
+                    if isinstance(reply, Exception):
+                        steps.append(f"map_call_failed:{i}")
+                        continue
+                    label = f"map_{i}"
+                    try:
+                        raw_part = reply_text(reply, steps, label, calls)
+                        part = normalize_result(parse_model_json(raw_part, steps, label)[0])
+                    except ValueError:
+                        steps.append(f"map_parse_failed:{i}")
+                        continue
+
+                    part = verify_evidence_claims(
+                        part, context[start:end], fuzzy_budget_seconds=self.fuzzy_budget_seconds, stats=verification
+                    )
+                    for claim in part["evidence_claims"]:
+                        if claim["verified"]:
+                            claim["start"] += start
+                            claim["end"] += start
+                            claims.append(claim)
+                    findings.append(
+                        {
+                            "chunk": i,
+                            "answer": part["answer"],
+                            "assumptions": part["assumptions"],
+                            "uncertainty": part["uncertainty"],
+                            "confidence": part["confidence"],
+                            "evidence": [
+                                {"claim": c["claim"], "quote": c["quote"]}
+                                for c in part["evidence_claims"]
+                                if c["verified"]
+                            ],
+                        }
+                    )
+
+            if not findings:
+                raise ValueError("No chunk produced a usable answer.")
+            claims = dedupe_claims(claims)
+
+            steps.append("llm_reduce_call")
+            reduce_messages = [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": build_reduce_prompt(question, json.dumps(findings, ensure_ascii=False)),
+                },
+            ]
+            with timer.stage("reduce_call"):
+                num_ctx = self._num_ctx(reduce_messages, max_tokens=max_tokens)
+                if self.budget is not None:
+                    budget["reduce"] = self._budget_report([reduce_messages], max_tokens, num_ctx)
+                reply = yield self._json_call("reduce", reduce_messages, temperature, max_tokens, num_ctx)
+            raw_text = reply_text(reply, steps, "reduce", calls)
+            try:
+                result = normalize_result(parse_model_json(raw_text, steps, "reduce")[0])
+            except ValueError:
+                # Keep the map results rather than failing the whole run.
+                steps.append("reduce_parse_failed")
+                result = default_result()
+                result["answer"] = "\n\n".join(f["answer"] for f in findings if f["answer"])
+                result["confidence"] = "low"
+                result["confidence_reason"] = "Chunk answers could not be merged."
+
+            # Evidence comes from the verified map stage, already in global offsets.
+            result["evidence_claims"] = claims
+            with timer.stage("relevance_confidence"):
+                result = add_question_relevance(result, question)
+                result = adjust_confidence(result)
+
+        except Exception as exc:
+            result = _failure_result(exc)
+
+        return self._finish(
+            result, context, temperature, max_tokens, steps, raw_text, verification, None, budget, timer, calls
+        )
+
+    def run_batch(
+        self,
+        items: Iterable[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool = False,
+        workers: int = 1,
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        # Fan items out over a bounded worker pool and yield (index, result) in completion order.
+        # Only a small window of items is submitted ahead, so large JSONL inputs are not loaded at once.
+        workers = max(1, int(workers))
+        source = enumerate(items)
+        pending: Dict[Any, int] = {}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bbe-batch") as pool:
+
+            def submit_next() -> bool:
+                try:
+                    index, item = next(source)
+                except StopIteration:
+                    return False
+                future = pool.submit(
+                    self.run,
+                    question=str(item.get("question", "")).strip(),
+                    context=str(item.get("context", "")),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    critique_pass=critique_pass,
+                )
+                pending[future] = index
+                return True
+
+            try:
+                for _ in range(workers * 2):
+                    if not submit_next():
+                        break
+
+                while pending:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = pending.pop(future)
+                        submit_next()
+                        yield index, future.result()
+            finally:
+                # Caller stopped early: drop queued work, let in-flight calls finish.
+                for future in pending:
+                    future.cancel()
+
+
+def build_pipeline(cfg, pool_size: Optional[int] = None) -> ExplainerPipeline:
+    # One place that turns an AppConfig into a client and pipeline for app.py, batch.py and server.py.
+    cache = None
+    if cfg.cache_enabled:
+        cache = get_response_cache(cfg.cache_dir, cfg.cache_max_entries, cfg.cache_max_mb * 1024 * 1024)
+    client = create_client(
+        backend=cfg.backend,
+        base_url=cfg.base_url,
+        model=cfg.model,
+        timeout_seconds=cfg.timeout_seconds,
+        pool_size=max(cfg.pool_size, pool_size or 0),
+        cache=cache,
+        cache_force=cfg.cache_force,
+        hedge_quantile=cfg.hedge_quantile,
+        hedge_min_seconds=cfg.hedge_min_ms / 1000,
+        breaker_error_rate=cfg.breaker_error_rate,
+        breaker_cooldown_seconds=cfg.breaker_cooldown_seconds,
+    )
+    return ExplainerPipeline(
+        client,
+        fuzzy_budget_seconds=cfg.fuzzy_budget_ms / 1000,
+        workers=cfg.parallel_slots,
+        long_context_chars=cfg.long_context_chars,
+        chunk_chars=cfg.chunk_chars,
+        chunk_overlap=cfg.chunk_overlap,
+        retrieval_top_k=cfg.retrieval_top_k,
+        retrieval_span_chars=cfg.retrieval_span_chars,
+        budget=TokenBudget(cfg.num_ctx_min, cfg.num_ctx_max) if cfg.num_ctx_max > 0 else None,
+        structured_output=cfg.structured_output,
+        max_continuations=cfg.max_continuations,
+        coalesce=cfg.coalesce_requests,
+    )
@@ -89,4 +89,26 @@ PRIOR_JSON:
 
 OUTPUT JSON SCHEMA:
 {SCHEMA_INSTRUCTIONS}
-"""
+"""
+
+
+def build_reduce_prompt(question: str, chunk_findings_json: str) -> str:
+    return f"""You are merging partial analyses of one long CONTEXT that was split into chunks.
+Each chunk finding was produced from a different part of the CONTEXT.
+
+TASK:
+- Combine the chunk findings into one answer to the QUESTION.
+- Prefer findings that several chunks agree on; list conflicts between chunks as uncertainty.
+- Do not add facts that are not in the chunk findings.
+- Keep evidence_claims to quotes that already appear in the chunk findings.
+- Return STRICT JSON in the same schema.
+
+QUESTION:
+{question}
+
+CHUNK_FINDINGS:
+{chunk_findings_json}
+
+OUTPUT JSON SCHEMA:
+{SCHEMA_INSTRUCTIONS}
+"""
@@ -0,0 +1,149 @@
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import heapq
+import math
+import re
+
+from explain.highlight import keyword_token_list
+from utils.text import chunk_spans, estimate_tokens
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t\r\f\v]*\n")
+
+
+def paragraph_spans(text: str, max_chars: int = 1200, overlap: int = 100) -> List[Tuple[int, int]]:
+    # Retrieval units: paragraphs, with short neighbours merged and long ones split into chunks.
+    paragraphs = []
+    start = 0
+    for m in _PARAGRAPH_BREAK.finditer(text):
+        if text[start : m.start()].strip():
+            paragraphs.append((start, m.start()))
+        start = m.end()
+    if text[start:].strip():
+        paragraphs.append((start, len(text)))
+
+    spans: List[Tuple[int, int]] = []
+    for p_start, p_end in paragraphs:
+        if p_end - p_start > max_chars:
+            spans.extend((p_start + s, p_start + e) for s, e in chunk_spans(text[p_start:p_end], max_chars, overlap))
+        elif spans and p_end - spans[-1][0] <= max_chars:
+            spans[-1] = (spans[-1][0], p_end)
+        else:
+            spans.append((p_start, p_end))
+    return spans
+
+
+class Bm25Index:
+    """
+    Okapi BM25 over fixed spans of one text. Postings map each keyword to (span, term frequency),
+    so scoring a question only touches spans that share a keyword with it.
+    """
+
+    def __init__(self, text: str, spans: List[Tuple[int, int]], k1: float = 1.5, b: float = 0.75):
+        self.spans = spans
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lengths: List[int] = []
+        memo: Dict[str, str] = {}
+        for i, (start, end) in enumerate(spans):
+            counts = Counter(keyword_token_list(text[start:end], memo))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((i, tf))
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+
+    def scores(self, query: str) -> Dict[int, float]:
+        n = len(self.spans)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(keyword_token_list(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, tf in postings:
+                norm = tf + self.k1 * (1.0 - self.b + self.b * self._lengths[i] / (self._avg_length or 1.0))
+                scores[i] += idf * tf * (self.k1 + 1.0) / norm
+        return scores
+
+    def top(self, query: str, k: int) -> List[int]:
+        scores = self.scores(query)
+        return [i for i, _ in heapq.nlargest(k, scores.items(), key=lambda item: item[1])]
+
+
+@dataclass
+class RetrievedContext:
+    # Passages sent to the model instead of the full context, with their offsets in the original text.
+    prompt_context: str
+    spans: List[Tuple[int, int]]
+    total_spans: int
+
+    def stats(self, context: str) -> Dict[str, int]:
+        kept_tokens = estimate_tokens(self.prompt_context)
+        full_tokens = estimate_tokens(context)
+        return {
+            "spans_total": self.total_spans,
+            "spans_kept": len(self.spans),
+            "context_tokens_est": full_tokens,
+            "prompt_context_tokens_est": kept_tokens,
+            "tokens_saved_est": max(0, full_tokens - kept_tokens),
+        }
+
+
+def retrieve_context(
+    context: str, question: str, top_k: int, span_chars: int = 1200
+) -> Optional[RetrievedContext]:
+    # Keep the top_k BM25 spans for the question, in document order. Returns None when retrieval
+    # would not shrink the context or nothing matches, so the caller sends the full text.
+    spans = paragraph_spans(context, span_chars)
+    if len(spans) <= top_k:
+        return None
+    picked = Bm25Index(context, spans).top(question, top_k)
+    if not picked:
+        return None
+
+    return passages_for_spans(context, [spans[i] for i in picked], len(spans))
+
+
+# Smallest span pack_context ranks; below this a budget only has room for the start of the context.
+MIN_PACK_SPAN_CHARS = 200
+
+
+def pack_context(context: str, question: str, max_chars: int, span_chars: int = 1200) -> Optional[RetrievedContext]:
+    # Fit the context into max_chars: most question-relevant spans first, then the rest in document
+    # order, skipping any span that no longer fits. Returns None when the whole context already fits.
+    if len(context) <= max_chars:
+        return None
+    if max_chars // 2 < MIN_PACK_SPAN_CHARS:
+        # Too little room to rank passages (spans would shrink to a few characters): keep the head.
+        head = max(0, max_chars - 40)
+        return passages_for_spans(context, [(0, head)] if head else [], 1)
+    spans = paragraph_spans(context, min(span_chars, max_chars // 2))
+    scores = Bm25Index(context, spans).scores(question) if question.strip() else {}
+    order = sorted(range(len(spans)), key=lambda i: (-scores.get(i, 0.0), i))
+
+    picked: List[Tuple[int, int]] = []
+    used = 0
+    for i in order:
+        start, end = spans[i]
+        # Passage header and separator cost roughly 40 characters each.
+        cost = end - start + 40
+        if used + cost <= max_chars:
+            picked.append((start, end))
+            used += cost
+    return passages_for_spans(context, picked, len(spans))
+
+
+def passages_for_spans(context: str, spans: List[Tuple[int, int]], total_spans: int) -> RetrievedContext:
+    # Overlapping or touching spans (neighbouring chunks of one paragraph) become one passage.
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    passages = [
+        f"[Passage {n} | chars {start}-{end}]\n{context[start:end]}" for n, (start, end) in enumerate(merged, start=1)
+    ]
+    return RetrievedContext(prompt_context="\n\n".join(passages), spans=merged, total_spans=total_spans)
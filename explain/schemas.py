@@ -3,6 +3,14 @@
 
 ALLOWED_CONFIDENCE = {"low", "medium", "high"}
 
+# Shape of one evidence claim as the model writes it (verification fields are added later).
+CLAIM_FIELDS: Dict[str, Any] = {"claim": "", "support_reason": "", "quote": "", "start": 0, "end": 0}
+# Offsets are recomputed locally, so the model may leave them out.
+OPTIONAL_CLAIM_FIELDS = {"start", "end"}
+# Upper bounds on list lengths in constrained output; they also bound the generated token count.
+MAX_EVIDENCE_CLAIMS = 8
+MAX_LIST_ITEMS = 6
+
 
 def default_result() -> Dict[str, Any]:
     return {
@@ -65,3 +73,38 @@ def normalize_result(raw: Dict[str, Any]) -> Dict[str, Any]:
 
     out["evidence_claims"] = clean_claims
     return out
+
+
+def _schema_for(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"type": "boolean"}
+    if isinstance(value, int):
+        return {"type": "integer"}
+    if isinstance(value, str):
+        return {"type": "string"}
+    if isinstance(value, list):
+        return {"type": "array", "items": {"type": "string"}, "maxItems": MAX_LIST_ITEMS}
+    raise TypeError(f"No JSON Schema mapping for {type(value).__name__}.")
+
+
+def build_result_schema() -> Dict[str, Any]:
+    # JSON Schema for the model's result object, derived from default_result() and CLAIM_FIELDS so
+    # the constrained-decoding grammar cannot drift from what normalize_result reads.
+    claim_schema = {
+        "type": "object",
+        "properties": {name: _schema_for(value) for name, value in CLAIM_FIELDS.items()},
+        "required": [name for name in CLAIM_FIELDS if name not in OPTIONAL_CLAIM_FIELDS],
+    }
+    properties: Dict[str, Any] = {}
+    for name, value in default_result().items():
+        if name == "evidence_claims":
+            properties[name] = {"type": "array", "items": claim_schema, "maxItems": MAX_EVIDENCE_CLAIMS}
+        elif name == "confidence":
+            properties[name] = {"type": "string", "enum": sorted(ALLOWED_CONFIDENCE)}
+        else:
+            properties[name] = _schema_for(value)
+    return {"type": "object", "properties": properties, "required": list(properties)}
+
+
+# Built once at import; passed as the structured-output format on every JSON call.
+RESULT_JSON_SCHEMA = build_result_schema()
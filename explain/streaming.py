@@ -0,0 +1,113 @@
+from typing import Any, List, Optional, Tuple
+import json
+import re
+
+# Only these characters can change JSON structure; everything else is skipped in bulk.
+_STRUCTURAL = re.compile(r'[{}\[\]":,\\]')
+
+
+class StreamingResultParser:
+    """
+    Incrementally reads a streamed result JSON object and reports pieces as soon as they close:
+    - ("field", (name, value)) for top-level string values such as "answer"
+    - ("claim", dict) for each object inside the top-level "evidence_claims" array
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._last_key: Optional[str] = None
+        self._in_claims = False
+        self._claim_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        events: List[Tuple[str, Any]] = []
+        if not chunk:
+            return events
+        self._text += chunk
+
+        text = self._text
+        pos = self._pos
+        n = len(text)
+        while pos < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                # Jump to the next quote or backslash inside the string.
+                q = text.find('"', pos)
+                b = text.find("\\", pos)
+                if b != -1 and (q == -1 or b < q):
+                    self._escape = True
+                    pos = b + 1
+                    continue
+                if q == -1:
+                    pos = n
+                    break
+                self._in_string = False
+                self._close_string(self._string_start, q + 1, events)
+                pos = q + 1
+                continue
+
+            m = _STRUCTURAL.search(text, pos)
+            if m is None:
+                pos = n
+                break
+            i = m.start()
+            ch = text[i]
+            pos = i + 1
+
+            if ch == '"':
+                if self._stack:
+                    self._in_string = True
+                    self._string_start = i
+            elif ch in "{[":
+                if ch == "{" and self._in_claims and len(self._stack) == 2:
+                    self._claim_start = i
+                if ch == "[" and len(self._stack) == 1 and self._last_key == "evidence_claims":
+                    self._in_claims = True
+                self._stack.append(ch)
+                self._expect_key = ch == "{"
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if ch == "}" and self._in_claims and len(self._stack) == 2 and self._claim_start is not None:
+                    claim = self._decode(text[self._claim_start : i + 1])
+                    self._claim_start = None
+                    if isinstance(claim, dict):
+                        events.append(("claim", claim))
+                if ch == "]" and self._in_claims and len(self._stack) == 1:
+                    self._in_claims = False
+                self._expect_key = False
+            elif ch == ":":
+                self._expect_key = False
+            elif ch == ",":
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+
+        self._pos = pos
+        return events
+
+    def _close_string(self, start: int, end: int, events: List[Tuple[str, Any]]) -> None:
+        if len(self._stack) != 1:
+            return
+        value = self._decode(self._text[start:end])
+        if not isinstance(value, str):
+            return
+        if self._expect_key:
+            self._last_key = value
+        elif self._last_key is not None:
+            events.append(("field", (self._last_key, value)))
+
+    @staticmethod
+    def _decode(raw: str) -> Any:
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return None
@@ -1,8 +1,73 @@
+import threading
+
+from .cache import CachedClient, ResponseCache
+from .client_lmstudio import LMStudioClient
 from .client_ollama import OllamaClient
+from .http_pool import DEFAULT_POOL_SIZE, get_session
+from .router import CircuitOpenError, RouterClient, parse_endpoints
+
+_BACKENDS = {"ollama": OllamaClient, "lmstudio": LMStudioClient}
+
+_clients = {}
+_clients_lock = threading.Lock()
 
 
-def create_client(backend: str, base_url: str, model: str, timeout_seconds: int = 120):
+def create_client(
+    backend: str,
+    base_url: str,
+    model: str,
+    timeout_seconds: int = 120,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    cache: ResponseCache = None,
+    cache_force: bool = False,
+    hedge_quantile: float = 0.0,
+    hedge_min_seconds: float = 0.25,
+    breaker_error_rate: float = 0.0,
+    breaker_cooldown_seconds: float = 15.0,
+):
+    # Clients hold no per-call state, so reuse one per settings tuple (Streamlit reruns call this a lot).
     b = (backend or "").strip().lower()
-    if b == "ollama":
-        return OllamaClient(base_url=base_url, model=model, timeout_seconds=timeout_seconds)
-    raise ValueError(f"Unsupported backend: {backend}")
+    key = (
+        b,
+        base_url.rstrip("/"),
+        model,
+        int(timeout_seconds),
+        int(pool_size),
+        id(cache),
+        bool(cache_force),
+        float(hedge_quantile),
+        float(hedge_min_seconds),
+        float(breaker_error_rate),
+        float(breaker_cooldown_seconds),
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        # base_url may list several endpoints ("url, lmstudio=url#model, ..."); they are load-balanced.
+        clients = []
+        for entry_backend, entry_url, entry_model in parse_endpoints(base_url, b, model):
+            cls = _BACKENDS.get(entry_backend)
+            if cls is None:
+                raise ValueError(f"Unsupported backend: {entry_backend}")
+            clients.append(
+                cls(base_url=entry_url, model=entry_model, timeout_seconds=timeout_seconds, pool_size=pool_size)
+            )
+        if not clients:
+            raise ValueError("No backend URL given.")
+        if len(clients) == 1:
+            # No circuit breaker for a lone backend: ejecting it (e.g. after timeouts during a cold model
+            # load) would fail every request while there is nowhere else to send them.
+            client = clients[0]
+        else:
+            client = RouterClient(
+                clients,
+                eject_seconds=breaker_cooldown_seconds,
+                breaker_error_rate=breaker_error_rate,
+                hedge_quantile=hedge_quantile,
+                hedge_min_seconds=hedge_min_seconds,
+            )
+        if cache is not None:
+            client = CachedClient(client, cache, force=cache_force)
+        _clients[key] = client
+        return client
@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.metrics import CACHE_LOOKUPS
+
+from .client_base import ChatResult, ChatStream, LLMClient, ResponseFormat
+
+
+def cache_key(
+    model: str,
+    model_digest: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    num_ctx: Optional[int] = None,
+    response_format: ResponseFormat = None,
+) -> str:
+    # Content address of one chat request; the digest changes whenever the model weights change.
+    request = {
+        "model": model,
+        "digest": model_digest,
+        "messages": messages,
+        "temperature": float(temperature),
+        "max_tokens": int(max_tokens),
+    }
+    if num_ctx:
+        # Only present when set, so keys written before num_ctx sizing stay valid.
+        request["num_ctx"] = int(num_ctx)
+    if response_format:
+        request["format"] = response_format
+    blob = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: a bounded in-memory LRU in front of an optional directory of
+    JSON files. The disk tier evicts least-recently-used files once it grows past max_bytes.
+    """
+
+    def __init__(self, max_entries: int = 256, cache_dir: str = "", max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max(1, int(max_entries))
+        self.cache_dir = cache_dir
+        self.max_bytes = max(0, int(max_bytes))
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._disk: Dict[str, Tuple[int, float]] = {}
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                CACHE_LOOKUPS.inc(result="memory_hit")
+                return text
+
+            text = self._read_disk(key)
+            if text is None:
+                self._stats["misses"] += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._stats["disk_hits"] += 1
+            CACHE_LOOKUPS.inc(result="disk_hit")
+            self._remember(key, text)
+            return text
+
+    def put(self, key: str, text: str) -> None:
+        with self._lock:
+            self._remember(key, text)
+            self._stats["stores"] += 1
+            self._write_disk(key, text)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["hits"] = out["memory_hits"] + out["disk_hits"]
+            out["memory_entries"] = len(self._memory)
+            out["disk_entries"] = len(self._disk)
+            out["disk_bytes"] = self._disk_bytes
+            return out
+
+    def _remember(self, key: str, text: str) -> None:
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self) -> None:
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                self._disk[name[:-5]] = (st.st_size, st.st_mtime)
+                self._disk_bytes += st.st_size
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.cache_dir or key not in self._disk:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = json.load(f).get("text")
+            os.utime(path)
+        except (OSError, ValueError, AttributeError):
+            self._forget_disk(key)
+            return None
+        if not isinstance(text, str):
+            return None
+        size, _ = self._disk[key]
+        self._disk[key] = (size, time.time())
+        return text
+
+    def _write_disk(self, key: str, text: str) -> None:
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"text": text}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            st = os.stat(path)
+        except OSError:
+            return
+        self._forget_disk(key, delete=False)
+        self._disk[key] = (st.st_size, st.st_mtime)
+        self._disk_bytes += st.st_size
+        self._evict_disk()
+
+    def _forget_disk(self, key: str, delete: bool = True) -> None:
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_bytes -= entry[0]
+        if delete:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict_disk(self) -> None:
+        if self._disk_bytes <= self.max_bytes:
+            return
+        for key, _ in sorted(self._disk.items(), key=lambda item: item[1][1]):
+            if self._disk_bytes <= self.max_bytes:
+                break
+            self._forget_disk(key)
+            self._stats["evictions"] += 1
+
+
+_shared_caches: Dict[Tuple[str, int, int], ResponseCache] = {}
+_shared_lock = threading.Lock()
+
+
+def get_response_cache(cache_dir: str = "", max_entries: int = 256, max_bytes: int = 256 * 1024 * 1024) -> ResponseCache:
+    # Process-wide cache per settings, so Streamlit reruns and batch workers share hits.
+    key = (os.path.abspath(cache_dir) if cache_dir else "", int(max_entries), int(max_bytes))
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            cache = ResponseCache(max_entries=max_entries, cache_dir=cache_dir, max_bytes=max_bytes)
+            _shared_caches[key] = cache
+        return cache
+
+
+class CachedClient(LLMClient):
+    """
+    Wraps another client and serves repeated requests from a ResponseCache.
+    Only deterministic calls (temperature 0) are cached unless force=True.
+    """
+
+    def __init__(self, inner: LLMClient, cache: ResponseCache, force: bool = False):
+        super().__init__(
+            base_url=inner.base_url,
+            model=inner.model,
+            timeout_seconds=inner.timeout_seconds,
+            pool_size=inner.pool_size,
+        )
+        self.inner = inner
+        self.cache = cache
+        self.force = force
+
+    @property
+    def supports_prefill(self) -> bool:
+        return self.inner.supports_prefill
+
+    def _cacheable(self, temperature: float) -> bool:
+        return self.force or float(temperature) == 0.0
+
+    def _key(
+        self,
+        digest: Optional[str],
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int],
+        response_format: ResponseFormat,
+    ) -> Optional[str]:
+        if digest is None:
+            # Weights unknown (backend unreachable or model not listed): a key could match another version.
+            return None
+        return cache_key(self.model, digest, messages, temperature, max_tokens, num_ctx, response_format)
+
+    def _digest(self, temperature: float) -> Optional[str]:
+        # Only looked up for calls that could be cached; the lookup may be an HTTP request.
+        return self.inner.model_digest() if self._cacheable(temperature) else None
+
+    def chat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        key = self._key(self._digest(temperature), messages, temperature, max_tokens, num_ctx, response_format)
+        if key is None:
+            return self.inner.chat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return ChatResult(text=cached, done_reason="stop")
+        result = self.inner.chat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        self._store(key, result)
+        return result
+
+    async def achat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        # The digest lookup can block on /api/tags (and on each routed endpoint in turn), so it runs
+        # in a worker thread instead of on the event loop.
+        digest = await asyncio.to_thread(self._digest, temperature)
+        key = self._key(digest, messages, temperature, max_tokens, num_ctx, response_format)
+        if key is None:
+            return await self.inner.achat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return ChatResult(text=cached, done_reason="stop")
+        result = await self.inner.achat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        self._store(key, result)
+        return result
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatStream:
+        key = self._key(self._digest(temperature), messages, temperature, max_tokens, num_ctx, response_format)
+        if key is None:
+            return (yield from self.inner.stream_chat(messages, temperature, max_tokens, num_ctx, response_format))
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return ChatResult(text=cached, done_reason="stop")
+        result = yield from self.inner.stream_chat(messages, temperature, max_tokens, num_ctx, response_format)
+        # Only complete generations are stored; an abandoned stream never reaches this point.
+        if result is not None:
+            self._store(key, result)
+        return result
+
+    def _store(self, key: str, result: ChatResult) -> None:
+        # A reply cut off at max_tokens is not a complete answer; the caller continues it instead.
+        if not result.truncated:
+            self.cache.put(key, result.text)
+
+    def model_digest(self) -> Optional[str]:
+        return self.inner.model_digest()
+
+    def metadata(self) -> Dict[str, Any]:
+        meta = self.inner.metadata()
+        meta["cache"] = self.cache.stats()
+        meta["cache_force"] = self.force
+        return meta
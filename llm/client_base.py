@@ -1,21 +1,209 @@
 ﻿from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from dataclasses import dataclass, field
+from typing import Any, Dict, Generator, List, Optional, Union
+import asyncio
+import time
+
+import requests
+
+from utils.metrics import observe_llm_call
+
+from .http_pool import DEFAULT_POOL_SIZE, get_async_client, get_session
+
+# Per-call output constraint: None for free text, "json" for any JSON object, or a JSON Schema dict.
+ResponseFormat = Optional[Union[str, Dict[str, Any]]]
+
+
+@dataclass
+class ChatResult:
+    # Reply text plus the generation metadata the backend reported.
+    text: str
+    # "stop", "length" (hit max_tokens), ... ; empty when unknown.
+    done_reason: str = ""
+    prompt_eval_count: Optional[int] = None
+    eval_count: Optional[int] = None
+    # Server-side durations in nanoseconds (Ollama: total, load, prompt_eval, eval).
+    durations: Dict[str, int] = field(default_factory=dict)
+    # Continuation requests merged into this result after length stops.
+    continuations: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.done_reason == "length"
+
+    def stats(self) -> Dict[str, Any]:
+        # Server-reported seconds, token counts and throughput for the trace; unknown values are left out.
+        out: Dict[str, Any] = {"done_reason": self.done_reason, "continuations": self.continuations}
+        if self.prompt_eval_count is not None:
+            out["prompt_tokens"] = self.prompt_eval_count
+        if self.eval_count is not None:
+            out["completion_tokens"] = self.eval_count
+        for name, ns in self.durations.items():
+            out[f"{name}_seconds"] = round(ns / 1e9, 4)
+        if self.prompt_eval_count and self.durations.get("prompt_eval"):
+            out["prompt_tokens_per_second"] = round(self.prompt_eval_count * 1e9 / self.durations["prompt_eval"], 1)
+        if self.eval_count and self.durations.get("eval"):
+            out["tokens_per_second"] = round(self.eval_count * 1e9 / self.durations["eval"], 1)
+        return out
+
+
+def merge_results(first: ChatResult, tail: ChatResult) -> ChatResult:
+    # Join a length-stopped reply with its continuation; counts and durations add up.
+    def add(a: Optional[int], b: Optional[int]) -> Optional[int]:
+        return None if a is None and b is None else (a or 0) + (b or 0)
+
+    durations = dict(first.durations)
+    for name, value in tail.durations.items():
+        durations[name] = durations.get(name, 0) + value
+    return ChatResult(
+        text=first.text + tail.text,
+        done_reason=tail.done_reason,
+        prompt_eval_count=add(first.prompt_eval_count, tail.prompt_eval_count),
+        eval_count=add(first.eval_count, tail.eval_count),
+        durations=durations,
+        continuations=first.continuations + tail.continuations + 1,
+    )
+
+
+ChatStream = Generator[str, None, ChatResult]
 
 
 class LLMClient(ABC):
-    def __init__(self, base_url: str, model: str, timeout_seconds: int = 120):
+    # True when a request ending in an assistant message is continued from that text (prefill),
+    # which is what length-stopped replies are resumed with; otherwise the model starts a new reply.
+    supports_prefill = False
+
+    def __init__(self, base_url: str, model: str, timeout_seconds: int = 120, pool_size: int = DEFAULT_POOL_SIZE):
         self.base_url = base_url.rstrip("/")
         self.model = model
         self.timeout_seconds = timeout_seconds
+        self.pool_size = pool_size
 
     @abstractmethod
-    def chat(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    def chat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        # num_ctx asks the server for a context window of that many tokens; None keeps its default.
+        # response_format constrains decoding (see ResponseFormat).
         raise NotImplementedError
 
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+        kind: str = "chat",
+    ) -> str:
+        # Plain-text entry point for callers outside the pipeline; kind labels the call in metrics.
+        started = time.monotonic()
+        try:
+            result = self.chat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        except Exception:
+            observe_llm_call(kind, time.monotonic() - started, error=True)
+            raise
+        observe_llm_call(kind, time.monotonic() - started, result)
+        return result.text
+
+    async def achat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        # Clients without a native async transport run the blocking call in a worker thread.
+        return await asyncio.to_thread(
+            self.chat_with_meta, messages, temperature, max_tokens, num_ctx, response_format
+        )
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+        kind: str = "chat",
+    ) -> str:
+        started = time.monotonic()
+        try:
+            result = await self.achat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        except Exception:
+            observe_llm_call(kind, time.monotonic() - started, error=True)
+            raise
+        observe_llm_call(kind, time.monotonic() - started, result)
+        return result.text
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatStream:
+        # Yields text pieces; the generator's return value is the full ChatResult.
+        # Backends without token streaming yield the whole reply as a single chunk.
+        result = self.chat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+        yield result.text
+        return result
+
+    def stream_text(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+        kind: str = "chat",
+    ) -> ChatStream:
+        # Streaming counterpart of chat(): yields text pieces and records the call in metrics.
+        # Closing the generator early closes the stream, which stops generation on the server.
+        started = time.monotonic()
+        stream = self.stream_chat(messages, temperature, max_tokens, num_ctx, response_format)
+        parts: List[str] = []
+        try:
+            while True:
+                try:
+                    piece = next(stream)
+                except StopIteration as stop:
+                    result = stop.value if stop.value is not None else ChatResult("".join(parts))
+                    break
+                parts.append(piece)
+                yield piece
+        except Exception:
+            observe_llm_call(kind, time.monotonic() - started, error=True)
+            raise
+        finally:
+            stream.close()
+        observe_llm_call(kind, time.monotonic() - started, result)
+        return result
+
+    def model_digest(self) -> Optional[str]:
+        # Identifies the exact model weights for cache keys; empty when the backend cannot tell,
+        # None when it can but the lookup failed (callers must not cache then).
+        return ""
+
+    def _http(self) -> requests.Session:
+        # Keep-alive session shared with every other client talking to the same base URL.
+        return get_session(self.base_url, self.pool_size)
+
+    def _async_http(self) -> Optional[Any]:
+        return get_async_client(self.base_url, self.pool_size)
+
     def metadata(self) -> Dict[str, Any]:
         return {
             "base_url": self.base_url,
             "model": self.model,
             "timeout_seconds": self.timeout_seconds,
+            "pool_size": self.pool_size,
             "client": self.__class__.__name__,
-        }
+        }
@@ -1,7 +1,7 @@
-﻿from typing import Dict, List
-import requests
+﻿from typing import Any, Dict, List, Optional
+import json
 
-from .client_base import LLMClient
+from .client_base import ChatResult, ChatStream, LLMClient, ResponseFormat
 
 
 class LMStudioClient(LLMClient):
@@ -10,18 +10,117 @@ class LMStudioClient(LLMClient):
     https://lmstudio.ai/docs/app/api/endpoints/openai
     """
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
-        url = f"{self.base_url}/chat/completions"
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        response_format: ResponseFormat = None,
+    ) -> Dict[str, Any]:
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
         }
-        r = requests.post(url, json=payload, timeout=self.timeout_seconds)
-        r.raise_for_status()
-        data = r.json()
+        if isinstance(response_format, dict):
+            # LM Studio only takes schema-constrained output; plain "json" mode is left to the prompt.
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "result", "strict": True, "schema": response_format},
+            }
+        return payload
+
+    @staticmethod
+    def _parse_reply(data: Any) -> str:
         try:
             return data["choices"][0]["message"]["content"]
         except (KeyError, IndexError, TypeError) as exc:
-            raise RuntimeError(f"Unexpected LM Studio response format: {data}") from exc
+            raise RuntimeError(f"Unexpected LM Studio response format: {data}") from exc
+
+    @classmethod
+    def _parse_result(cls, data: Any) -> ChatResult:
+        # OpenAI-style finish_reason and usage map onto the Ollama field names.
+        choice = (data.get("choices") or [{}])[0]
+        usage = data.get("usage") or {}
+        return ChatResult(
+            text=cls._parse_reply(data),
+            done_reason=str(choice.get("finish_reason") or ""),
+            prompt_eval_count=usage.get("prompt_tokens"),
+            eval_count=usage.get("completion_tokens"),
+        )
+
+    def chat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        # The context length is fixed when LM Studio loads the model, so num_ctx is not sent.
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, response_format)
+        r = self._http().post(url, json=payload, timeout=self.timeout_seconds)
+        r.raise_for_status()
+        return self._parse_result(r.json())
+
+    async def achat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        http = self._async_http()
+        if http is None:
+            return await super().achat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, response_format)
+        r = await http.post(url, json=payload, timeout=self.timeout_seconds)
+        r.raise_for_status()
+        return self._parse_result(r.json())
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatStream:
+        # OpenAI-style server-sent events: "data: {chunk}" lines with content deltas, then "data: [DONE]".
+        # include_usage adds a final chunk with token counts.
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(messages, temperature, max_tokens, response_format)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        parts: List[str] = []
+        finish_reason = ""
+        usage: Dict[str, Any] = {}
+        with self._http().post(url, json=payload, timeout=self.timeout_seconds, stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line or not line.startswith(b"data:"):
+                    continue
+                body = line[5:].strip()
+                if body == b"[DONE]":
+                    break
+                data = json.loads(body)
+                if data.get("error"):
+                    raise RuntimeError(f"LM Studio stream error: {data['error']}")
+                usage = data.get("usage") or usage
+                for choice in data.get("choices") or []:
+                    piece = (choice.get("delta") or {}).get("content") or ""
+                    if piece:
+                        parts.append(piece)
+                        yield piece
+                    finish_reason = choice.get("finish_reason") or finish_reason
+        return ChatResult(
+            text="".join(parts),
+            done_reason=str(finish_reason),
+            prompt_eval_count=usage.get("prompt_tokens"),
+            eval_count=usage.get("completion_tokens"),
+        )
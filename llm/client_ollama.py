@@ -1,7 +1,13 @@
-﻿from typing import Dict, List
-import requests
+﻿from typing import Any, Dict, List, Optional
+import json
+import time
 
-from .client_base import LLMClient
+from .client_base import ChatResult, ChatStream, LLMClient, ResponseFormat
+
+# How long a looked-up digest is trusted; `ollama pull` can replace the weights under the same name.
+DIGEST_TTL_SECONDS = 60.0
+# After a failed lookup the digest stays unknown (and the response cache is bypassed) this long.
+DIGEST_RETRY_SECONDS = 5.0
 
 
 class OllamaClient(LLMClient):
@@ -10,14 +16,22 @@ class OllamaClient(LLMClient):
     https://github.com/ollama/ollama/blob/main/docs/api.md
     """
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
-        url = f"{self.base_url}/api/chat"
-        msg_text = "\n".join(str(m.get("content", "")) for m in messages)
-        wants_json = (
-            "OUTPUT JSON SCHEMA" in msg_text
-            or "STRICT JSON" in msg_text
-            or "Return this exact JSON object shape" in msg_text
-        )
+    # /api/chat continues a trailing assistant message instead of answering it.
+    supports_prefill = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._digest: Optional[str] = None
+        self._digest_expires = 0.0
+
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> Dict[str, Any]:
         payload = {
             "model": self.model,
             "messages": messages,
@@ -27,12 +41,121 @@ class OllamaClient(LLMClient):
                 "num_predict": max_tokens,
             },
         }
-        if wants_json:
-            payload["format"] = "json"
-        r = requests.post(url, json=payload, timeout=self.timeout_seconds)
-        r.raise_for_status()
-        data = r.json()
+        if num_ctx:
+            # Without this Ollama uses its default window and silently drops the start of long prompts.
+            payload["options"]["num_ctx"] = int(num_ctx)
+        if response_format:
+            # "json" or a JSON Schema; Ollama compiles a schema into a decoding grammar.
+            payload["format"] = response_format
+        return payload
+
+    @staticmethod
+    def _parse_reply(data: Any) -> str:
         try:
             return data["message"]["content"]
         except (KeyError, TypeError) as exc:
-            raise RuntimeError(f"Unexpected Ollama response format: {data}") from exc
+            raise RuntimeError(f"Unexpected Ollama response format: {data}") from exc
+
+    @classmethod
+    def _parse_result(cls, data: Any, text: Optional[str] = None) -> ChatResult:
+        # Final (done) response: text plus done_reason, token counts and server durations.
+        return ChatResult(
+            text=cls._parse_reply(data) if text is None else text,
+            done_reason=str(data.get("done_reason") or ""),
+            prompt_eval_count=data.get("prompt_eval_count"),
+            eval_count=data.get("eval_count"),
+            durations={
+                name: int(data[f"{name}_duration"])
+                for name in ("total", "load", "prompt_eval", "eval")
+                if isinstance(data.get(f"{name}_duration"), int)
+            },
+        )
+
+    def chat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        url = f"{self.base_url}/api/chat"
+        payload = self._build_payload(messages, temperature, max_tokens, num_ctx, response_format)
+        r = self._http().post(url, json=payload, timeout=self.timeout_seconds)
+        r.raise_for_status()
+        return self._parse_result(r.json())
+
+    async def achat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        http = self._async_http()
+        if http is None:
+            return await super().achat_with_meta(messages, temperature, max_tokens, num_ctx, response_format)
+
+        url = f"{self.base_url}/api/chat"
+        payload = self._build_payload(messages, temperature, max_tokens, num_ctx, response_format)
+        r = await http.post(url, json=payload, timeout=self.timeout_seconds)
+        r.raise_for_status()
+        return self._parse_result(r.json())
+
+    def model_digest(self) -> Optional[str]:
+        # Looked up from /api/tags and re-checked every DIGEST_TTL_SECONDS, so cache keys follow a re-pull.
+        # None when the lookup failed or the model is not listed.
+        now = time.monotonic()
+        if now < self._digest_expires:
+            return self._digest
+        digest: Optional[str] = None
+        try:
+            r = self._http().get(f"{self.base_url}/api/tags", timeout=min(self.timeout_seconds, 30))
+            r.raise_for_status()
+            names = {self.model, f"{self.model}:latest"}
+            digest = next(
+                (
+                    str(m.get("digest", ""))
+                    for m in r.json().get("models", [])
+                    if isinstance(m, dict) and m.get("name") in names and m.get("digest")
+                ),
+                None,
+            )
+        except Exception:
+            pass
+        self._digest = digest
+        self._digest_expires = now + (DIGEST_TTL_SECONDS if digest else DIGEST_RETRY_SECONDS)
+        return digest
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatStream:
+        # Ollama streams one JSON object per line; yield each content delta as it arrives.
+        # The last line carries done_reason and the counters, returned as the stream's ChatResult.
+        url = f"{self.base_url}/api/chat"
+        payload = self._build_payload(messages, temperature, max_tokens, num_ctx, response_format)
+        payload["stream"] = True
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        with self._http().post(url, json=payload, timeout=self.timeout_seconds, stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(f"Ollama stream error: {data['error']}")
+                piece = self._parse_reply(data)
+                if piece:
+                    parts.append(piece)
+                    yield piece
+                if data.get("done"):
+                    final = data
+                    break
+        return self._parse_result(final, "".join(parts))
@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import threading
+import time
+
+from .http_pool import get_session
+
+_LABELS = {"ollama": "Ollama", "lmstudio": "LM Studio"}
+
+
+@dataclass
+class BackendHealth:
+    # Result of one poll; checked_at is time.monotonic().
+    reachable: bool
+    models: Tuple[str, ...] = ()
+    error: str = ""
+    checked_at: float = 0.0
+    latency_seconds: float = 0.0
+
+    def has_model(self, model: str) -> bool:
+        # Ollama lists "name:tag"; a bare name means ":latest".
+        return model in self.models or f"{model}:latest" in self.models
+
+
+class HealthMonitor:
+    """
+    Polls one backend's model list on a background thread and keeps the latest result, so callers
+    (every Streamlit rerun, every session) read status without making a request themselves.
+    The thread stops once nobody has asked for idle_seconds; get_health_monitor starts a new one.
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        base_url: str,
+        interval_seconds: float = 10.0,
+        ttl_seconds: float = 30.0,
+        timeout_seconds: float = 10.0,
+        idle_seconds: float = 300.0,
+    ):
+        self.backend = backend
+        self.base_url = base_url.rstrip("/")
+        self.interval_seconds = interval_seconds
+        self.ttl_seconds = ttl_seconds
+        self.timeout_seconds = timeout_seconds
+        self.idle_seconds = idle_seconds
+        self._latest: Optional[BackendHealth] = None
+        self._lock = threading.Lock()
+        self._polled = threading.Event()
+        self._wake = threading.Event()
+        self._last_used = time.monotonic()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="bbe-health", daemon=True)
+
+    def start(self) -> "HealthMonitor":
+        self._thread.start()
+        return self
+
+    @property
+    def alive(self) -> bool:
+        # False as soon as the thread has decided to stop, even if it has not exited yet.
+        return self._thread.is_alive() and not self._stopped
+
+    def touch(self) -> None:
+        with self._lock:
+            self._last_used = time.monotonic()
+
+    def _probe(self) -> BackendHealth:
+        started = time.monotonic()
+        # Ollama's native model list, or the OpenAI-compatible one LM Studio serves under /v1.
+        path = "/models" if self.backend == "lmstudio" else "/api/tags"
+        try:
+            resp = get_session(self.base_url).get(f"{self.base_url}{path}", timeout=self.timeout_seconds)
+            resp.raise_for_status()
+            data = resp.json()
+            if self.backend == "lmstudio":
+                entries, field = data.get("data", []), "id"
+            else:
+                entries, field = data.get("models", []), "name"
+            models = tuple(str(m.get(field, "")) for m in entries if isinstance(m, dict))
+            return BackendHealth(True, models, checked_at=time.monotonic(), latency_seconds=time.monotonic() - started)
+        except Exception as exc:
+            return BackendHealth(False, error=str(exc), checked_at=time.monotonic())
+
+    def _loop(self) -> None:
+        while True:
+            health = self._probe()
+            with self._lock:
+                self._latest = health
+            self._polled.set()
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            # Decided under the registry lock, where get_health_monitor also marks the monitor used,
+            # so a monitor that was just handed out is never the one that stops.
+            with _monitors_lock:
+                with self._lock:
+                    idle = time.monotonic() - self._last_used > self.idle_seconds
+                if idle:
+                    self._stopped = True
+                    _forget(self)
+                    return
+
+    def latest(self, wait_seconds: float = 0.0) -> Optional[BackendHealth]:
+        # The last poll result, or None before the first poll finishes (waiting up to wait_seconds for it)
+        # and once it is older than ttl_seconds.
+        self.touch()
+        if wait_seconds > 0:
+            self._polled.wait(wait_seconds)
+        with self._lock:
+            health = self._latest
+        if health is None or time.monotonic() - health.checked_at > self.ttl_seconds:
+            return None
+        return health
+
+    def refresh(self) -> None:
+        # Poll again now instead of at the next interval.
+        self._wake.set()
+
+    def check(self, model: str, wait_seconds: float = 0.0) -> Tuple[bool, str]:
+        label = _LABELS.get(self.backend, self.backend)
+        health = self.latest(wait_seconds)
+        if health is None:
+            return False, f"Checking {label} at {self.base_url}..."
+        if not health.reachable:
+            return False, f"Cannot connect to {label} at {self.base_url}. {health.error}"
+        if not health.has_model(model):
+            if self.backend == "ollama":
+                return False, f"Ollama is running, but model '{model}' is not found. Run: ollama pull {model}"
+            return False, f"{label} is running, but model '{model}' is not loaded."
+        return True, f"Connected to {label}. Model ready: {model}"
+
+
+_monitors: Dict[Tuple[str, str], HealthMonitor] = {}
+_monitors_lock = threading.Lock()
+
+
+def _forget(monitor: HealthMonitor) -> None:
+    # Caller holds _monitors_lock.
+    key = (monitor.backend, monitor.base_url)
+    if _monitors.get(key) is monitor:
+        del _monitors[key]
+
+
+def get_health_monitor(
+    backend: str,
+    base_url: str,
+    interval_seconds: float = 10.0,
+    ttl_seconds: float = 30.0,
+    timeout_seconds: float = 10.0,
+) -> HealthMonitor:
+    # One polling thread per backend URL for the whole process, however many sessions ask.
+    key = ((backend or "").strip().lower(), base_url.rstrip("/"))
+    with _monitors_lock:
+        monitor = _monitors.get(key)
+        if monitor is None or not monitor.alive:
+            monitor = HealthMonitor(key[0], key[1], interval_seconds, ttl_seconds, timeout_seconds).start()
+            _monitors[key] = monitor
+        else:
+            monitor.touch()
+        return monitor
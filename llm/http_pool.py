@@ -0,0 +1,204 @@
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Set
+import asyncio
+import socket
+import threading
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+DEFAULT_POOL_SIZE = 10
+
+# One keep-alive session per base URL, shared by every client in the process.
+_sessions: Dict[str, requests.Session] = {}
+_session_sizes: Dict[str, int] = {}
+_lock = threading.Lock()
+
+# httpx clients are bound to the loop that created them, so the async pool is keyed by loop first.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+# Per-loop async generators that close that loop's clients when it shuts down (see _close_with_loop).
+_async_closers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+
+# Scope that requests made on this thread belong to (see CancelScope.bind).
+_bound = threading.local()
+
+
+class CancelScope:
+    """
+    Lets another thread abort one blocking request, including while it still waits for headers.
+
+    Connections used on the bound thread are recorded until they go back to the pool; cancel()
+    shuts their sockets down, so the blocked read fails at once and the server sees the client go.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections: Set[Any] = set()
+        self.cancelled = False
+
+    @contextmanager
+    def bind(self) -> Iterator["CancelScope"]:
+        previous = getattr(_bound, "scope", None)
+        _bound.scope = self
+        try:
+            yield self
+        finally:
+            _bound.scope = previous
+
+    def _track(self, conn: Any) -> None:
+        with self._lock:
+            if self.cancelled:
+                raise requests.ConnectionError("Request cancelled.")
+            self._connections.add(conn)
+            conn.cancel_scope = self
+
+    def _untrack(self, conn: Any) -> None:
+        with self._lock:
+            self._connections.discard(conn)
+            conn.cancel_scope = None
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            connections = list(self._connections)
+        for conn in connections:
+            _shutdown(conn)
+
+
+def _shutdown(conn: Any) -> None:
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _ScopedConnectionMixin:
+    cancel_scope: Optional[CancelScope] = None
+
+    def connect(self):
+        super().connect()
+        # Cancelled between the request being tracked and the socket existing.
+        if self.cancel_scope is not None and self.cancel_scope.cancelled:
+            _shutdown(self)
+
+    def request(self, *args, **kwargs):
+        scope = getattr(_bound, "scope", None)
+        if scope is not None:
+            scope._track(self)
+        return super().request(*args, **kwargs)
+
+
+class _ScopedHTTPConnection(_ScopedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _ScopedHTTPSConnection(_ScopedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _ScopedPoolMixin:
+    def _put_conn(self, conn):
+        # Back in the pool means the request is over; another thread may take the connection next.
+        scope = getattr(conn, "cancel_scope", None)
+        if scope is not None:
+            scope._untrack(conn)
+        super()._put_conn(conn)
+
+
+class _ScopedHTTPPool(_ScopedPoolMixin, HTTPConnectionPool):
+    ConnectionCls = _ScopedHTTPConnection
+
+
+class _ScopedHTTPSPool(_ScopedPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = _ScopedHTTPSConnection
+
+
+class _ScopedAdapter(HTTPAdapter):
+    # HTTPAdapter whose connections can be cut by a CancelScope bound on the requesting thread.
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _ScopedHTTPPool, "https": _ScopedHTTPSPool}
+
+
+def get_session(base_url: str, pool_size: int = DEFAULT_POOL_SIZE) -> requests.Session:
+    key = base_url.rstrip("/")
+    pool_size = max(1, int(pool_size))
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            _sessions[key] = session
+            _session_sizes[key] = 0
+        if pool_size > _session_sizes[key]:
+            # A larger pool was requested: swap in a bigger adapter for this base URL. Closing the old
+            # one drops its idle connections; requests still running on it close theirs when done.
+            previous = session.adapters.get("http://")
+            adapter = _ScopedAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session_sizes[key] = pool_size
+            if isinstance(previous, HTTPAdapter):
+                previous.close()
+        return session
+
+
+def get_async_client(base_url: str, pool_size: int = DEFAULT_POOL_SIZE) -> Optional[Any]:
+    # Returns None when httpx is not installed so callers can fall back to a worker thread.
+    if httpx is None:
+        return None
+    key = base_url.rstrip("/")
+    loop = asyncio.get_running_loop()
+    with _lock:
+        per_loop = _async_clients.get(loop)
+        if per_loop is None:
+            per_loop = _async_clients[loop] = {}
+            _async_closers[loop] = _close_with_loop(per_loop)
+        client = per_loop.get(key)
+        if client is None:
+            limits = httpx.Limits(max_connections=max(1, int(pool_size)), max_keepalive_connections=max(1, int(pool_size)))
+            client = httpx.AsyncClient(limits=limits)
+            per_loop[key] = client
+        return client
+
+
+async def _closer(clients: Dict[str, Any]):
+    # Parked until the loop shuts its async generators down (asyncio.run does), then closes the
+    # loop's httpx clients while the loop can still run aclose().
+    try:
+        yield
+    finally:
+        for client in list(clients.values()):
+            await client.aclose()
+        clients.clear()
+
+
+def _close_with_loop(clients: Dict[str, Any]) -> Any:
+    # Returns the parked generator; the loop only keeps a weak reference to it.
+    closer = _closer(clients)
+    # Step it to its yield now; that registers it with the running loop's async generator hooks.
+    try:
+        closer.asend(None).send(None)
+    except StopIteration:
+        pass
+    return closer
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        _session_sizes.clear()
@@ -0,0 +1,487 @@
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import itertools
+import threading
+import time
+
+from utils.metrics import BREAKER_TRIPS, HEDGED_CALLS
+
+from .client_base import ChatResult, ChatStream, LLMClient, ResponseFormat
+from .http_pool import CancelScope
+
+
+class CircuitOpenError(RuntimeError):
+    # Every endpoint's breaker is open: fail now instead of waiting out another timeout.
+    pass
+
+
+def is_endpoint_failure(exc: BaseException) -> bool:
+    # Transport errors, timeouts and 5xx count against the endpoint; a 4xx is the request's fault.
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    return not (isinstance(status, int) and status < 500)
+
+
+def _quantile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class EndpointState:
+    # Load and health bookkeeping for one routed endpoint; guarded by the router's lock.
+    def __init__(self, client: LLMClient, latency_window: int, breaker_window: int):
+        self.client = client
+        self.outstanding = 0
+        self.latency_ewma: Optional[float] = None
+        # Recent successful call durations (for hedging) and outcomes, True = failed (for the breaker).
+        self.latencies: deque = deque(maxlen=latency_window)
+        self.outcomes: deque = deque(maxlen=breaker_window)
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.probing = False
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+
+    def available(self, now: float) -> bool:
+        # After its ejection expires an endpoint is re-admitted on probation (half-open): one request
+        # at a time until a success clears its failure count.
+        if self.ejected_until > now:
+            return False
+        return not (self.ejections and self.failures and self.probing)
+
+    def state(self, now: float) -> str:
+        if self.ejected_until > now:
+            return "open"
+        return "half_open" if self.ejections and self.failures else "closed"
+
+    def error_rate(self) -> Optional[float]:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else None
+
+    def snapshot(self, now: float) -> Dict[str, Any]:
+        error_rate = self.error_rate()
+        return {
+            "base_url": self.client.base_url,
+            "backend": self.client.__class__.__name__,
+            "model": self.client.model,
+            "state": self.state(now),
+            "outstanding": self.outstanding,
+            "latency_ewma_ms": None if self.latency_ewma is None else round(self.latency_ewma * 1000, 1),
+            "latency_p95_ms": round(_quantile(list(self.latencies), 0.95) * 1000, 1) if self.latencies else None,
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": None if error_rate is None else round(error_rate, 3),
+            "consecutive_failures": self.failures,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1),
+            "hedges": self.hedges,
+        }
+
+
+class RouterClient(LLMClient):
+    """
+    Spreads calls over several backend clients (any mix of Ollama and LM Studio).
+
+    Each call goes to the available endpoint with the fewest outstanding requests, then the lowest
+    recent latency. A per-endpoint circuit breaker opens after max_failures failures in a row, or when
+    at least breaker_error_rate of the last breaker_window calls failed; the endpoint then gets no
+    traffic for eject_seconds (doubling on repeat trips, up to max_eject_seconds) and is re-admitted
+    on probation. A call that fails on one endpoint is retried on the next before the error reaches
+    the caller; when every breaker is open the call fails at once with CircuitOpenError.
+
+    With hedge_quantile > 0 and more than one endpoint, a blocking call that is still running after
+    the endpoint's recent latency at that quantile (at least hedge_min_seconds) is duplicated on
+    another endpoint. The first reply wins and the other request is cancelled.
+    """
+
+    def __init__(
+        self,
+        clients: List[LLMClient],
+        max_failures: int = 3,
+        eject_seconds: float = 15.0,
+        max_eject_seconds: float = 300.0,
+        latency_alpha: float = 0.3,
+        breaker_error_rate: float = 0.5,
+        breaker_window: int = 20,
+        breaker_min_calls: int = 5,
+        hedge_quantile: float = 0.0,
+        hedge_min_seconds: float = 0.25,
+        hedge_min_samples: int = 10,
+        latency_window: int = 100,
+    ):
+        if not clients:
+            raise ValueError("RouterClient needs at least one endpoint.")
+        first = clients[0]
+        super().__init__(
+            base_url=",".join(c.base_url for c in clients),
+            model=first.model,
+            timeout_seconds=first.timeout_seconds,
+            pool_size=first.pool_size,
+        )
+        self.endpoints = [EndpointState(c, latency_window, breaker_window) for c in clients]
+        self.max_failures = max(1, int(max_failures))
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.latency_alpha = latency_alpha
+        self.breaker_error_rate = breaker_error_rate
+        self.breaker_min_calls = max(1, int(breaker_min_calls))
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        self._lock = threading.Lock()
+        self._turn = itertools.count()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _acquire(self, exclude: List[EndpointState]) -> Optional[EndpointState]:
+        # None when every endpoint not yet tried is open or already on probation.
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e not in exclude and e.available(now)]
+            if not candidates:
+                return None
+            # Rotate the starting point so exact ties do not always land on the first endpoint.
+            shift = next(self._turn) % len(candidates)
+            candidates = candidates[shift:] + candidates[:shift]
+            chosen = min(candidates, key=lambda e: (e.outstanding, e.latency_ewma or 0.0))
+            chosen.outstanding += 1
+            chosen.requests += 1
+            if chosen.ejections and chosen.failures:
+                chosen.probing = True
+            return chosen
+
+    def _release(
+        self,
+        endpoint: EndpointState,
+        started: float,
+        error: Optional[BaseException] = None,
+        record: bool = True,
+        cancelled: bool = False,
+    ) -> None:
+        elapsed = time.monotonic() - started
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.probing = False
+            if cancelled:
+                # A cancelled hedge loser took at least this long: not a sample, but routing should see it.
+                # An endpoint with no completed call yet starts from this, or it would look fastest of all.
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = elapsed
+                elif elapsed > endpoint.latency_ewma:
+                    endpoint.latency_ewma += self.latency_alpha * (elapsed - endpoint.latency_ewma)
+            if not record:
+                return
+            if error is None:
+                endpoint.failures = 0
+                endpoint.ejections = 0
+                endpoint.outcomes.append(False)
+                endpoint.latencies.append(elapsed)
+                if endpoint.latency_ewma is None:
+                    endpoint.latency_ewma = elapsed
+                else:
+                    endpoint.latency_ewma += self.latency_alpha * (elapsed - endpoint.latency_ewma)
+                return
+            endpoint.errors += 1
+            if not is_endpoint_failure(error):
+                return
+            endpoint.failures += 1
+            endpoint.outcomes.append(True)
+            error_rate = endpoint.error_rate() or 0.0
+            too_many = (
+                self.breaker_error_rate > 0
+                and len(endpoint.outcomes) >= self.breaker_min_calls
+                and error_rate >= self.breaker_error_rate
+            )
+            # A failed probe (half-open) reopens the breaker straight away.
+            if endpoint.failures >= self.max_failures or too_many or endpoint.ejections:
+                backoff = min(self.max_eject_seconds, self.eject_seconds * (2 ** endpoint.ejections))
+                endpoint.ejections += 1
+                endpoint.ejected_until = time.monotonic() + backoff
+                # The next window starts fresh once the endpoint is back on probation.
+                endpoint.outcomes.clear()
+                BREAKER_TRIPS.inc(endpoint=endpoint.client.base_url)
+
+    def _no_endpoint(self, last_error: Optional[BaseException]) -> BaseException:
+        if last_error is not None:
+            return last_error
+        return CircuitOpenError(f"All backend endpoints are unavailable (circuit open): {self.base_url}")
+
+    def _hedge_delay(self, endpoint: EndpointState) -> Optional[float]:
+        # How long to wait on endpoint before duplicating the call; None when hedging does not apply.
+        if self.hedge_quantile <= 0 or len(self.endpoints) < 2:
+            return None
+        with self._lock:
+            samples = list(endpoint.latencies)
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_seconds, _quantile(samples, self.hedge_quantile))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Both attempts of every concurrent hedged call run here; the caller only waits.
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2 * max(1, self.pool_size) * len(self.endpoints), thread_name_prefix="bbe-hedge"
+                )
+            return self._executor
+
+    def _call(self, endpoint: EndpointState, request: Tuple[Any, ...]) -> ChatResult:
+        started = time.monotonic()
+        try:
+            result = endpoint.client.chat_with_meta(*request)
+        except Exception as exc:
+            self._release(endpoint, started, exc)
+            raise
+        self._release(endpoint, started)
+        return result
+
+    def _streamed_attempt(
+        self, endpoint: EndpointState, request: Tuple[Any, ...], scope: CancelScope
+    ) -> Optional[ChatResult]:
+        # Hedged attempts run under a CancelScope so the loser can be stopped from the winner's side,
+        # even while it still waits on prompt evaluation: cancelling shuts the connection down, which
+        # frees this thread and makes Ollama abort the generation.
+        started = time.monotonic()
+        result: Optional[ChatResult] = None
+        stream = None
+        try:
+            with scope.bind():
+                stream = endpoint.client.stream_chat(*request)
+                while not scope.cancelled:
+                    try:
+                        next(stream)
+                    except StopIteration as stop:
+                        result = stop.value
+                        break
+        except Exception as exc:
+            # Errors caused by the cancellation itself say nothing about the endpoint.
+            self._release(endpoint, started, exc, record=not scope.cancelled, cancelled=scope.cancelled)
+            raise
+        finally:
+            if stream is not None:
+                stream.close()
+        self._release(endpoint, started, record=result is not None, cancelled=result is None)
+        return result
+
+    def _call_hedged(
+        self, primary: EndpointState, delay: float, tried: List[EndpointState], request: Tuple[Any, ...]
+    ) -> ChatResult:
+        pool = self._pool()
+        scopes: Dict[Future, CancelScope] = {}
+
+        def submit(endpoint: EndpointState) -> Future:
+            scope = CancelScope()
+            future = pool.submit(self._streamed_attempt, endpoint, request, scope)
+            scopes[future] = scope
+            return future
+
+        futures: Dict[Future, EndpointState] = {submit(primary): primary}
+        hedge_at: Optional[float] = time.monotonic() + delay
+        hedged = False
+        last_error: Optional[BaseException] = None
+        try:
+            while futures:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                done, _ = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    alternate = self._acquire(tried)
+                    if alternate is not None:
+                        tried.append(alternate)
+                        hedged = True
+                        with self._lock:
+                            alternate.hedges += 1
+                        HEDGED_CALLS.inc(outcome="sent")
+                        futures[submit(alternate)] = alternate
+                    continue
+                for future in done:
+                    endpoint = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        if not is_endpoint_failure(exc):
+                            raise
+                        last_error = exc
+                        continue
+                    if hedged:
+                        HEDGED_CALLS.inc(outcome="won" if endpoint is not primary else "lost")
+                    return result
+            raise self._no_endpoint(last_error)
+        finally:
+            # Only attempts still running are cut; a finished one has already returned its connection.
+            for future in futures:
+                scopes[future].cancel()
+
+    def chat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        request = (messages, temperature, max_tokens, num_ctx, response_format)
+        tried: List[EndpointState] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise self._no_endpoint(last_error)
+            tried.append(endpoint)
+            delay = self._hedge_delay(endpoint)
+            try:
+                if delay is None:
+                    return self._call(endpoint, request)
+                return self._call_hedged(endpoint, delay, tried, request)
+            except Exception as exc:
+                if not is_endpoint_failure(exc):
+                    raise
+                last_error = exc
+
+    async def _aattempt(self, endpoint: EndpointState, request: Tuple[Any, ...]) -> ChatResult:
+        started = time.monotonic()
+        try:
+            result = await endpoint.client.achat_with_meta(*request)
+        except asyncio.CancelledError:
+            # The losing side of a hedge: neither a failure nor a latency sample.
+            self._release(endpoint, started, record=False, cancelled=True)
+            raise
+        except Exception as exc:
+            self._release(endpoint, started, exc)
+            raise
+        self._release(endpoint, started)
+        return result
+
+    async def achat_with_meta(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatResult:
+        # Same routing as chat_with_meta; hedging uses tasks, and cancelling one closes its request.
+        request = (messages, temperature, max_tokens, num_ctx, response_format)
+        tried: List[EndpointState] = []
+        tasks: Dict[asyncio.Task, EndpointState] = {}
+        last_error: Optional[BaseException] = None
+        hedge_at: Optional[float] = None
+        primary: Optional[EndpointState] = None
+        hedged = False
+        try:
+            while True:
+                if not tasks:
+                    primary = self._acquire(tried)
+                    if primary is None:
+                        raise self._no_endpoint(last_error)
+                    tried.append(primary)
+                    hedged = False
+                    tasks[asyncio.ensure_future(self._aattempt(primary, request))] = primary
+                    delay = self._hedge_delay(primary)
+                    hedge_at = None if delay is None else time.monotonic() + delay
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    alternate = self._acquire(tried)
+                    if alternate is not None:
+                        tried.append(alternate)
+                        hedged = True
+                        with self._lock:
+                            alternate.hedges += 1
+                        HEDGED_CALLS.inc(outcome="sent")
+                        tasks[asyncio.ensure_future(self._aattempt(alternate, request))] = alternate
+                    continue
+                for task in done:
+                    endpoint = tasks.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        if hedged:
+                            HEDGED_CALLS.inc(outcome="won" if endpoint is not primary else "lost")
+                        return task.result()
+                    if not is_endpoint_failure(exc):
+                        raise exc
+                    last_error = exc
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        num_ctx: Optional[int] = None,
+        response_format: ResponseFormat = None,
+    ) -> ChatStream:
+        # Fail over only until the first piece has been yielded; after that the caller has partial text.
+        # Streams are not hedged: the caller is already reading from the first endpoint.
+        tried: List[EndpointState] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            endpoint = self._acquire(tried)
+            if endpoint is None:
+                raise self._no_endpoint(last_error)
+            tried.append(endpoint)
+            started = time.monotonic()
+            yielded = False
+            error: Optional[BaseException] = None
+            abandoned = False
+            try:
+                stream = endpoint.client.stream_chat(messages, temperature, max_tokens, num_ctx, response_format)
+                while True:
+                    try:
+                        piece = next(stream)
+                    except StopIteration as stop:
+                        return stop.value
+                    yielded = True
+                    yield piece
+            except GeneratorExit:
+                # Consumer stopped reading: neither a failure nor a latency sample.
+                abandoned = True
+                raise
+            except Exception as exc:
+                error = last_error = exc
+                if yielded or not is_endpoint_failure(exc):
+                    raise
+            finally:
+                self._release(endpoint, started, error, record=not abandoned)
+
+    @property
+    def supports_prefill(self) -> bool:
+        # A continuation may land on any endpoint, so every one of them has to support it.
+        return all(e.client.supports_prefill for e in self.endpoints)
+
+    def model_digest(self) -> Optional[str]:
+        # Cache entries stay valid only while every endpoint serves the same weights.
+        digests = {e.client.model_digest() for e in self.endpoints}
+        if None in digests:
+            return None
+        return "|".join(sorted(digests))
+
+    def endpoint_stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [e.snapshot(now) for e in self.endpoints]
+
+    def metadata(self) -> Dict[str, Any]:
+        meta = super().metadata()
+        meta["endpoints"] = self.endpoint_stats()
+        return meta
+
+
+def parse_endpoints(base_url: str, backend: str, model: str) -> List[Tuple[str, str, str]]:
+    # "http://a:11434, lmstudio=http://b:1234/v1#qwen2.5-7b-instruct" -> [(backend, url, model), ...]
+    out: List[Tuple[str, str, str]] = []
+    for entry in base_url.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        entry_backend = backend
+        name, sep, rest = entry.partition("=")
+        if sep and "://" not in name:
+            entry_backend, entry = name.strip().lower(), rest.strip()
+        url, _, entry_model = entry.partition("#")
+        out.append((entry_backend, url.strip(), entry_model.strip() or model))
+    return out
@@ -0,0 +1,303 @@
+import argparse
+import json
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+from config import load_from_env
+from explain.pipeline import ExplainerPipeline, build_pipeline
+from utils.metrics import REGISTRY
+
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+REQUESTS = REGISTRY.counter(
+    "bbe_server_requests_total", "HTTP requests by endpoint and status.", ("endpoint", "status")
+)
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Draining(Exception):
+    pass
+
+
+class ExplainService:
+    """
+    Runs pipeline requests with at most `slots` in flight and `queue_size` waiting behind them.
+    Anything beyond that is rejected at once (429) instead of piling up behind a busy backend.
+    """
+
+    def __init__(
+        self,
+        pipeline: ExplainerPipeline,
+        slots: int,
+        queue_size: int,
+        temperature: float,
+        max_tokens: int,
+        critique_pass: bool = False,
+        max_batch_items: int = 64,
+    ):
+        self.pipeline = pipeline
+        self.slots = max(1, int(slots))
+        self.queue_size = max(0, int(queue_size))
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.critique_pass = critique_pass
+        # A batch is admitted whole, so it can never be larger than the service can hold at once;
+        # anything bigger is a 400 rather than a 429 that no retry could ever clear.
+        self.max_batch_items = max(1, min(int(max_batch_items), self.slots + self.queue_size))
+        self._slots = threading.Semaphore(self.slots)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # Admitted work units: running plus waiting for a slot.
+        self._admitted = 0
+        self._running = 0
+        self.draining = False
+
+    def _admit(self, units: int) -> None:
+        with self._lock:
+            if self.draining:
+                raise Draining("Server is shutting down.")
+            if self._admitted + units > self.slots + self.queue_size:
+                raise Overloaded("Request queue is full; retry later.")
+            self._admitted += units
+
+    def _release(self, units: int) -> None:
+        with self._lock:
+            self._admitted -= units
+            if self._admitted == 0:
+                self._idle.notify_all()
+
+    def _run_one(self, item: Dict[str, Any], options: Dict[str, Any]) -> Dict[str, Any]:
+        with self._slots:
+            with self._lock:
+                self._running += 1
+            try:
+                result = self.pipeline.run(
+                    question=str(item.get("question", "")).strip(),
+                    context=str(item.get("context", "")),
+                    temperature=float(options.get("temperature", self.temperature)),
+                    max_tokens=int(options.get("max_tokens", self.max_tokens)),
+                    critique_pass=bool(options.get("critique_pass", self.critique_pass)),
+                )
+            finally:
+                with self._lock:
+                    self._running -= 1
+        if not options.get("include_html"):
+            # Highlighted HTML only matters for the Streamlit view.
+            result.pop("highlighted_context", None)
+        return result
+
+    def explain(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        _validate_item(body)
+        _validate_options(body)
+        self._admit(1)
+        try:
+            return self._run_one(body, body)
+        finally:
+            self._release(1)
+
+    def explain_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        items = body.get("items")
+        if not isinstance(items, list) or not items:
+            raise ValueError("'items' must be a non-empty list.")
+        if len(items) > self.max_batch_items:
+            raise ValueError(f"At most {self.max_batch_items} items per batch.")
+        for item in items:
+            _validate_item(item)
+        _validate_options(body)
+        # A batch takes one queue place per item, so it cannot starve single requests behind it.
+        self._admit(len(items))
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.slots, len(items)), thread_name_prefix="bbe-serve") as pool:
+                results = list(pool.map(lambda item: self._run_one(item, body), items))
+        finally:
+            self._release(len(items))
+        return {
+            "results": [
+                {"index": i, "id": item.get("id"), "result": result}
+                for i, (item, result) in enumerate(zip(items, results))
+            ]
+        }
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            running, admitted = self._running, self._admitted
+        return {
+            "status": "draining" if self.draining else "ok",
+            "slots": self.slots,
+            "queue_size": self.queue_size,
+            "running": running,
+            "queued": admitted - running,
+            "backend": self.pipeline.client.metadata(),
+        }
+
+    def drain(self, timeout: float) -> bool:
+        # Stop admitting work and wait for everything already admitted; False if the timeout ran out.
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self.draining = True
+            while self._admitted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+
+# Upper bound for a per-request max_tokens; larger values would only tie up a slot.
+MAX_TOKENS_LIMIT = 32768
+
+
+def _validate_options(options: Dict[str, Any]) -> None:
+    # Per-request overrides; absent keys fall back to the service defaults.
+    if "temperature" in options:
+        value = options["temperature"]
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0.0 <= value <= 2.0:
+            raise ValueError("'temperature' must be a number between 0 and 2.")
+    if "max_tokens" in options:
+        value = options["max_tokens"]
+        if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_TOKENS_LIMIT:
+            raise ValueError(f"'max_tokens' must be an integer between 1 and {MAX_TOKENS_LIMIT}.")
+    for name in ("critique_pass", "include_html"):
+        if name in options and not isinstance(options[name], bool):
+            raise ValueError(f"'{name}' must be true or false.")
+
+
+def _validate_item(item: Any) -> None:
+    if not isinstance(item, dict):
+        raise ValueError("Each request must be a JSON object.")
+    if not str(item.get("question", "")).strip():
+        raise ValueError("'question' is required.")
+    if not isinstance(item.get("context", ""), str):
+        raise ValueError("'context' must be a string.")
+
+
+class ExplainHandler(BaseHTTPRequestHandler):
+    service: ExplainService
+    routes = {"/v1/explain": "explain", "/v1/explain/batch": "explain_batch"}
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/health":
+            health = self.service.health()
+            self._reply("health", 503 if self.service.draining else 200, health)
+        elif path == "/metrics":
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._reply("unknown", 404, {"error": "Not found."})
+
+    def do_POST(self):
+        endpoint = self.routes.get(self.path.split("?", 1)[0])
+        if endpoint is None:
+            self._reply("unknown", 404, {"error": "Not found."})
+            return
+        try:
+            body = self._read_json()
+            status, payload = 200, getattr(self.service, endpoint)(body)
+        except Overloaded as exc:
+            status, payload = 429, {"error": str(exc)}
+        except Draining as exc:
+            status, payload = 503, {"error": str(exc)}
+        except ValueError as exc:
+            status, payload = 400, {"error": str(exc)}
+        except Exception as exc:
+            status, payload = 500, {"error": f"Pipeline error: {exc}"}
+        self._reply(endpoint, status, payload)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            raise ValueError("Request body is required.")
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"Request body is larger than {MAX_BODY_BYTES} bytes.")
+        try:
+            body = json.loads(self.rfile.read(length).decode("utf-8-sig"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise ValueError(f"Invalid JSON body: {exc}") from exc
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return body
+
+    def _reply(self, endpoint: str, status: int, payload: Dict[str, Any]) -> None:
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status in (429, 503):
+            self.send_header("Retry-After", "1" if status == 429 else "5")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per request on stderr, without the default reverse-DNS lookup.
+        print(f"{self.address_string()} {format % args}", file=sys.stderr)
+
+
+def parse_args(cfg, argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve the explainer pipeline over HTTP.")
+    parser.add_argument("--host", default=cfg.server_host)
+    parser.add_argument("--port", type=int, default=cfg.server_port)
+    parser.add_argument("--slots", type=int, default=cfg.parallel_slots, help="Concurrent pipeline runs.")
+    parser.add_argument("--queue-size", type=int, default=cfg.server_queue_size, help="Requests waiting for a slot.")
+    parser.add_argument("--drain-seconds", type=int, default=cfg.server_drain_seconds, help="Shutdown grace period.")
+    return parser.parse_args(argv)
+
+
+def build_server(cfg, args: argparse.Namespace) -> Tuple[ThreadingHTTPServer, ExplainService]:
+    pipeline = build_pipeline(cfg, pool_size=args.slots)
+    service = ExplainService(
+        pipeline,
+        slots=args.slots,
+        queue_size=args.queue_size,
+        temperature=cfg.temperature,
+        max_tokens=cfg.max_tokens,
+        critique_pass=cfg.critique_pass,
+    )
+    handler = type("BoundExplainHandler", (ExplainHandler,), {"service": service})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server, service
+
+
+def main(argv=None) -> int:
+    cfg = load_from_env()
+    args = parse_args(cfg, argv)
+    server, service = build_server(cfg, args)
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # serve_forever runs on its own thread so shutdown() can be called from here after draining.
+    thread = threading.Thread(target=server.serve_forever, name="bbe-server", daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    listening = {"listening": f"http://{host}:{port}", "slots": service.slots, "queue_size": service.queue_size}
+    print(json.dumps(listening), file=sys.stderr)
+
+    stop.wait()
+    drained = service.drain(args.drain_seconds)
+    server.shutdown()
+    server.server_close()
+    print(json.dumps({"stopped": True, "drained": drained}), file=sys.stderr)
+    return 0 if drained else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
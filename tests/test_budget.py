@@ -0,0 +1,112 @@
+import threading
+
+from explain.budget import LoadedWindows, TokenBudget, window_key
+from explain.pipeline import ExplainerPipeline
+from explain.retrieval import MIN_PACK_SPAN_CHARS, pack_context
+from utils.text import CHARS_PER_TOKEN
+
+
+class _Client:
+    def __init__(self, base_url="http://a/", model="m"):
+        self.base_url, self.model = base_url, model
+
+    def metadata(self):
+        return {"base_url": self.base_url, "model": self.model}
+
+
+def _messages(chars):
+    return [{"role": "user", "content": "x" * chars}]
+
+
+def test_num_ctx_is_the_smallest_power_of_two_step_that_fits():
+    budget = TokenBudget(ctx_min=2048, ctx_max=8192, safety_margin=0.0)
+    assert budget.num_ctx(100, 500) == 2048
+    assert budget.num_ctx(2000, 500) == 4096
+    assert budget.num_ctx(5000, 500) == 8192
+    # Never above ctx_max, even when the prompt does not fit.
+    assert budget.num_ctx(20000, 500) == 8192
+    assert not budget.fits(20000, 500)
+
+
+def test_safety_margin_counts_against_the_window():
+    budget = TokenBudget(ctx_min=1024, ctx_max=4096, safety_margin=0.25)
+    assert budget.needed(800, 200) == 1250
+    assert budget.num_ctx(800, 200) == 2048
+
+
+def test_context_chars_leaves_room_for_fixed_prompt_and_generation():
+    budget = TokenBudget(ctx_max=8192, safety_margin=0.0)
+    assert budget.context_chars(192, 1000) == 7000 * CHARS_PER_TOKEN
+    assert budget.context_chars(8000, 1000) == 0
+
+
+def test_loaded_window_only_grows():
+    windows = LoadedWindows()
+    assert windows.current(("u", "m")) is None
+    assert windows.claim(("u", "m"), 4096) == 4096
+    assert windows.claim(("u", "m"), 2048) == 4096
+    assert windows.claim(("u", "m"), 8192) == 8192
+    assert windows.claim(("other", "m"), 2048) == 2048
+
+
+def test_loaded_window_concurrent_claims_keep_the_largest():
+    windows = LoadedWindows()
+    threads = [threading.Thread(target=windows.claim, args=(("u", "m"), size)) for size in (2048, 8192, 4096) * 20]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert windows.current(("u", "m")) == 8192
+
+
+def test_window_key_ignores_wrapper_and_trailing_slash():
+    assert window_key(_Client("http://a/")) == window_key(_Client("http://a")) == ("http://a", "m")
+
+
+def test_pipeline_calls_never_shrink_the_window():
+    pipeline = ExplainerPipeline(_Client(), budget=TokenBudget(2048, 8192), windows=LoadedWindows())
+    big = pipeline._num_ctx(_messages(20000), max_tokens=700)
+    assert pipeline._num_ctx(_messages(10), max_tokens=700) == big == 8192
+
+
+def test_pipeline_sizes_several_calls_by_the_largest():
+    pipeline = ExplainerPipeline(_Client(), budget=TokenBudget(2048, 8192), windows=LoadedWindows())
+    assert pipeline._num_ctx(_messages(10), _messages(12000), max_tokens=700) == 8192
+
+
+def test_no_budget_sends_no_window():
+    assert ExplainerPipeline(_Client())._num_ctx(_messages(10), max_tokens=700) is None
+
+
+def test_pack_context_fits_the_budget_and_prefers_relevant_spans():
+    paragraphs = [f"Paragraph {i} talks about weather and lunch." for i in range(40)]
+    paragraphs[25] = "The deploy failed because the migration timed out."
+    context = "\n\n".join(paragraphs)
+    packed = pack_context(context, "why did the deploy fail", 600, span_chars=200)
+    assert len(packed.prompt_context) <= 600
+    assert "migration timed out" in packed.prompt_context
+    assert all(context[start:end] in packed.prompt_context for start, end in packed.spans)
+
+
+def test_pack_context_returns_none_when_everything_fits():
+    assert pack_context("short context", "q", 1000) is None
+
+
+def test_pack_context_tiny_budget_keeps_the_head_not_one_char_spans():
+    context = "word " * 1000
+    packed = pack_context(context, "word", MIN_PACK_SPAN_CHARS)
+    assert packed.spans == [(0, MIN_PACK_SPAN_CHARS - 40)]
+    assert pack_context(context, "word", 0).spans == []
+
+
+def test_map_reduce_only_when_the_context_overflows_the_budget():
+    pipeline = ExplainerPipeline(_Client(), long_context_chars=16000, budget=TokenBudget(2048, 8192))
+    assert not pipeline._needs_map_reduce("q", "x" * 10000, 700)
+    # Past long_context_chars but still fits one call at ctx_max.
+    assert not pipeline._needs_map_reduce("q", "x" * 20000, 700)
+    assert pipeline._needs_map_reduce("q", "x" * 40000, 700)
+
+
+def test_map_reduce_without_budget_uses_the_character_threshold():
+    assert ExplainerPipeline(_Client(), long_context_chars=16000)._needs_map_reduce("q", "x" * 20000, 700)
+    assert not ExplainerPipeline(_Client(), long_context_chars=0)._needs_map_reduce("q", "x" * 90000, 700)
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from explain.coalesce import Abandoned, SingleFlight, flight_key
+
+
+def _start_leader(flights, key, release, value="result"):
+    started = threading.Event()
+
+    def compute():
+        started.set()
+        release.wait(5)
+        if isinstance(value, BaseException):
+            raise value
+        return value
+
+    out = {}
+
+    def lead():
+        try:
+            out["value"], out["info"] = flights.do(key, compute)
+        except BaseException as exc:
+            out["error"] = exc
+
+    thread = threading.Thread(target=lead)
+    thread.start()
+    assert started.wait(5)
+    return thread, out
+
+
+def test_followers_share_one_computation_and_get_copies():
+    flights = SingleFlight()
+    release = threading.Event()
+    leader, leader_out = _start_leader(flights, "k", release, {"items": [1]})
+    results = []
+    followers = [
+        threading.Thread(target=lambda: results.append(flights.do("k", lambda: pytest.fail("ran twice"))))
+        for _ in range(3)
+    ]
+    for t in followers:
+        t.start()
+    while flights._flights["k"].followers < 3:
+        time.sleep(0.001)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert leader_out["info"] == {"role": "leader", "followers": 3}
+    assert [info["role"] for _, info in results] == ["follower"] * 3
+    values = [value for value, _ in results]
+    assert all(v == {"items": [1]} for v in values)
+    # Each caller owns its result.
+    values[0]["items"].append(2)
+    assert values[1] == {"items": [1]} and leader_out["value"] == {"items": [1]}
+    assert flights.in_flight() == 0
+
+
+def test_leader_error_reaches_followers():
+    flights = SingleFlight()
+    release = threading.Event()
+    leader, leader_out = _start_leader(flights, "k", release, RuntimeError("backend down"))
+    errors = []
+
+    def follow():
+        try:
+            flights.do("k", lambda: "unused")
+        except RuntimeError as exc:
+            errors.append(str(exc))
+
+    follower = threading.Thread(target=follow)
+    follower.start()
+    while flights._flights["k"].followers < 1:
+        time.sleep(0.001)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert errors == ["backend down"]
+    assert isinstance(leader_out["error"], RuntimeError)
+
+
+def test_followers_of_an_abandoned_flight_run_it_themselves():
+    flights = SingleFlight()
+    flight, leader = flights.begin("k")
+    assert leader
+    out = []
+    follower = threading.Thread(target=lambda: out.append(flights.do("k", lambda: "own")))
+    follower.start()
+    while flight.followers < 1:
+        time.sleep(0.001)
+    flights.finish(flight, error=Abandoned())
+    follower.join(5)
+    assert out[0][0] == "own" and out[0][1]["role"] == "leader"
+
+
+def test_different_keys_do_not_wait_for_each_other():
+    flights = SingleFlight()
+    flights.begin("a")
+    assert flights.do("b", lambda: 1) == (1, {"role": "leader", "followers": 0})
+
+
+def test_async_followers_join_a_blocking_leader():
+    flights = SingleFlight()
+    release = threading.Event()
+    leader, leader_out = _start_leader(flights, "k", release)
+
+    async def main():
+        tasks = [asyncio.ensure_future(flights.ado("k", pytest.fail)) for _ in range(20)]
+        while flights._flights["k"].followers < 20:
+            await asyncio.sleep(0.001)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(main())
+    leader.join(5)
+    assert leader_out["info"]["followers"] == 20
+    assert {value for value, _ in results} == {"result"}
+
+
+def test_cancelled_async_leader_abandons_its_flight():
+    flights = SingleFlight()
+
+    async def main():
+        async def slow():
+            await asyncio.sleep(10)
+
+        leader = asyncio.ensure_future(flights.ado("k", slow))
+        await asyncio.sleep(0.01)
+
+        async def fast():
+            return "own"
+
+        follower = asyncio.ensure_future(flights.ado("k", fast))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    value, info = asyncio.run(main())
+    assert value == "own" and info["role"] == "leader"
+
+
+def test_flight_key_ignores_question_whitespace_but_not_context():
+    settings = {"temperature": 0.0}
+    assert flight_key("why  did it\nfail", "ctx", settings) == flight_key("why did it fail", "ctx", settings)
+    assert flight_key("q", "ctx ", settings) != flight_key("q", "ctx", settings)
+    assert flight_key("q", "ctx", {"temperature": 0.2}) != flight_key("q", "ctx", settings)
@@ -0,0 +1,73 @@
+import pytest
+
+from explain.highlight import ContextIndex, _fuzzy_position, first_occurrences
+
+CONTEXT = 'The Deploy failed.  The “migration” timed out\nafter 30s. The deploy failed again.'
+
+
+def test_find_all_exact_case_and_normalized_forms():
+    index = ContextIndex(CONTEXT)
+    quotes = [
+        "The deploy failed",  # exact (second sentence)
+        "the deploy failed.",  # case-insensitive, first occurrence
+        'The "migration" timed out after 30s',  # smart quotes and whitespace run
+        "not in the context",
+    ]
+    spans = index.find_all(quotes)
+    assert CONTEXT[slice(*spans[0])] == "The deploy failed"
+    assert CONTEXT[slice(*spans[1])] == "The Deploy failed."
+    assert CONTEXT[slice(*spans[2])] == "The “migration” timed out\nafter 30s"
+    assert spans[3] == (None, None)
+
+
+def test_find_all_keeps_order_duplicates_and_empty_quotes():
+    index = ContextIndex(CONTEXT)
+    spans = index.find_all(["timed out", "", "timed out", "The"])
+    assert spans[0] == spans[2] == (CONTEXT.index("timed out"), CONTEXT.index("timed out") + 9)
+    assert spans[1] == (None, None)
+    assert spans[3] == (0, 3)
+
+
+def test_find_all_memoizes_and_matches_find():
+    index = ContextIndex(CONTEXT)
+    first = index.find_all(["deploy FAILED again"])
+    assert index.find("deploy FAILED again") == first[0]
+    assert "deploy FAILED again" in index._found
+
+
+def test_find_all_maps_offsets_when_lowering_changes_length():
+    context = "İstanbul office: the Server restarted."
+    index = ContextIndex(context)
+    (span,) = index.find_all(["the server RESTARTED"])
+    assert context[slice(*span)] == "the Server restarted"
+
+
+def test_find_all_with_many_quotes_matches_one_by_one():
+    words = [f"token{i}" for i in range(400)]
+    context = " ".join(words)
+    index = ContextIndex(context)
+    quotes = [f"{words[i]} {words[i + 1]}" for i in range(0, 398, 3)] + ["token5 token7"]
+    spans = index.find_all(quotes)
+    assert spans[:-1] == [(context.index(q), context.index(q) + len(q)) for q in quotes[:-1]]
+    assert spans[-1] == (None, None)
+
+
+def test_first_occurrences_reports_first_hit_per_pattern():
+    assert first_occurrences("abcabc", ["bc", "ca", "zz"]) == {"bc": 1, "ca": 2}
+
+
+def test_fuzzy_budget_hit_is_counted_once_per_search():
+    pytest.importorskip("rapidfuzz")
+    index = ContextIndex(CONTEXT)
+    stats = {}
+    for _ in range(3):
+        _fuzzy_position(index, "the migraton timed out", budget_seconds=-1.0, stats=stats)
+    assert stats["fuzzy_attempts"] == 1
+    assert stats["fuzzy_budget_hits"] == ["the migraton timed out"]
+
+
+def test_fuzzy_match_finds_small_drift():
+    pytest.importorskip("rapidfuzz")
+    index = ContextIndex(CONTEXT)
+    start, end = _fuzzy_position(index, "timed out after 30s. The deploy faild again")
+    assert start is not None and "out\nafter 30s" in CONTEXT[start:end]
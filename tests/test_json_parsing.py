@@ -0,0 +1,169 @@
+import json
+import random
+
+import pytest
+
+from benchmarks.bench_json_extract import make_cases, make_result
+from benchmarks.bench_json_repair import HAND_CASES, MUTATIONS, make_corpus
+from explain.json_repair import repair_json
+from explain.json_scan import JsonObjectScanner, extract_json_object
+from explain.streaming import StreamingResultParser
+
+CORPUS = make_corpus(3)
+EXPECTED_FIXES = {
+    "clean": [],
+    "python_repr": ["single_quotes"],
+    "trailing_commas": ["trailing_commas"],
+    "smart_quotes": ["smart_quotes"],
+    "raw_newlines": ["escaped_control_chars"],
+    "inner_quotes": ["escaped_inner_quotes"],
+    "fenced_trailing_commas": ["trailing_commas"],
+    "truncated_60": ["closed_truncated"],
+    "truncated_85": ["closed_truncated"],
+    "truncated_98": ["closed_truncated"],
+}
+
+
+def _result(seed=0, claims=4):
+    return make_result(random.Random(seed), claims)
+
+
+@pytest.mark.parametrize("name,text", [c for c in CORPUS if c[0] in EXPECTED_FIXES], ids=lambda v: str(v)[:20])
+def test_repair_json_recovers_corpus_entry(name, text):
+    parsed, fixes = repair_json(text)
+    assert "answer" in parsed
+    assert fixes == EXPECTED_FIXES[name]
+
+
+@pytest.mark.parametrize("name", ["clean", "python_repr", "trailing_commas", "smart_quotes", "inner_quotes"])
+def test_repair_json_keeps_values_of_complete_outputs(name):
+    result = _result()
+    body = json.dumps(result, indent=2, ensure_ascii=False)
+    text = repr(result) if name == "python_repr" else MUTATIONS.get(name, lambda t: t)(body)
+    parsed, _ = repair_json(text)
+    assert parsed == result
+
+
+def test_repair_json_truncated_output_keeps_complete_claims():
+    result = _result(claims=6)
+    text = json.dumps(result, indent=2)
+    cut = text.index('"uncertainty"')
+    parsed, fixes = repair_json(text[:cut])
+    assert fixes == ["closed_truncated"]
+    assert parsed["evidence_claims"] == result["evidence_claims"]
+
+
+@pytest.mark.parametrize("cut", range(1, 60))
+def test_repair_json_any_truncation_point_gives_an_object(cut):
+    text = '{"answer": "It \\"stalled\\"", "claims": [{"q": "a, b"}, {"q": "c"}], "n": 12}'
+    parsed, _ = repair_json(text[:cut])
+    assert isinstance(parsed, dict)
+
+
+def test_repair_json_hand_cases():
+    cases = dict(HAND_CASES)
+    assert repair_json(cases["python_dict"]) == (
+        {"answer": "Restart the worker", "confidence": "low", "followups": None, "ok": True},
+        ["python_literals", "single_quotes"],
+    )
+    assert repair_json(cases["key_truncated"])[0] == {"answer": "The cache was cold", "confidence": "medium"}
+    assert repair_json(cases["windows_path"]) == (
+        {"answer": "Check C:\\logs\\app.log for the stack", "confidence": "low"},
+        ["invalid_escapes"],
+    )
+    with pytest.raises(ValueError):
+        repair_json(cases["prose_only"])
+
+
+def test_repair_json_skips_brace_in_preamble():
+    parsed, _ = repair_json('Use the {context} as given: {"answer": "ok", "confidence": "low",}')
+    assert parsed == {"answer": "ok", "confidence": "low"}
+
+
+@pytest.mark.parametrize("name,text", sorted(make_cases().items()))
+def test_scanner_finds_result_in_wrapped_output(name, text):
+    expected = json.loads(make_cases()["clean"])
+    assert extract_json_object(text) == expected
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_scanner_chunked_matches_whole(size):
+    text = make_cases()["brace_preamble"]
+    scanner = JsonObjectScanner()
+    found = None
+    for i in range(0, len(text), size):
+        found = scanner.feed(text[i : i + size]) or found
+    assert found == extract_json_object(text)
+
+
+def test_scanner_split_at_every_point():
+    text = 'pre {"a": "x\\"}{", "b": {"c": [1, 2]}} post'
+    for cut in range(len(text) + 1):
+        scanner = JsonObjectScanner()
+        found = scanner.feed(text[:cut]) or scanner.feed(text[cut:])
+        assert found == {"a": 'x"}{', "b": {"c": [1, 2]}}, cut
+
+
+def test_scanner_bytes_split_inside_multibyte_character():
+    data = json.dumps({"answer": "café — naïve"}, ensure_ascii=False).encode("utf-8")
+    for cut in range(len(data) + 1):
+        scanner = JsonObjectScanner()
+        found = scanner.feed(data[:cut]) or scanner.feed(data[cut:])
+        assert found == {"answer": "café — naïve"}, cut
+
+
+def test_scanner_finish_falls_back_to_nested_object():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('Note { the schema: {"answer": "ok"}') is None
+    assert scanner.finish() == {"answer": "ok"}
+
+
+def test_scanner_finish_raises_without_object():
+    scanner = JsonObjectScanner()
+    scanner.feed("no json here")
+    with pytest.raises(ValueError):
+        scanner.finish()
+
+
+def _stream_events(chunks):
+    parser = StreamingResultParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+
+def test_streaming_parser_reports_fields_and_claims():
+    result = _result(claims=3)
+    events = _stream_events([json.dumps(result)])
+    fields = dict(value for kind, value in events if kind == "field")
+    claims = [value for kind, value in events if kind == "claim"]
+    assert fields["answer"] == result["answer"]
+    assert fields["confidence"] == "medium"
+    assert claims == result["evidence_claims"]
+
+
+def test_streaming_parser_ignores_nested_strings_as_fields():
+    events = _stream_events(['{"assumptions": ["not a field"], "answer": "yes"}'])
+    assert events == [("field", ("answer", "yes"))]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_parser_split_at_every_point(seed):
+    text = json.dumps(
+        {"answer": 'a "quoted" \\ {brace}', "evidence_claims": [{"claim": "c", "quote": "q]}"}], "confidence": "low"},
+        ensure_ascii=False,
+    )
+    expected = _stream_events([text])
+    rng = random.Random(seed)
+    for cut in range(len(text) + 1):
+        second = rng.randint(cut, len(text))
+        assert _stream_events([text[:cut], text[cut:second], text[second:]]) == expected, cut
+
+
+def test_streaming_parser_truncated_stream_reports_only_closed_pieces():
+    result = _result(claims=4)
+    text = json.dumps(result)
+    cut = text.index(json.dumps(result["evidence_claims"][2]))
+    claims = [value for kind, value in _stream_events([text[: cut + 10]]) if kind == "claim"]
+    assert claims == result["evidence_claims"][:2]
@@ -0,0 +1,201 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from benchmarks.fake_ollama import FakeOllama
+from llm import create_client
+from llm.client_base import ChatResult, LLMClient
+from llm.client_ollama import OllamaClient
+from llm.router import CircuitOpenError, RouterClient, parse_endpoints
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class FakeClient(LLMClient):
+    # In-process endpoint: optional delay, then either a failure or its own base_url as the reply.
+    def __init__(self, name, failures=0, error=None, delay=0.0):
+        super().__init__(base_url=f"http://{name}", model="m")
+        self.failures = failures
+        self.error = error or requests.ConnectionError(f"{name} is down")
+        self.delay = delay
+        self.calls = 0
+
+    def chat_with_meta(self, messages, temperature, max_tokens, num_ctx=None, response_format=None):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return ChatResult(self.base_url, done_reason="stop")
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def _call(router):
+    return router.chat_with_meta(MESSAGES, 0.0, 10).text
+
+
+def test_exact_ties_rotate_between_endpoints():
+    router = RouterClient([FakeClient("a"), FakeClient("b")])
+    picked = []
+    for _ in range(4):
+        endpoint = router._acquire([])
+        picked.append(endpoint.client.base_url)
+        router._release(endpoint, time.monotonic(), record=False)
+    assert picked.count("http://a") == picked.count("http://b") == 2
+
+
+def test_busy_endpoint_is_skipped():
+    a, b = FakeClient("a"), FakeClient("b")
+    router = RouterClient([a, b])
+    router.endpoints[0].outstanding = 2
+    assert {_call(router) for _ in range(4)} == {"http://b"}
+
+
+def test_faster_endpoint_wins_ties_on_outstanding():
+    a, b = FakeClient("a"), FakeClient("b")
+    router = RouterClient([a, b])
+    router.endpoints[0].latency_ewma = 2.0
+    router.endpoints[1].latency_ewma = 0.5
+    assert {_call(router) for _ in range(4)} == {"http://b"}
+
+
+def test_concurrent_calls_spread_by_outstanding():
+    clients = [FakeClient(name, delay=0.05) for name in "abc"]
+    router = RouterClient(clients)
+    threads = [threading.Thread(target=_call, args=(router,)) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert [c.calls for c in clients] == [2, 2, 2]
+    assert all(e.outstanding == 0 for e in router.endpoints)
+
+
+def test_failed_call_is_retried_on_the_next_endpoint():
+    a, b = FakeClient("a", failures=1), FakeClient("b")
+    router = RouterClient([a, b])
+    router.endpoints[1].outstanding = 1
+    assert _call(router) == "http://b"
+    assert a.calls == b.calls == 1
+    assert [e["errors"] for e in router.endpoint_stats()] == [1, 0]
+
+
+def test_client_error_is_not_retried_or_counted_against_the_endpoint():
+    a, b = FakeClient("a", failures=1, error=_http_error(400)), FakeClient("b", failures=1, error=_http_error(400))
+    router = RouterClient([a, b])
+    with pytest.raises(requests.HTTPError):
+        _call(router)
+    assert a.calls + b.calls == 1
+    assert all(e.failures == 0 for e in router.endpoints)
+
+
+def test_last_error_is_raised_when_every_endpoint_fails():
+    router = RouterClient([FakeClient("a", failures=5), FakeClient("b", failures=5)])
+    with pytest.raises(requests.ConnectionError):
+        _call(router)
+
+
+def test_parse_endpoints_mixes_backends_and_models():
+    assert parse_endpoints("http://a:11434, lmstudio=http://b:1234/v1#qwen", "ollama", "llama") == [
+        ("ollama", "http://a:11434", "llama"),
+        ("lmstudio", "http://b:1234/v1", "qwen"),
+    ]
+
+
+def test_breaker_opens_after_consecutive_failures():
+    a, b = FakeClient("a", failures=3), FakeClient("b")
+    router = RouterClient([a, b], max_failures=3, eject_seconds=60)
+    router.endpoints[1].outstanding = 5
+    for _ in range(3):
+        _call(router)
+    assert router.endpoint_stats()[0]["state"] == "open"
+    router.endpoints[1].outstanding = 0
+    calls = a.calls
+    for _ in range(3):
+        assert _call(router) == "http://b"
+    assert a.calls == calls
+
+
+def test_breaker_opens_on_error_rate():
+    a = FakeClient("a")
+    router = RouterClient([a, FakeClient("b")], max_failures=10, breaker_error_rate=0.5, breaker_min_calls=4)
+    endpoint = router.endpoints[0]
+    for error in (None, ConnectionError(), None, ConnectionError()):
+        endpoint.outstanding += 1
+        router._release(endpoint, time.monotonic(), error)
+    assert endpoint.state(time.monotonic()) == "open"
+
+
+def test_ejected_endpoint_is_probed_one_call_at_a_time():
+    a = FakeClient("a", failures=1)
+    router = RouterClient([a, FakeClient("b")], max_failures=1, eject_seconds=60)
+    endpoint = router.endpoints[0]
+    endpoint.outstanding += 1
+    router._release(endpoint, time.monotonic(), ConnectionError())
+    endpoint.ejected_until = 0.0
+    assert endpoint.state(time.monotonic()) == "half_open"
+    assert router._acquire([router.endpoints[1]]) is endpoint
+    assert router._acquire([router.endpoints[1]]) is None
+    router._release(endpoint, time.monotonic())
+    assert endpoint.state(time.monotonic()) == "closed"
+
+
+def test_failed_probe_reopens_with_longer_ejection():
+    router = RouterClient([FakeClient("a"), FakeClient("b")], max_failures=1, eject_seconds=10)
+    endpoint = router.endpoints[0]
+    for _ in range(2):
+        endpoint.ejected_until = 0.0
+        endpoint.outstanding += 1
+        router._release(endpoint, time.monotonic(), ConnectionError())
+    assert 15 < endpoint.ejected_until - time.monotonic() <= 20
+
+
+def test_all_endpoints_open_fails_fast():
+    router = RouterClient([FakeClient("a"), FakeClient("b")])
+    for endpoint in router.endpoints:
+        endpoint.ejected_until = time.monotonic() + 60
+    with pytest.raises(CircuitOpenError):
+        _call(router)
+
+
+def test_single_endpoint_is_not_wrapped_in_a_breaker():
+    client = create_client("ollama", "http://127.0.0.1:9", "m", breaker_error_rate=0.5)
+    assert isinstance(client, OllamaClient)
+    routed = create_client("ollama", "http://127.0.0.1:9, http://127.0.0.1:10", "m", breaker_error_rate=0.5)
+    assert isinstance(routed, RouterClient)
+
+
+@pytest.fixture
+def slow_and_fast_ollama():
+    slow, fast = FakeOllama(latency_ms=3000), FakeOllama(latency_ms=20)
+    clients = [OllamaClient(slow.start(), "fake:latest"), OllamaClient(fast.start(), "fake:latest")]
+    yield clients
+    slow.stop()
+    fast.stop()
+
+
+def test_hedge_winner_cancels_the_slow_loser(slow_and_fast_ollama):
+    router = RouterClient(slow_and_fast_ollama, hedge_quantile=0.95, hedge_min_seconds=0.1, hedge_min_samples=1)
+    slow, fast = router.endpoints
+    for endpoint in router.endpoints:
+        endpoint.latencies.append(0.1)
+    # Send the primary to the slow endpoint; it has never completed a call.
+    fast.latency_ewma = 0.5
+    started = time.monotonic()
+    result = router.chat_with_meta(MESSAGES, 0.0, 50)
+    assert result.text and time.monotonic() - started < 2.0
+    deadline = time.monotonic() + 1.0
+    while slow.outstanding and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # The loser was cut while still in prompt evaluation, and its cancelled time seeds its latency.
+    assert slow.outstanding == 0
+    assert slow.latency_ewma is not None and slow.latency_ewma >= 0.1
+    assert slow.errors == 0 and fast.hedges == 1
@@ -0,0 +1,172 @@
+import http.client
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from server import Draining, ExplainHandler, ExplainService, Overloaded
+
+
+class _Client:
+    def metadata(self):
+        return {"backend": "fake"}
+
+
+class _Pipeline:
+    """Blocks every run until `release` is set so tests can hold slots open."""
+
+    def __init__(self):
+        self.client = _Client()
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.calls = []
+
+    def run(self, question, context, temperature, max_tokens, critique_pass):
+        self.calls.append({"question": question, "temperature": temperature, "max_tokens": max_tokens})
+        self.started.release()
+        assert self.release.wait(5)
+        return {"answer": question, "highlighted_context": "<mark/>"}
+
+
+def _service(slots=1, queue_size=1, **kwargs):
+    return ExplainService(_Pipeline(), slots=slots, queue_size=queue_size, temperature=0.2, max_tokens=256, **kwargs)
+
+
+def _hold(service, count):
+    # Admit `count` single requests that stay in flight until the pipeline is released.
+    threads = [
+        threading.Thread(target=service.explain, args=({"question": f"q{i}", "context": "c"},)) for i in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def _wait_admitted(service, count):
+    for _ in range(500):
+        with service._lock:
+            if service._admitted == count:
+                return
+        threading.Event().wait(0.01)
+    pytest.fail(f"never reached {count} admitted requests")
+
+
+def test_requests_beyond_slots_and_queue_are_overloaded():
+    service = _service(slots=1, queue_size=1)
+    threads = _hold(service, 2)
+    _wait_admitted(service, 2)
+    health = service.health()
+    assert (health["running"], health["queued"]) == (1, 1)
+    with pytest.raises(Overloaded):
+        service.explain({"question": "q", "context": "c"})
+    service.pipeline.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert service.health()["running"] == 0
+    assert service.explain({"question": "again", "context": "c"})["answer"] == "again"
+
+
+def test_batch_counts_one_queue_place_per_item():
+    service = _service(slots=2, queue_size=2)
+    threads = _hold(service, 2)
+    _wait_admitted(service, 2)
+    with pytest.raises(Overloaded):
+        service.explain_batch({"items": [{"question": "a"}, {"question": "b"}, {"question": "c"}]})
+    service.pipeline.release.set()
+    for thread in threads:
+        thread.join(5)
+    out = service.explain_batch({"items": [{"question": "a", "id": "x"}, {"question": "b"}]})
+    assert [(r["index"], r["id"], r["result"]["answer"]) for r in out["results"]] == [(0, "x", "a"), (1, None, "b")]
+
+
+def test_batch_larger_than_capacity_is_a_client_error():
+    service = _service(slots=1, queue_size=2, max_batch_items=64)
+    assert service.max_batch_items == 3
+    with pytest.raises(ValueError, match="At most 3 items"):
+        service.explain_batch({"items": [{"question": "q"}] * 4})
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        ({"temperature": None}, "temperature"),
+        ({"temperature": True}, "temperature"),
+        ({"temperature": 3}, "temperature"),
+        ({"max_tokens": 0}, "max_tokens"),
+        ({"max_tokens": 1.5}, "max_tokens"),
+        ({"max_tokens": 10**9}, "max_tokens"),
+        ({"critique_pass": "false"}, "critique_pass"),
+        ({"include_html": 1}, "include_html"),
+    ],
+)
+def test_invalid_options_are_rejected_before_admission(options, message):
+    service = _service()
+    with pytest.raises(ValueError, match=message):
+        service.explain({"question": "q", "context": "c", **options})
+    with pytest.raises(ValueError, match=message):
+        service.explain_batch({"items": [{"question": "q"}], **options})
+    assert service.pipeline.calls == []
+    assert service.health()["queued"] == 0
+
+
+def test_options_override_defaults_and_html_is_dropped_unless_asked():
+    service = _service()
+    service.pipeline.release.set()
+    result = service.explain({"question": "q", "context": "c", "temperature": 0, "max_tokens": 64})
+    assert "highlighted_context" not in result
+    assert service.pipeline.calls[-1] == {"question": "q", "temperature": 0.0, "max_tokens": 64}
+    assert "highlighted_context" in service.explain({"question": "q", "include_html": True})
+
+
+def test_drain_waits_for_admitted_work_then_refuses_new_work():
+    service = _service(slots=1, queue_size=0)
+    threads = _hold(service, 1)
+    _wait_admitted(service, 1)
+    assert service.drain(0.05) is False
+    assert service.health()["status"] == "draining"
+    with pytest.raises(Draining):
+        service.explain({"question": "q", "context": "c"})
+    service.pipeline.release.set()
+    assert service.drain(5) is True
+    for thread in threads:
+        thread.join(5)
+
+
+@pytest.fixture
+def http_server():
+    service = _service(slots=1, queue_size=0)
+    handler = type("TestHandler", (ExplainHandler,), {"service": service, "log_message": lambda *args: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, service
+    service.pipeline.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, path, body):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=5)
+    conn.request("POST", path, body=json.dumps(body), headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    payload = json.loads(response.read())
+    conn.close()
+    return response.status, response.getheader("Retry-After"), payload
+
+
+def test_http_maps_overload_to_429_with_retry_after(http_server):
+    server, service = http_server
+    threads = _hold(service, 1)
+    _wait_admitted(service, 1)
+    status, retry_after, payload = _post(server, "/v1/explain", {"question": "q", "context": "c"})
+    assert (status, retry_after) == (429, "1")
+    assert "retry later" in payload["error"]
+    status, _, payload = _post(server, "/v1/explain", {"question": "q", "temperature": None})
+    assert status == 400 and "temperature" in payload["error"]
+    service.pipeline.release.set()
+    for thread in threads:
+        thread.join(5)
+    status, _, payload = _post(server, "/v1/explain", {"question": "q", "context": "c"})
+    assert (status, payload["answer"]) == (200, "q")
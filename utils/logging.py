@@ -1,5 +1,5 @@
 ﻿from datetime import datetime, timezone
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 
 def build_trace_log(
@@ -8,9 +8,14 @@ def build_trace_log(
     max_tokens: int,
     steps: List[str],
     raw_preview: str = "",
+    verification: Optional[Dict[str, Any]] = None,
+    retrieval: Optional[Dict[str, Any]] = None,
+    budget: Optional[Dict[str, Any]] = None,
+    timings: Optional[Dict[str, Any]] = None,
+    llm_calls: Optional[List[Dict[str, Any]]] = None,
 ) -> Dict[str, Any]:
     # Keep a small in-memory trace to explain how the answer was generated.
-    return {
+    trace = {
         "timestamp_utc": datetime.now(timezone.utc).isoformat(),
         "model_name": backend_meta.get("model"),
         "backend": backend_meta.get("client"),
@@ -19,4 +24,46 @@ def build_trace_log(
         "max_tokens": max_tokens,
         "steps_run": steps,
         "raw_output_preview": raw_preview,
-    }
+    }
+    if backend_meta.get("cache") is not None:
+        # Cumulative hit/miss counters of the shared response cache.
+        trace["cache"] = backend_meta["cache"]
+    if verification:
+        # Fuzzy verification work, including quotes that ran out of their time budget.
+        trace["verification"] = verification
+    if retrieval:
+        # How much of the context the BM25 pre-filter kept, and the estimated prompt tokens it saved.
+        trace["retrieval"] = retrieval
+    if budget:
+        # Context window chosen per call, and any context dropped to fit it.
+        trace["budget"] = budget
+    if timings:
+        # Wall seconds per pipeline stage (monotonic clock) and for the whole run.
+        trace["timings"] = timings
+    if llm_calls:
+        # One entry per model call: server durations, token counts and tokens/sec.
+        trace["llm_calls"] = llm_calls
+    return trace
+
+
+def build_batch_summary(
+    backend_meta: Dict[str, Any],
+    items: int,
+    elapsed_seconds: float,
+    workers: int,
+    low_confidence: int = 0,
+) -> Dict[str, Any]:
+    # Aggregate throughput for a headless batch run.
+    elapsed = max(elapsed_seconds, 1e-9)
+    return {
+        "timestamp_utc": datetime.now(timezone.utc).isoformat(),
+        "model_name": backend_meta.get("model"),
+        "backend": backend_meta.get("client"),
+        "base_url": backend_meta.get("base_url"),
+        "workers": workers,
+        "items": items,
+        "low_confidence": low_confidence,
+        "elapsed_seconds": round(elapsed_seconds, 3),
+        "items_per_second": round(items / elapsed, 3),
+        "seconds_per_item": round(elapsed / items, 3) if items else None,
+    }
@@ -0,0 +1,214 @@
+﻿from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import bisect
+import threading
+
+# Latency buckets in seconds: sub-second cache hits up to multi-minute generations on CPU.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (non-cumulative, last slot is +Inf), sum, count].
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, [list(s[0]), s[1], s[2]]) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                labels = _label_text(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    # Process-wide counters and histograms rendered in the Prometheus text exposition format.
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def _register(self, metric: Any) -> Any:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+PIPELINE_RUNS = REGISTRY.counter(
+    "bbe_pipeline_runs_total", "Pipeline runs by flow and final confidence.", ("mode", "confidence")
+)
+PIPELINE_SECONDS = REGISTRY.histogram("bbe_pipeline_duration_seconds", "Wall time of one pipeline run.", ("mode",))
+LLM_CALLS = REGISTRY.counter(
+    "bbe_llm_calls_total", "Model calls by kind and outcome (ok, truncated, error).", ("kind", "outcome")
+)
+LLM_SECONDS = REGISTRY.histogram("bbe_llm_call_duration_seconds", "Client-side latency of one model call.", ("kind",))
+LLM_TOKENS = REGISTRY.counter(
+    "bbe_llm_tokens_total", "Tokens reported by the backend, by call kind and direction.", ("kind", "direction")
+)
+JSON_REPAIRS = REGISTRY.counter(
+    "bbe_json_repairs_total", "Outputs that needed repair, by method (local, llm).", ("method",)
+)
+EVIDENCE_CLAIMS = REGISTRY.counter(
+    "bbe_evidence_claims_total", "Evidence claims checked against the context.", ("verified",)
+)
+COALESCED_RUNS = REGISTRY.counter(
+    "bbe_coalesced_runs_total", "Coalesced pipeline runs by role (leader computed, follower shared).", ("role",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "bbe_cache_lookups_total", "Response cache lookups by result (memory_hit, disk_hit, miss).", ("result",)
+)
+HEDGED_CALLS = REGISTRY.counter(
+    "bbe_llm_hedged_calls_total", "Hedged duplicate calls by outcome (sent, won, lost).", ("outcome",)
+)
+BREAKER_TRIPS = REGISTRY.counter(
+    "bbe_backend_breaker_trips_total", "Times an endpoint's circuit breaker opened.", ("endpoint",)
+)
+
+
+def observe_llm_call(kind: str, seconds: float, result: Any = None, error: bool = False) -> None:
+    # result is a ChatResult; its token counts are added when the backend reported them.
+    if error or result is None:
+        LLM_CALLS.inc(kind=kind, outcome="error")
+        return
+    LLM_CALLS.inc(kind=kind, outcome="truncated" if result.truncated else "ok")
+    LLM_SECONDS.observe(seconds, kind=kind)
+    if result.prompt_eval_count:
+        LLM_TOKENS.inc(result.prompt_eval_count, kind=kind, direction="in")
+    if result.eval_count:
+        LLM_TOKENS.inc(result.eval_count, kind=kind, direction="out")
+
+
+def observe_pipeline_run(mode: str, seconds: float, result: Dict[str, Any], steps: List[str]) -> None:
+    PIPELINE_RUNS.inc(mode=mode, confidence=result.get("confidence", "low"))
+    PIPELINE_SECONDS.observe(seconds, mode=mode)
+    if "llm_json_repair_call" in steps:
+        JSON_REPAIRS.inc(method="llm")
+    if any(step.startswith("local_json_repair:") for step in steps):
+        JSON_REPAIRS.inc(method="local")
+    claims = result.get("evidence_claims", [])
+    verified = sum(1 for claim in claims if claim.get("verified"))
+    if verified:
+        EVIDENCE_CLAIMS.inc(verified, verified="true")
+    if len(claims) - verified:
+        EVIDENCE_CLAIMS.inc(len(claims) - verified, verified="false")
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would otherwise flood stderr.
+        pass
+
+
+_servers: Dict[Tuple[str, int], ThreadingHTTPServer] = {}
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    # Serve /metrics from a daemon thread; one server per address, so Streamlit reruns reuse it.
+    if port <= 0:
+        return None
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="bbe-metrics", daemon=True).start()
+            _servers[(host, port)] = server
+        return server
@@ -1,20 +1,34 @@
-﻿from typing import List
+﻿from typing import List, Tuple
 
 
-def chunk_text(text: str, max_chars: int = 4000, overlap: int = 200) -> List[str]:
-    # Split long text into overlapping chunks to avoid cutting important context hard.
+def chunk_spans(text: str, max_chars: int = 4000, overlap: int = 200) -> List[Tuple[int, int]]:
+    # (start, end) offsets of overlapping chunks, so callers can map chunk positions back to text.
     if not text:
         return []
     if max_chars <= 0:
-        return [text]
+        return [(0, len(text))]
 
-    chunks = []
+    spans = []
     i = 0
     n = len(text)
     while i < n:
         j = min(i + max_chars, n)
-        chunks.append(text[i:j])
+        spans.append((i, j))
         if j == n:
             break
-        i = max(0, j - overlap)
-    return chunks
+        i = max(i + 1, j - overlap)
+    return spans
+
+
+def chunk_text(text: str, max_chars: int = 4000, overlap: int = 200) -> List[str]:
+    # Split long text into overlapping chunks to avoid cutting important context hard.
+    return [text[start:end] for start, end in chunk_spans(text, max_chars, overlap)]
+
+
+# Rough average for English-like text with Llama-style tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    # Token estimate without loading a tokenizer.
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,22 @@
+﻿from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+import time
+
+
+class StageTimer:
+    # Wall time per pipeline stage on the monotonic clock. A stage wrapped around a flow's `yield`
+    # covers the model call the driver made for it.
+    def __init__(self):
+        self.started = time.monotonic()
+        self.stages: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.stages.append({"stage": name, "seconds": round(time.monotonic() - start, 4)})
+
+    def report(self) -> Dict[str, Any]:
+        return {"stages": list(self.stages), "total_seconds": round(time.monotonic() - self.started, 4)}